@@ -0,0 +1,266 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# This software is under a BSD license.  See LICENSE.txt for details.
+
+"""Read-only access to .dtbin files from asyncio code.  This requires
+Python 3.7 or later.
+
+DTDataFile does blocking reads, which stall the event loop of a server that
+handles many requests at once.  DTAsyncDataFile runs those reads on a
+thread pool shared by every file, and keeps a pool of open DTDataFile
+objects so each request doesn't open the file and read its index again.
+
+"""
+
+__all__ = ["DTAsyncDataFile", "set_max_open_files"]
+
+import os
+import asyncio
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from datatank_py.DTDataFile import DTDataFile
+
+# maximum number of DTDataFile objects kept open; see set_max_open_files
+_MAX_OPEN_FILES = 256
+
+# absolute path --> _DTPooledFile, least recently used first
+_OPEN_FILES = OrderedDict()
+_OPEN_FILES_LOCK = threading.Lock()
+
+# all reads are done on this, so the number of threads is bounded
+_EXECUTOR = None
+_EXECUTOR_LOCK = threading.Lock()
+
+class _DTPooledFile(object):
+    """An open DTDataFile shared by every DTAsyncDataFile for its path."""
+
+    def __init__(self, datafile):
+
+        super(_DTPooledFile, self).__init__()
+        self.datafile = datafile
+        # held while using the DTDataFile, since its reads move the file position
+        self.condition = threading.Condition()
+        # number of positioned reads in progress, which only need the file descriptor
+        self.positioned_reads = 0
+
+    def close(self):
+        """Close the DTDataFile once nothing is reading it"""
+        with self.condition:
+            while self.positioned_reads > 0:
+                self.condition.wait()
+            self.datafile.close()
+
+def _shared_executor():
+    """:returns: the ThreadPoolExecutor used for reading files"""
+
+    global _EXECUTOR
+    with _EXECUTOR_LOCK:
+        if _EXECUTOR is None:
+            _EXECUTOR = ThreadPoolExecutor(max_workers=min(32, (os.cpu_count() or 1) + 4))
+        return _EXECUTOR
+
+def set_max_open_files(max_open_files):
+    """Set the number of files kept open for reuse by DTAsyncDataFile.
+
+    :param max_open_files: maximum number of open file descriptors
+
+    The least recently used files are closed when the limit is exceeded.
+
+    """
+
+    global _MAX_OPEN_FILES
+    assert max_open_files > 0, "at least one file must be kept open"
+    _MAX_OPEN_FILES = max_open_files
+    _close_excess_files()
+
+def _close_excess_files():
+    """Close the least recently used files until the pool is under its limit"""
+
+    evicted = []
+    with _OPEN_FILES_LOCK:
+        while len(_OPEN_FILES) > _MAX_OPEN_FILES:
+            evicted.append(_OPEN_FILES.popitem(last=False)[1])
+    # a reader may still be using one of these, so wait for it to finish
+    for pooled_file in evicted:
+        pooled_file.close()
+
+def _open_file(file_path):
+    """Get a pooled DTDataFile, opening it if needed.
+
+    :param file_path: absolute path to a .dtbin file
+    :returns: a _DTPooledFile; its condition must be held while using the DTDataFile
+
+    This does blocking I/O, so it must be called on the executor.
+
+    """
+
+    with _OPEN_FILES_LOCK:
+        entry = _OPEN_FILES.get(file_path)
+        if entry is not None:
+            _OPEN_FILES.move_to_end(file_path)
+            return entry
+
+    # reading the index may take a while, so don't hold up other files
+    datafile = DTDataFile(file_path, readonly=True)
+    with _OPEN_FILES_LOCK:
+        entry = _OPEN_FILES.get(file_path)
+        if entry is None:
+            entry = _DTPooledFile(datafile)
+            _OPEN_FILES[file_path] = entry
+            datafile = None
+
+    # another thread opened it first
+    if datafile is not None:
+        datafile.close()
+    _close_excess_files()
+    return entry
+
+def _read_slice(fd, location, start, stop):
+    """Read rows start:stop of an array variable with os.pread.  See DTAsyncDataFile.read_slice.
+
+    :param fd: file descriptor of the .dtbin file
+    :param location: tuple from DTDataFile._array_location
+    :param start: first row
+    :param stop: end row, exclusive
+    :returns: numpy array, in native byte order
+
+    """
+
+    (data_start, data_type, shape) = location
+    shape = tuple([length for length in shape if length != 1])
+    assert len(shape) > 0, "cannot slice a scalar"
+
+    (start, stop, step) = slice(start, stop).indices(shape[0])
+    stop = max(start, stop)
+    row_size = int(np.prod(shape[1:])) * data_type.itemsize
+    data = _pread(fd, (stop - start) * row_size, data_start + start * row_size)
+    values = np.frombuffer(data, dtype=data_type).reshape((stop - start,) + shape[1:])
+    # values from a file in the other byte order are returned in native order
+    if not data_type.isnative:
+        values = values.astype(data_type.newbyteorder("="))
+    return values
+
+def _pread(fd, byte_count, offset):
+    """Read byte_count bytes at offset, without using the file position"""
+
+    chunks = []
+    while byte_count > 0:
+        chunk = os.pread(fd, byte_count, offset)
+        assert len(chunk), "unable to read all data"
+        chunks.append(chunk)
+        byte_count -= len(chunk)
+        offset += len(chunk)
+    return b"".join(chunks)
+
+class DTAsyncDataFile(object):
+    """Read-only .dtbin file for use with asyncio.
+
+    Each method runs a blocking read on a thread pool shared by all files,
+    and returns an awaitable.  Creating an instance doesn't open anything,
+    and instances for the same path share an open DTDataFile, so it's fine
+    to create one per request:
+
+    >>> async def handle_request(path, name, start, stop):
+    ...     f = DTAsyncDataFile(path)
+    ...     if name in await f.variable_names():
+    ...         return await f.read_slice(name, start, stop)
+
+    Iteration is also supported:
+
+    >>> async for name in DTAsyncDataFile("Output.dtbin"):
+    ...     print(name)
+
+    Up to 256 files are kept open by default; see :func:`set_max_open_files`.
+    The files are assumed not to change while they're open, aside from new
+    variables appended at the end.
+
+    """
+
+    def __init__(self, file_path):
+        """
+        :param file_path: absolute or relative path
+        """
+
+        super(DTAsyncDataFile, self).__init__()
+        self._file_path = os.path.abspath(file_path)
+
+    def path(self):
+        """:returns: the absolute path to the file"""
+        return self._file_path
+
+    def _locked_call(self, function, *args):
+        """Call function(datafile, *args) with the pooled DTDataFile locked.  Runs on the executor."""
+
+        while True:
+            pooled_file = _open_file(self._file_path)
+            with pooled_file.condition:
+                # closed while we were waiting for the lock
+                if pooled_file.datafile._file is None:
+                    continue
+                return function(pooled_file.datafile, *args)
+
+    def _positioned_read(self, name, start, stop):
+        """Read rows of an array, with the pooled DTDataFile only locked to find them.  Runs on the executor."""
+
+        while True:
+            pooled_file = _open_file(self._file_path)
+            with pooled_file.condition:
+                datafile = pooled_file.datafile
+                if datafile._file is None:
+                    continue
+                location = datafile._array_location(name)
+                assert location is not None, "no such variable %s in %s" % (name, datafile.path())
+                fd = datafile._file.fileno()
+                # the file stays open until this read is done
+                pooled_file.positioned_reads += 1
+            try:
+                return _read_slice(fd, location, start, stop)
+            finally:
+                with pooled_file.condition:
+                    pooled_file.positioned_reads -= 1
+                    pooled_file.condition.notify_all()
+
+    async def _run(self, function, *args):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(_shared_executor(), self._locked_call, function, *args)
+
+    async def variable_names(self):
+        """:returns: list of variable names ordered as in the file"""
+        return await self._run(DTDataFile.ordered_variable_names)
+
+    async def read(self, name):
+        """Read a variable.
+
+        :param name: the variable name
+        :returns: a string, scalar, or numpy array, as from :meth:`datatank_py.DTDataFile.DTDataFile.variable_named`
+
+        """
+        return await self._run(DTDataFile.variable_named, name)
+
+    async def read_slice(self, name, start, stop):
+        """Read part of an array variable.
+
+        :param name: the variable name
+        :param start: first index along the leading axis
+        :param stop: end index along the leading axis, exclusive
+        :returns: numpy array
+
+        This returns the same thing as ``np.squeeze(await f.read(name))[start:stop]``,
+        but only reads those values from disk.  Rows of a 2D array are contiguous
+        in the file, so this is a single positioned read, which other reads of
+        the same file don't have to wait for.  The values are in native byte
+        order, even for a file written in the other byte order.
+
+        """
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(_shared_executor(), self._positioned_read, name, start, stop)
+
+    def __aiter__(self):
+        return self._iterate_names()
+
+    async def _iterate_names(self):
+        for name in await self.variable_names():
+            yield name
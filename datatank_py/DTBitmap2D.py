@@ -23,6 +23,10 @@ class _DTBitmap2D(type):
         
         obj = None
         path_or_image = args[0] if len(args) else None
+        lazy = kwargs.pop("lazy", False)
+        # reduced resolution is only supported by GDAL
+        reduction = dict([(key, kwargs.pop(key)) for key in ("max_size", "overview_level") if key in kwargs])
+        assert not (lazy and reduction), "lazy bitmaps are read at full resolution"
         if path_or_image is None:
             cls = DTBitmap2D
             obj = cls.__new__(cls, *args, **kwargs)
@@ -31,15 +35,15 @@ class _DTBitmap2D(type):
             # a string must be a path, so try GDAL first
             if _is_string(path_or_image):
                 try:
-                    cls = _DTGDALBitmap2D
+                    cls = _DTLazyGDALBitmap2D if lazy else _DTGDALBitmap2D
                     obj = cls.__new__(cls, *args, **kwargs)
-                    obj.__init__(*args, **kwargs)
+                    obj.__init__(*args, **dict(kwargs, **reduction))
                 except Exception as e:
                     sys.stderr.write("Failed to create GDAL representation: %s\n" % (e))
                     obj = None
             
-            # if GDAL failed or we had a PIL image, try PIL
-            if obj == None:
+            # if GDAL failed or we had a PIL image, try PIL, which can't be lazy
+            if obj == None and not lazy:
                 try:
                     cls = _DTPILBitmap2D
                     obj = cls.__new__(cls, *args, **kwargs)
@@ -103,8 +107,32 @@ class DTBitmap2D(object, metaclass=_DTBitmap2D):
         (4, 3, 2) to get a true color image. By default, instantiating an image
         with more than 4 bands will give an error.
 
-        Note that :class:`DTBitmap2D` does not attempt to be lazy at loading data; it
-        will read the entire image into memory as soon as you instantiate it.
+        By default, :class:`DTBitmap2D` reads the entire image into memory as
+        soon as you instantiate it.  Pass ``lazy=True`` with a path to keep
+        the GDAL dataset open instead, and read parts of the image as needed
+        with :meth:`read_window` and :meth:`tiles`.  Writing a lazy bitmap to
+        a DTDataFile reads and writes it a strip at a time, so an image that
+        doesn't fit in memory can still be saved:
+        
+        >>> image = DTBitmap2D("orthophoto.tif", lazy=True)
+        >>> for (x0, y0, tile) in image.tiles():
+        ...     print x0, y0, tile.red.mean()
+        >>> with DTDataFile("ortho.dtbin", truncate=True) as df:
+        ...     df["Image"] = image
+        
+        Accessing a channel attribute such as ``red`` on a lazy bitmap reads
+        the whole channel each time.  Lazy loading requires GDAL.
+        
+        A preview of a large image can be loaded at reduced resolution by
+        passing ``max_size``, the largest width or height in pixels, or
+        ``overview_level``, where 1 is the first overview stored in the file
+        and 0 is full resolution.  GDAL reads from the file's overviews when
+        it has them, so only a fraction of the file is read.  The grid covers
+        the same area as the full image, with larger dx and dy:
+        
+        >>> preview = DTBitmap2D("orthophoto.tif", max_size=2000)
+        
+        These options are ignored if GDAL can't read the image and PIL is used.
         
         """
         super(DTBitmap2D, self).__init__()
@@ -284,14 +312,9 @@ class DTBitmap2D(object, metaclass=_DTBitmap2D):
         if alpha_as_mask:
             assert self.nodata is None, "Attempting to use alpha as mask but image has NODATA values"
             assert self.alpha is not None, "Image does not have an alpha channel"
-            mask_array = self.alpha.astype(np.int8) 
-            #np.zeros(values.shape, dtype=np.int8)
-            #mask_array[np.where(self.alpha != 0)] = 1
-            mask = DTMask(mask_array)
+            mask = DTMask(self.alpha)
         elif self.nodata is not None:
-            mask_array = np.zeros(values.shape, dtype=np.int8)
-            mask_array[np.where(values != self.nodata)] = 1
-            mask = DTMask(mask_array)
+            mask = DTMask.from_condition(values, nodata=self.nodata, nan=False)
         return DTMesh2D(values, grid=self.grid, mask=mask)
         
     def raster_size(self):
@@ -302,11 +325,12 @@ class DTBitmap2D(object, metaclass=_DTBitmap2D):
                 return tuple(reversed(values.shape))
         assert False, "No valid channels to compute raster size"
         
-    def write_geotiff(self, output_path, projection_name=None):
+    def write_geotiff(self, output_path, projection_name=None, creation_options=None):
         """Save a DTBitmap2D as a GeoTIFF file.
         
         :param output_path: a file path; all parent directories must exist
         :param projection_name: the spatial reference system to associate with the image
+        :param creation_options: dictionary of GTiff creation options, such as `{"TILED":"YES", "COMPRESS":"LZW"}`
         
         **Requires GDAL**
 
@@ -316,6 +340,14 @@ class DTBitmap2D(object, metaclass=_DTBitmap2D):
         at `<http://www.gdal.org/ogr/classOGRSpatialReference.html>`_
         for more specific details.
         
+        Any GTiff creation option can be passed, notably TILED, BLOCKXSIZE,
+        BLOCKYSIZE, COMPRESS, PREDICTOR, NUM_THREADS, and BIGTIFF, which is
+        IF_SAFER by default.  Bands are written a strip of blocks at a time,
+        so this doesn't copy the image, and a lazy bitmap is read as it's
+        written.  The NODATA value of the image is saved with each band.
+        
+        >>> bitmap.write_geotiff("Output.tiff", "EPSG:4326", {"TILED":"YES", "COMPRESS":"DEFLATE", "PREDICTOR":2})
+        
         Note that exceptions will be raised if the :class:`DTBitmap2D` is not valid
         (has no data), or if any GDAL functions fail.  This method has only
         been tested with 8-bit images, but gray/rgb/alpha images work as
@@ -323,15 +355,9 @@ class DTBitmap2D(object, metaclass=_DTBitmap2D):
         
         """
         
-        from osgeo import gdal, osr
+        from functools import partial
         from osgeo.gdalconst import GDT_UInt16, GDT_Byte
-        
-        # throw instead of printing to stderr
-        gdal.UseExceptions()
-        osr.UseExceptions()
-                
-        # gdal doesn't like unicode objects...
-        output_path = output_path.encode(sys.getfilesystemencoding())
+        from datatank_py.DTRaster import _write_geotiff
         
         # default to whatever the internal projection is, in case this
         # was originally loaded with GDAL
@@ -339,61 +365,19 @@ class DTBitmap2D(object, metaclass=_DTBitmap2D):
             projection_name = self.projection
         elif self.projection is not None:
             assert self.projection == projection_name, "attempt to assign a different projection to this image"
-            
-        projection_name = projection_name.encode("utf-8")
         
-        band_count = self.channel_count()
-        assert band_count > 0, "No channels to save"
+        channel_names = self._channel_names()
+        assert len(channel_names) > 0, "No channels to save"
+        # same band order that's read from GDAL, so gray comes before alpha
+        if sorted(channel_names) == sorted(_GDAL_CHANNEL_NAMES.get(len(channel_names), ())):
+            channel_names = _GDAL_CHANNEL_NAMES[len(channel_names)]
 
-        (raster_x, raster_y) = self.raster_size()
-
-        # base spatial transform
-        grid = self.grid
-        (xmin, dx, rot1, ymax, rot2, dy) = (0, 0, 0, 0, 0, 0)
-        xmin = grid[0]
-        dx = grid[2]
-        dy = grid[3]
-        ymax = grid[1] + abs(dy) * raster_y
-
-        geotiff = gdal.GetDriverByName("GTiff")
-        
         # only support 8 or 16 bit unsigned images; make the caller scale
         assert self.dtype() in (np.uint8, np.uint16), "Unhandled bit depth %s" % (self.dtype())
         etype = GDT_Byte if self.dtype() == np.uint8 else GDT_UInt16
         
-        dst = geotiff.Create(output_path, raster_x, raster_y, bands=band_count, eType=etype)
-        assert dst, "Unable to create destination dataset at %s" % (output_path)
-
-        # Recall that dx and dy are signed, with positive upwards;
-        # this is bizarre, but http://www.gdal.org/gdal_tutorial.html
-        # shows it also.
-        dst.SetGeoTransform((xmin, dx, rot1, ymax, rot2, -abs(dy)))
-        dst_srs = osr.SpatialReference()
-        
-        # This accepts a variety of inputs, notably EPSG and PROJ.4,
-        # as well as NAD27, NAD83, WGS84, WGS72.
-        dst_srs.SetFromUserInput(projection_name)
-        dst.SetProjection(dst_srs.ExportToWkt())
-            
-        band_index = 1
-        for band_name in DTBitmap2D.CHANNEL_NAMES:
-            
-            values = getattr(self, band_name)
-            
-            if values is not None:
-                
-                band = dst.GetRasterBand(band_index)
-                band_index += 1
-                    
-                values = np.flipud(values)
-                # reverse transforms applied in DTDataFile
-                shape = list(values.shape)
-                shape.reverse()
-                data = values.reshape(shape, order="C").tostring()
-            
-                band.WriteRaster(0, 0, dst.RasterXSize, dst.RasterYSize, data, buf_xsize=dst.RasterXSize, buf_ysize=dst.RasterYSize, buf_type=band.DataType)
-        
-        dst = None
+        bands = [partial(self._read_rows, channel_name) for channel_name in channel_names]
+        _write_geotiff(output_path, self.raster_size(), self.grid, projection_name, etype, bands, creation_options, self.nodata)
         
     def __dt_type__(self):
             return DTBitmap2D.dt_type[0]
@@ -419,6 +403,87 @@ class DTBitmap2D(object, metaclass=_DTBitmap2D):
             
         datafile.write_anonymous(self.grid, name)
         
+    def _channel_names(self):
+        """:returns: names of the channels that have values, ordered as in CHANNEL_NAMES"""
+        return [name for name in DTBitmap2D.CHANNEL_NAMES if getattr(self, name) is not None]
+        
+    def _read_rows(self, channel_name, y0, height):
+        """:returns: rows y0 to y0 + height of a channel, counting from the bottom"""
+        return getattr(self, channel_name)[y0:y0 + height]
+        
+    def _row_blocks(self, channel_name):
+        """:returns: generator of blocks of rows of a channel, from the bottom up"""
+        from datatank_py.DTRaster import _row_blocks
+        return _row_blocks(getattr(self, channel_name))
+        
+    def _write_channels(self, datafile, name, row_blocks):
+        """Write as a 2D Bitmap a block of rows at a time, like :meth:`__dt_write__`.
+        
+        :param datafile: an open DTDataFile instance
+        :param name: the name of the bitmap
+        :param row_blocks: function that returns row blocks of a channel, given its name
+        
+        """
+        
+        image_dtype = self.dtype()
+        suffix = "16" if image_dtype in (np.uint16, np.int16) else ""
+        assert image_dtype not in (np.float64, np.float32), "DataTank does not support floating-point images"
+        
+        # DataTank only supports signed images; viewing as signed preserves the bits, as in __dt_write__
+        write_dtype = {np.dtype(np.uint16):np.dtype(np.int16), np.dtype(np.uint8):np.dtype(np.int8)}.get(image_dtype, image_dtype)
+        (raster_x, raster_y) = self.raster_size()
+        for channel_name in self._channel_names():
+            blocks = (rows.view(write_dtype) for rows in row_blocks(channel_name))
+            datafile.write_anonymous_rows(blocks, (raster_y, raster_x), write_dtype, "_".join((name, channel_name.capitalize() + suffix)))
+            
+        datafile.write_anonymous(self.grid, name)
+        
+    def write_pyramid(self, datafile, name, levels=None, method="mean"):
+        """Write the bitmap at full and reduced resolutions.
+        
+        :param datafile: an open DTDataFile instance
+        :param name: base name of the levels
+        :param levels: number of levels, including full resolution (default is to stop at 256 pixels across)
+        :param method: "mean" to average each 2x2 block of pixels, or "mode" to keep the most common value, for classified images
+        :returns: list of the names written
+        
+        Each level is written as a separate 2D Bitmap named "name_L0",
+        "name_L1", and so on, where each level is decimated 2x from the one
+        before it, as for :meth:`datatank_py.DTMesh2D.DTMesh2D.write_pyramid`,
+        but keeping the origin of the grid, since it's the corner of the image.
+        Channels are decimated separately.  The image is only read once, so a
+        lazy bitmap is streamed to level 0 while level 1 is kept in memory.
+        
+        """
+        
+        from datatank_py.DTRaster import _DTPyramidLevels, _pyramid_level_count, _decimated_grid
+        
+        (raster_x, raster_y) = self.raster_size()
+        levels = _pyramid_level_count((raster_y, raster_x)) if levels is None else levels
+        assert levels >= 1 and levels <= _pyramid_level_count((raster_y, raster_x), min_size=1), "%d levels requested for a %d x %d bitmap" % (levels, raster_x, raster_y)
+        pyramids = {}
+        
+        def level_rows(channel_name):
+            pyramids[channel_name] = _DTPyramidLevels((raster_y, raster_x), self.dtype(), method)
+            return pyramids[channel_name].passing(self._row_blocks(channel_name))
+            
+        names = [name + "_L0"]
+        datafile.write(_DTBitmapRows(self, level_rows if levels > 1 else self._row_blocks), names[0])
+        
+        grid = self.grid
+        channels = dict([(channel_name, pyramid.levels(levels - 1)) for channel_name, pyramid in pyramids.items()])
+        for index in range(levels - 1):
+            level = DTBitmap2D()
+            grid = _decimated_grid(grid, centered=False)
+            level.grid = grid
+            level.nodata = self.nodata
+            level.projection = self.projection
+            for channel_name in channels:
+                setattr(level, channel_name, next(channels[channel_name])[0])
+            names.append("%s_L%d" % (name, index + 1))
+            datafile.write(level, names[-1])
+        return names
+        
     @classmethod
     def from_data_file(self, datafile, name):
         """Create a new instance from a DTDataFile by name.
@@ -442,55 +507,82 @@ class DTBitmap2D(object, metaclass=_DTBitmap2D):
                     setattr(bitmap, channel_name, _squeeze2d(values))
         return bitmap
 
+class _DTBitmapRows(object):
+    """Writes a bitmap as a 2D Bitmap from row blocks of its channels."""
+    def __init__(self, bitmap, row_blocks):
+        super(_DTBitmapRows, self).__init__()
+        self._bitmap = bitmap
+        self._row_blocks = row_blocks
+        
+    def __dt_type__(self):
+        return DTBitmap2D.dt_type[0]
+        
+    def __dt_write__(self, datafile, name):
+        self._bitmap._write_channels(datafile, name, self._row_blocks)
+
+# number of pixels expanded at a time from an indexed image
+_PALETTE_BLOCK_PIXELS = 1 << 20
+
+# approximate number of pixels read at a time by a lazy bitmap
+_TILE_PIXELS = 1 << 22
+
+# bitmap channels for a GDAL dataset, by band count
+_GDAL_CHANNEL_NAMES = { 1:("gray",), 2:("gray", "alpha"), 3:("red", "green", "blue"), 4:("red", "green", "blue", "alpha") }
+
+def _palette_channel_names(color_entries):
+    """:returns: channels of an indexed image, which only has alpha if some entry isn't opaque"""
+    names = ["red", "green", "blue"]
+    if any([entry[3] != 255 for entry in color_entries]):
+        names.append("alpha")
+    return names
+
+def _expand_palette(indexes, color_entries, progress=None, names=None):
+    """Expand an indexed image to RGB or RGBA channels.
+    
+    :param indexes: 2D array of color table indexes
+    :param color_entries: list of (red, green, blue, alpha) tuples for indexes 0, 1, …
+    :param progress: optional :class:`datatank_py.DTProgress.DTProgress`, updated after each block of rows
+    :param names: channels to expand (default is all of them)
+    :returns: dictionary mapping "red", "green", "blue", and "alpha" to uint8 arrays
+    
+    Each channel is looked up in a table of 256 entries, a block of rows at
+    a time, so there's no temporary array for the whole image.  Indexes that
+    aren't in the color table are black.  An alpha channel is only returned
+    if some entry isn't opaque.
+    
+    """
+    
+    # the extra entry is for indexes that aren't in the table
+    lut = np.zeros((257, 4), dtype=np.uint8)
+    lut[:len(color_entries)] = color_entries
+    all_names = _palette_channel_names(color_entries)
+    names = all_names if names is None else [name for name in all_names if name in names]
+    channels = dict([(name, np.empty(indexes.shape, dtype=np.uint8)) for name in names])
+    channel_luts = [np.ascontiguousarray(lut[:, all_names.index(name)]) for name in names]
+    
+    block_rows = max(1, _PALETTE_BLOCK_PIXELS // max(1, indexes.shape[1]))
+    for start in range(0, indexes.shape[0], block_rows):
+        block = indexes[start:start + block_rows]
+        if block.dtype != np.uint8:
+            block = np.where((block >= 0) & (block < len(color_entries)), block, 256)
+        for name, channel_lut in zip(names, channel_luts):
+            np.take(channel_lut, block, out=channels[name][start:start + block_rows])
+        if progress is not None:
+            progress.update_percentage(min(start + block_rows, indexes.shape[0]) / float(indexes.shape[0]))
+            
+    return channels
+
 class _DTGDALBitmap2D(DTBitmap2D):
     """Private subclass that wraps up the GDAL logic."""
-    def __init__(self, image_path, rgba_bands=None):
+    def __init__(self, image_path, rgba_bands=None, max_size=None, overview_level=None):
         
         super(_DTGDALBitmap2D, self).__init__()
         
-        from osgeo import gdal
-        from osgeo.gdalconst import GA_ReadOnly
-                
-        # throw instead of printing to stderr
-        gdal.UseExceptions()
-        
         from datatank_py.DTProgress import DTProgress
-
-        # NB: GDAL craps out if you pass a unicode object as a path
-        image_path = image_path.encode(sys.getfilesystemencoding())
-            
-        dataset = gdal.Open(image_path, GA_ReadOnly)
-        (xmin, dx, rot1, ymax, rot2, dy) = dataset.GetGeoTransform()
-        self.projection = dataset.GetProjectionRef()
         
-        bands = []
-        self.nodata = None
-        if rgba_bands is None or len(rgba_bands) == 0:
-            rgba_bands = range(1, dataset.RasterCount + 1)
-        else:
-            rgba_bands = [int(x) for x in rgba_bands]
-            # should truncate here? how to handle default for a module?
-            
-        channel_count = len(rgba_bands)
-        
-        assert channel_count <= dataset.RasterCount, "Requested %d raster bands from an image that has %d bands" % (channel_count, dataset.RasterCount)
-            
-        for band_index in rgba_bands:
-            try:
-                band = dataset.GetRasterBand(band_index)
-                sys.stderr.write("Read band %d (image has %d bands)\n" % (band_index, dataset.RasterCount))
-            except Exception as e:
-                sys.stderr.write("Failed reading band %d (image has %d bands)\n" % (band_index, dataset.RasterCount))
-                sys.stderr.write("%s\n" % (e))
-                raise e
-            if self.nodata == None:
-                self.nodata = band.GetNoDataValue()
-            if band == None:
-                break
-            bands.append(band)
-            
-        ymin = ymax + dy * dataset.RasterYSize
-        self.grid = (xmin, ymin, dx, abs(dy))
+        (dataset, bands) = self._open_dataset(image_path, rgba_bands)
+        channel_count = len(bands)
+        (width, height) = self._read_size(dataset, bands, max_size, overview_level)
                 
         # Gray + Alpha, RGB, or RGBA
         if channel_count in (2, 3, 4):
@@ -512,7 +604,7 @@ class _DTGDALBitmap2D(DTBitmap2D):
 
             for idx in name_map:
                 band = bands[idx]
-                channel = band.ReadAsArray()
+                channel = band.ReadAsArray(buf_xsize=width, buf_ysize=height)
                 channel = np.flipud(channel)
                 sys.stderr.write("Interpreted band %d as %s\n" % (idx + 1, name_map[idx]))
                 sys.stderr.write("min = %s, max = %s, mean = %s\n" % (np.min(channel), np.max(channel), np.mean(channel)))
@@ -522,7 +614,7 @@ class _DTGDALBitmap2D(DTBitmap2D):
             
             # we only have one band anyway on this path, so see if we have an indexed image,
             band = bands[0]
-            mesh = band.ReadAsArray()
+            mesh = band.ReadAsArray(buf_xsize=width, buf_ysize=height)
 
             mesh = np.flipud(mesh)
             ctab = band.GetRasterColorTable()
@@ -530,32 +622,9 @@ class _DTGDALBitmap2D(DTBitmap2D):
             if ctab is not None:
                                 
                 sys.stderr.write("Interpreted image as indexed RGB\n")
-
-                # indexed images have to be expanded to RGB, and this is pretty slow
-                progress = DTProgress()
-                
-                red = np.zeros(mesh.size, dtype=np.uint8)
-                green = np.zeros(mesh.size, dtype=np.uint8)
-                blue = np.zeros(mesh.size, dtype=np.uint8)
-                
-                # hash lookup is faster than array lookup by index and
-                # faster than calling GetColorEntry for each pixel
-                cmap = {}
-                for color_index in xrange(min(256, ctab.GetCount())):
-                    cmap[int(color_index)] = [np.uint8(x) for x in ctab.GetColorEntry(int(color_index))]
-                
-                for raster_index, color_index in enumerate(mesh.flatten()):
-                    try:
-                        (red[raster_index], green[raster_index], blue[raster_index], ignored) = cmap[int(color_index)]
-                    except Exception as e:
-                        # if not in table, leave as zero
-                        pass
-                    progress.update_percentage(raster_index / float(mesh.size))
-
-                self.red = np.reshape(red, mesh.shape)
-                self.green = np.reshape(green, mesh.shape)
-                self.blue = np.reshape(blue, mesh.shape)
-
+                color_entries = [ctab.GetColorEntry(color_index) for color_index in range(min(256, ctab.GetCount()))]
+                for name, channel in _expand_palette(mesh, color_entries, DTProgress()).items():
+                    setattr(self, name, channel)
                     
             else:
                 # Gray (tested with int16)
@@ -566,6 +635,218 @@ class _DTGDALBitmap2D(DTBitmap2D):
             sys.stderr.write("Unable to decode an image with %d raster bands\n" % (channel_count))
 
         del dataset
+        
+    def _open_dataset(self, image_path, rgba_bands):
+        """Open a GDAL dataset and set the grid, projection, and nodata value.
+        
+        :returns: tuple of (dataset, list of bands to use)
+        
+        """
+        
+        from osgeo import gdal
+        from osgeo.gdalconst import GA_ReadOnly
+                
+        # throw instead of printing to stderr
+        gdal.UseExceptions()
+        
+        # NB: GDAL craps out if you pass a unicode object as a path with
+        # Python 2, but Python 3 bindings only take str
+        if not isinstance(image_path, str):
+            image_path = image_path.encode(sys.getfilesystemencoding())
+            
+        dataset = gdal.Open(image_path, GA_ReadOnly)
+        (xmin, dx, rot1, ymax, rot2, dy) = dataset.GetGeoTransform()
+        self.projection = dataset.GetProjectionRef()
+        
+        bands = []
+        self.nodata = None
+        if rgba_bands is None or len(rgba_bands) == 0:
+            rgba_bands = range(1, dataset.RasterCount + 1)
+        else:
+            rgba_bands = [int(x) for x in rgba_bands]
+            # should truncate here? how to handle default for a module?
+            
+        channel_count = len(rgba_bands)
+        
+        assert channel_count <= dataset.RasterCount, "Requested %d raster bands from an image that has %d bands" % (channel_count, dataset.RasterCount)
+            
+        for band_index in rgba_bands:
+            try:
+                band = dataset.GetRasterBand(band_index)
+                sys.stderr.write("Read band %d (image has %d bands)\n" % (band_index, dataset.RasterCount))
+            except Exception as e:
+                sys.stderr.write("Failed reading band %d (image has %d bands)\n" % (band_index, dataset.RasterCount))
+                sys.stderr.write("%s\n" % (e))
+                raise e
+            if self.nodata == None:
+                self.nodata = band.GetNoDataValue()
+            if band == None:
+                break
+            bands.append(band)
+            
+        ymin = ymax + dy * dataset.RasterYSize
+        self.grid = (xmin, ymin, dx, abs(dy))
+        return (dataset, bands)
+        
+    def _read_size(self, dataset, bands, max_size, overview_level):
+        """Choose the size to read the image at, and scale the grid to match.
+        
+        :returns: tuple of (width, height) in pixels
+        
+        """
+        
+        (raster_x, raster_y) = (dataset.RasterXSize, dataset.RasterYSize)
+        overviews = [bands[0].GetOverview(index) for index in range(bands[0].GetOverviewCount())]
+        if overview_level:
+            assert overview_level <= len(overviews), "Requested overview %d from an image that has %d overviews" % (overview_level, len(overviews))
+            overview = overviews[overview_level - 1]
+            (width, height) = (overview.XSize, overview.YSize)
+        elif max_size is not None and max(raster_x, raster_y) > max_size:
+            # the largest overview that fits is read as-is; otherwise, GDAL
+            # resamples from the closest overview that's larger
+            fitting = [(o.XSize, o.YSize) for o in overviews if max(o.XSize, o.YSize) <= max_size]
+            if len(fitting):
+                (width, height) = max(fitting)
+            else:
+                scale = max_size / float(max(raster_x, raster_y))
+                (width, height) = (max(1, int(round(raster_x * scale))), max(1, int(round(raster_y * scale))))
+        else:
+            return (raster_x, raster_y)
+            
+        sys.stderr.write("Reading %d x %d image at %d x %d\n" % (raster_x, raster_y, width, height))
+        (xmin, ymin, dx, dy) = self.grid
+        self.grid = (xmin, ymin, dx * raster_x / float(width), dy * raster_y / float(height))
+        return (width, height)
+
+class _DTLazyGDALBitmap2D(_DTGDALBitmap2D):
+    """Private subclass that reads from a GDAL dataset as needed."""
+    def __init__(self, image_path, rgba_bands=None):
+        
+        # skip the _DTGDALBitmap2D initializer, which reads everything
+        super(_DTGDALBitmap2D, self).__init__()
+        
+        (self._dataset, bands) = self._open_dataset(image_path, rgba_bands)
+        ctab = bands[0].GetRasterColorTable() if len(bands) == 1 else None
+        if ctab is not None:
+            self._palette = [ctab.GetColorEntry(color_index) for color_index in range(min(256, ctab.GetCount()))]
+            self._channel_bands = [(name, bands[0]) for name in _palette_channel_names(self._palette)]
+        else:
+            assert len(bands) in _GDAL_CHANNEL_NAMES, "Unable to decode an image with %d raster bands" % (len(bands))
+            self._palette = None
+            self._channel_bands = list(zip(_GDAL_CHANNEL_NAMES[len(bands)], bands))
+            
+        # channels are read when accessed; see __getattr__
+        for name, band in self._channel_bands:
+            delattr(self, name)
+            
+    def __getattr__(self, name):
+        # only called for attributes that aren't set, which includes our channels
+        if name in DTBitmap2D.CHANNEL_NAMES and name in [x[0] for x in self.__dict__.get("_channel_bands", ())]:
+            (raster_x, raster_y) = self.raster_size()
+            return self._read_channels(0, 0, raster_x, raster_y, [name])[name]
+        raise AttributeError("%s has no attribute %s" % (self.__class__.__name__, name))
+        
+    def dtype(self):
+        """:returns: a NumPy array datatype :class:`numpy.dtype`"""
+        if self._palette is not None:
+            return np.dtype(np.uint8)
+        from osgeo import gdal_array
+        return np.dtype(gdal_array.GDALTypeCodeToNumericTypeCode(self._channel_bands[0][1].DataType))
+        
+    def channel_count(self):
+        """:returns: number of channels, including data and alpha"""
+        return len(self._channel_bands)
+        
+    def raster_size(self):
+        """:returns: size in pixels, 2-tuple ordered as `(horizontal, vertical)`."""
+        return (self._dataset.RasterXSize, self._dataset.RasterYSize)
+        
+    def tile_size(self):
+        """:returns: size in pixels of the blocks stored in the file, as `(horizontal, vertical)`"""
+        return tuple(self._channel_bands[0][1].GetBlockSize())
+        
+    def _read_channels(self, x0, y0, width, height, names=None):
+        """:returns: dictionary of channel name --> array for a window, with y0 counted from the bottom, for all channels or the given names"""
+        
+        (raster_x, raster_y) = self.raster_size()
+        assert x0 >= 0 and y0 >= 0 and width > 0 and height > 0 and x0 + width <= raster_x and y0 + height <= raster_y, "window is outside the image"
+        # GDAL rows start at the top, and bitmap rows start at the bottom; the
+        # flip is a reversed view of the window, not a copy
+        gdal_y = raster_y - y0 - height
+        if self._palette is not None:
+            indexes = self._channel_bands[0][1].ReadAsArray(x0, gdal_y, width, height)
+            return _expand_palette(indexes[::-1], self._palette, names=names)
+        return dict([(name, band.ReadAsArray(x0, gdal_y, width, height)[::-1]) for name, band in self._channel_bands if names is None or name in names])
+        
+    def read_window(self, x0, y0, width, height):
+        """Read part of the image.
+        
+        :param x0: first column
+        :param y0: first row, counting from the bottom of the image as in the channel arrays
+        :param width: number of columns
+        :param height: number of rows
+        :returns: a :class:`DTBitmap2D` with the pixels and grid of the window
+        
+        """
+        
+        window = DTBitmap2D()
+        (xmin, ymin, dx, dy) = self.grid
+        window.grid = (xmin + x0 * dx, ymin + y0 * dy, dx, dy)
+        window.nodata = self.nodata
+        window.projection = self.projection
+        for name, channel in self._read_channels(x0, y0, width, height).items():
+            setattr(window, name, channel)
+        return window
+        
+    def tiles(self, width=None, height=None):
+        """Read the image a tile at a time.
+        
+        :param width: tile width in pixels (default is the width of a block in the file)
+        :param height: tile height in pixels (default is a multiple of the block height)
+        :returns: generator of `(x0, y0, tile)` tuples, as for :meth:`read_window`
+        
+        Tiles are aligned to the blocks of the file, and go through the file
+        in order, from the top of the image down.  Files stored in strips have
+        one-row blocks, so the default height covers enough strips for a few
+        million pixels.
+        
+        """
+        
+        (raster_x, raster_y) = self.raster_size()
+        (block_x, block_y) = self.tile_size()
+        width = block_x if width is None else width
+        if height is None:
+            height = block_y * max(1, _TILE_PIXELS // (width * block_y))
+        for gdal_y in range(0, raster_y, height):
+            tile_height = min(height, raster_y - gdal_y)
+            y0 = raster_y - gdal_y - tile_height
+            for x0 in range(0, raster_x, width):
+                yield (x0, y0, self.read_window(x0, y0, min(width, raster_x - x0), tile_height))
+                
+    def _channel_names(self):
+        names = [x[0] for x in self._channel_bands]
+        return [name for name in DTBitmap2D.CHANNEL_NAMES if name in names]
+        
+    def _read_rows(self, channel_name, y0, height):
+        return self._read_channels(0, y0, self.raster_size()[0], height, [channel_name])[channel_name]
+        
+    def _row_blocks(self, channel_name):
+        # strips of whole blocks, read from the bottom up; blocks start at
+        # the top of the file, so the bottom strip may be a partial one
+        (raster_x, raster_y) = self.raster_size()
+        (block_x, block_y) = self.tile_size()
+        strip_height = block_y * max(1, _TILE_PIXELS // (raster_x * block_y))
+        for gdal_y in reversed(range(0, raster_y, strip_height)):
+            height = min(strip_height, raster_y - gdal_y)
+            yield self._read_rows(channel_name, raster_y - gdal_y - height, height)
+        
+    def __dt_write__(self, datafile, name):
+        self._write_channels(datafile, name, self._row_blocks)
+        
+    def close(self):
+        """Close the GDAL dataset.  The bitmap can't be read after this."""
+        self._dataset = None
+        self._channel_bands = []
 
 def _array_from_image(image):
     """Convert a PIL image to a numpy ndarray.
@@ -0,0 +1,211 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# This software is under a BSD license.  See LICENSE.txt for details.
+
+"""Read-only access to a directory or glob of .dtbin files.
+
+A notebook or report script often reads the same few hundred files over
+and over.  DTCatalog keeps a bounded number of them open, and remembers the
+variable index of the ones it closes, so each lookup is cheap.
+
+"""
+
+__all__ = ["DTCatalog"]
+
+import os
+from glob import glob
+from fnmatch import fnmatchcase
+from collections import OrderedDict
+from datatank_py.DTDataFile import DTDataFile
+
+def _default_max_open_files():
+    """:returns: a quarter of the process file descriptor limit, up to 256"""
+    try:
+        import resource
+        soft_limit = resource.getrlimit(resource.RLIMIT_NOFILE)[0]
+    except (ImportError, ValueError):
+        return 64
+    if soft_limit == resource.RLIM_INFINITY:
+        return 256
+    return max(1, min(256, soft_limit // 4))
+
+def _file_signature(file_path):
+    """:returns: (size, modification time), to tell if a file has changed"""
+    stat = os.stat(file_path)
+    return (stat.st_size, getattr(stat, "st_mtime_ns", stat.st_mtime))
+
+class DTCatalog(object):
+    """Read-only access to a collection of .dtbin files.
+
+    Opening a DTDataFile and reading its variable index is repeated every
+    time a file is opened, which adds up when a notebook reads the same few
+    hundred files over and over.  A catalog keeps recently used files open,
+    up to a limit on open file descriptors, and keeps the index of files
+    it has closed, so an unchanged file is never read again from scratch.
+
+    Files are looked up by name, and each is a read-only DTDataFile:
+
+    >>> catalog = DTCatalog("/data/runs")
+    >>> depth = catalog["run42.dtbin"]["Depth_100"]
+
+    Variables can be found across all files at once:
+
+    >>> for file_name, variable_name in catalog.find("Depth_*"):
+    ...     print file_name, variable_name
+
+    Do not close the DTDataFile objects returned by the catalog; that's
+    done when they're evicted, or by :meth:`close`.  A returned file is only
+    valid until the next lookup of a different file, which may evict it, so
+    read what you need from it before asking for another file, rather than
+    holding on to it.
+
+    """
+
+    def __init__(self, directory_or_glob, max_open_files=None):
+        """
+        :param directory_or_glob: directory of .dtbin files, or a glob pattern such as "runs/*/Output.dtbin"
+        :param max_open_files: number of files kept open (default is a quarter of the file descriptor limit, up to 256)
+
+        Files are named by their base name, which must be unique.  Call
+        :meth:`refresh` to pick up files added after the catalog is created.
+
+        """
+
+        super(DTCatalog, self).__init__()
+
+        if os.path.isdir(directory_or_glob):
+            self._pattern = os.path.join(directory_or_glob, "*.dtbin")
+        else:
+            self._pattern = directory_or_glob
+        self._max_open_files = max_open_files if max_open_files is not None else _default_max_open_files()
+        assert self._max_open_files > 0, "at least one file must be kept open"
+
+        # file name --> absolute path
+        self._paths = {}
+        # file name --> DTDataFile, least recently used first
+        self._open_files = OrderedDict()
+        # file name --> (file signature, saved index) for files that aren't open
+        self._indexes = {}
+
+        self.refresh()
+
+    def refresh(self):
+        """Look for files added or removed since the catalog was created."""
+
+        paths = {}
+        for file_path in glob(self._pattern):
+            file_name = os.path.basename(file_path)
+            assert file_name not in paths, "%s matches more than one file for %s" % (file_name, self._pattern)
+            paths[file_name] = os.path.abspath(file_path)
+
+        for file_name in list(self._open_files):
+            if paths.get(file_name) != self._paths[file_name]:
+                self._open_files.pop(file_name).close()
+        for file_name in list(self._indexes):
+            if paths.get(file_name) != self._paths[file_name]:
+                del self._indexes[file_name]
+        self._paths = paths
+
+    def file_names(self):
+        """:returns: sorted list of file names in the catalog"""
+        return sorted(self._paths)
+
+    def path(self, file_name):
+        """:returns: absolute path of a file in the catalog"""
+        return self._paths[file_name]
+
+    def _close_least_recently_used(self):
+        """Close the least recently used file, saving its index."""
+
+        file_name, datafile = self._open_files.popitem(last=False)
+        self._save_index(file_name, datafile)
+        datafile.close()
+
+    def _save_index(self, file_name, datafile):
+
+        # the signature has to be taken first, in case the file changes while reading the index
+        signature = _file_signature(datafile.path())
+        self._indexes[file_name] = (signature, datafile._index_state())
+
+    def data_file(self, file_name):
+        """Get an open file from the catalog.
+
+        :param file_name: base name of the file
+        :returns: a read-only :class:`datatank_py.DTDataFile.DTDataFile`
+
+        The file may be closed by the next lookup of a different file, once
+        more than ``max_open_files`` have been used, so don't keep it around.
+
+        """
+
+        datafile = self._open_files.pop(file_name, None)
+        if datafile is None:
+            assert file_name in self._paths, "no file named %s in %s" % (file_name, self._pattern)
+            while len(self._open_files) >= self._max_open_files:
+                self._close_least_recently_used()
+            file_path = self._paths[file_name]
+            datafile = DTDataFile(file_path, readonly=True)
+            saved = self._indexes.pop(file_name, None)
+            if saved is not None and saved[0] == _file_signature(file_path):
+                datafile._restore_index_state(saved[1])
+
+        self._open_files[file_name] = datafile
+        return datafile
+
+    def _variable_names(self, file_name):
+        """:returns: variable names in a file, ordered as in the file, without opening it if possible"""
+
+        if file_name not in self._open_files:
+            saved = self._indexes.get(file_name)
+            if saved is not None and saved[0] == _file_signature(self._paths[file_name]):
+                name_offset_map = saved[1].name_offset_map
+                return sorted(name_offset_map, key=name_offset_map.get)
+        return self.data_file(file_name).ordered_variable_names()
+
+    def find(self, pattern):
+        """Find variables in all files of the catalog.
+
+        :param pattern: glob pattern for variable names, such as "Depth_*"
+        :returns: list of (file name, variable name) tuples, sorted by file name
+
+        Files that haven't been read yet are opened to read their index,
+        but the values of the variables are not read.
+
+        """
+
+        found = []
+        for file_name in self.file_names():
+            found += [(file_name, name) for name in self._variable_names(file_name) if fnmatchcase(name, pattern)]
+        return found
+
+    def close(self):
+        """Close all open files.  The catalog can still be used afterwards."""
+
+        while len(self._open_files):
+            self._close_least_recently_used()
+
+    def __getitem__(self, file_name):
+        # support for dictionary-style getting
+        return self.data_file(file_name)
+
+    def __contains__(self, file_name):
+        return file_name in self._paths
+
+    def __iter__(self):
+        return iter(self.file_names())
+
+    def __len__(self):
+        return len(self._paths)
+
+    def __enter__(self):
+        # support for with statement
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        # support for with statement
+        self.close()
+        return False
+
+    def __str__(self):
+        return "DTCatalog(%s): %d files, %d open" % (self._pattern, len(self._paths), len(self._open_files))
@@ -33,10 +33,15 @@ by e-mail: amaxwell AT mac DOT com
 
 """
 
-__all__ = ["DTDataFile"]
+__all__ = ["DTDataFile", "DTDataFileStats", "register_dt_type"]
 
 import sys, os
+import time
+import hashlib
+from functools import wraps
 from struct import Struct
+from collections import OrderedDict, namedtuple
+from fnmatch import fnmatchcase
 import numpy as np
 from datatank_py.DTPyWrite import dt_writer
 
@@ -47,54 +52,375 @@ def _is_string(x):
         basestring = str
     return isinstance(x, basestring)
 
-# see doc for _load_modules
-_CLASSES_BY_TYPE = {}
+# Arrays converted to another type on reading or writing are
+# processed in pieces of this size, so there's no full-size temporary.
+_CONVERSION_CHUNK_BYTES = 1024 * 1024
+
+# Strings longer than this are not kept in the index, since they're
+# very unlikely to be the name of another variable.
+_MAX_INDEXED_STRING_LENGTH = 1024
+
+# Appended to the name of a redirect written by dedupe, for an empty string
+# that marks it as one.  Other strings that happen to name an array, such as
+# shared grids, are only followed by resolve_name, which in turn stops at a
+# dedupe redirect since it stands for its own content.  The markers are kept
+# out of the variable list.
+_DEDUPE_MARKER_SUFFIX = "_dedupe"
+
+# A float policy never applies to these, since DataTank needs time values
+# and grid geometry in double precision.  Arrays with fewer elements than
+# _FLOAT_POLICY_MIN_SIZE are also left alone; those are grid origins,
+# bounding boxes, and scalars, where there's nothing to save anyway.
+_DOUBLE_PRECISION_PATTERNS = ("*_time", "*_loc", "*_bbox2D", "*_bbox3D", "*_X", "*_Y", "*_Z", "*_pts")
+_FLOAT_POLICY_MIN_SIZE = 64
+
+# Default float policy for DTDataFile.write, meaning "use the file's policy",
+# so that passing None for a single call can mean full precision.
+_FILE_FLOAT_POLICY = object()
+
+def _float_policy_pairs(policy):
+    """Check a float policy and convert it to (glob pattern, type) pairs.
+
+    :param policy: None, a numpy float type or type name, a sequence of (glob pattern, type) pairs, or a single pair
+    :returns: None, or a tuple of (glob pattern, numpy.dtype or None) pairs
+
+    A single ("Seq_*", np.float32) pair is easy to pass by mistake for a
+    list of them, so it's accepted as one.
+
+    """
+
+    if policy is None:
+        return None
+    if _is_string(policy) or not isinstance(policy, (tuple, list)):
+        policy = (("*", policy),)
+    elif len(policy) == 2 and _is_string(policy[0]):
+        policy = (policy,)
+
+    pairs = []
+    for entry in policy:
+        assert isinstance(entry, (tuple, list)) and len(entry) == 2 and _is_string(entry[0]), "float policy entries must be (glob pattern, type) pairs, not %r" % (entry,)
+        (pattern, dtype) = entry
+        if dtype is not None:
+            dtype = np.dtype(dtype)
+            assert dtype in (np.float32, np.float64), "float policy must be float32 or float64, not %s" % (dtype)
+        pairs.append((pattern, dtype))
+    return tuple(pairs)
+
+def _float_policy_type(policy, name, array):
+    """Find the type a float policy calls for when writing an array.
+
+    :param policy: None or pairs from :func:`_float_policy_pairs`
+    :param name: name of the array variable
+    :param array: the numpy.ndarray to be written
+    :returns: numpy.dtype to write, or None to write the array as-is
+
+    The first pattern matching the name wins, and a type of None means
+    the array keeps its precision.  Only double-precision arrays with at
+    least _FLOAT_POLICY_MIN_SIZE elements are converted.
+
+    """
+
+    if policy is None or array.dtype != np.float64 or array.size < _FLOAT_POLICY_MIN_SIZE:
+        return None
+
+    for pattern in _DOUBLE_PRECISION_PATTERNS:
+        if fnmatchcase(name, pattern):
+            return None
+
+    for pattern, dtype in policy:
+        if fnmatchcase(name, pattern):
+            return dtype
+    return None
+
+# variable index saved by DTDataFile._index_state; name_offset_map maps each
+# variable name to its block offset, and is the only field meant for callers
+_DTIndexState = namedtuple("_DTIndexState", ("length", "indexed_length", "little_endian", "swap", "struct", "name_offset_map", "string_values", "dedupe_redirects", "last_block_start"))
+
+# from <sys/inotify.h>, for DTDataFile.watch
+_IN_MODIFY = 0x00000002
+_IN_CLOSE_WRITE = 0x00000008
+_IN_NONBLOCK = 0x00000800
+_IN_CLOEXEC = 0x00080000
+
+def _inotify_descriptor(file_path):
+    """Ask the kernel for notification of changes to a file.
+    
+    :param file_path: path of the file to watch
+    :returns: a file descriptor that is readable after the file is modified, or None if inotify is unavailable
+    
+    The caller is responsible for closing the descriptor.
+    
+    """
+    
+    if not sys.platform.startswith("linux"):
+        return None
+    try:
+        import ctypes, ctypes.util
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        fd = libc.inotify_init1(_IN_NONBLOCK | _IN_CLOEXEC)
+    except (OSError, AttributeError):
+        return None
+    if fd < 0:
+        return None
+    if not isinstance(file_path, bytes):
+        file_path = file_path.encode(sys.getfilesystemencoding())
+    if libc.inotify_add_watch(fd, file_path, _IN_MODIFY | _IN_CLOSE_WRITE) < 0:
+        os.close(fd)
+        return None
+    return fd
+
+# Byte ranges for advisory locks with DTDataFile(..., lock=True).  These are
+# fcntl record locks, so they don't keep anyone from reading or writing the
+# bytes themselves.  A writer holds the first for as long as the file is
+# open, and holds the second while a write is in progress.
+_WRITER_LOCK_OFFSET = 0
+_COMMIT_LOCK_OFFSET = 1
+
+# (device, inode) of files open for writing with lock=True in this process,
+# since fcntl locks never conflict with other locks held by the same process
+_FILES_LOCKED_FOR_WRITING = set()
+
+def _committed_write(method):
+    """Decorator for DTDataFile methods that write to the file.
+    
+    With lock=True, this holds the commit lock for the outermost write, so
+    a reader never sees part of a compound object.  The file is flushed
+    before releasing it, so the reader sees everything that was written.
+    
+    """
+    
+    @wraps(method)
+    def committed_method(self, *args, **kwargs):
+        if self._locked_file_id is None:
+            return method(self, *args, **kwargs)
+            
+        import fcntl
+        if self._write_depth == 0:
+            fcntl.lockf(self._file.fileno(), fcntl.LOCK_EX, 1, _COMMIT_LOCK_OFFSET)
+        self._write_depth += 1
+        try:
+            return method(self, *args, **kwargs)
+        finally:
+            self._write_depth -= 1
+            if self._write_depth == 0:
+                self._file.flush()
+                fcntl.lockf(self._file.fileno(), fcntl.LOCK_UN, 1, _COMMIT_LOCK_OFFSET)
+    return committed_method
+
+# wall clock with the best resolution available
+_clock = getattr(time, "perf_counter", time.time)
+
+class DTDataFileStats(object):
+    """I/O counters for a DTDataFile.
+    
+    Pass ``stats=True`` to DTDataFile to collect these, then get them with
+    :meth:`DTDataFile.stats`.  Each counter is a plain attribute:
+    
+    - ``bytes_read`` and ``bytes_written``
+    - ``seeks`` and ``fsyncs``
+    - ``size_checks``, the number of times the file size was read from disk
+    - ``reloads``, the number of times the file changed size and was indexed again
+    - ``full_scans`` and ``incremental_scans`` of the variable index
+    - ``cache_hits`` and ``cache_misses``, when ``cache_bytes`` is used
+    
+    The ``operations`` dictionary maps each timed operation (``read``,
+    ``write_array``, ``write_string``, ``scan``) to a list of [call count,
+    total seconds].  A call made from within the same operation, such as
+    reading the target of a redirect, is part of the outer call.
+    
+    An instance can be shared by several files to get totals for all of
+    them.
+    
+    """
+    
+    def __init__(self):
+        super(DTDataFileStats, self).__init__()
+        self.reset()
+        
+    def reset(self):
+        """Set all counters to zero."""
+        self.bytes_read = 0
+        self.bytes_written = 0
+        self.seeks = 0
+        self.fsyncs = 0
+        self.size_checks = 0
+        self.reloads = 0
+        self.full_scans = 0
+        self.incremental_scans = 0
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.operations = {}
+        
+    def _record(self, operation, seconds):
+        counts = self.operations.get(operation)
+        if counts is None:
+            counts = [0, 0.0]
+            self.operations[operation] = counts
+        counts[0] += 1
+        counts[1] += seconds
+        
+    def as_dict(self):
+        """:returns: dictionary of all counters, suitable for logging or JSON"""
+        
+        values = dict([(key, value) for (key, value) in self.__dict__.items() if key != "operations"])
+        values["operations"] = dict([(operation, { "count":counts[0], "seconds":counts[1] }) for (operation, counts) in self.operations.items()])
+        return values
+        
+    def __str__(self):
+        operations = ", ".join(["%s %d in %.3f s" % (operation, counts[0], counts[1]) for (operation, counts) in sorted(self.operations.items())])
+        return "DTDataFileStats: %d bytes read, %d bytes written, %d seeks, %d fsyncs, %d reloads, %d full scans; %s" % (self.bytes_read, self.bytes_written, self.seeks, self.fsyncs, self.reloads, self.full_scans, operations)
+
+def _instrumented(operation, name_index=None):
+    """Decorator for DTDataFile methods that are timed when stats or a hook are enabled.
+    
+    :param operation: name of the operation for DTDataFileStats and the hook
+    :param name_index: position of the variable name in the method arguments
+    
+    Only the outermost call of each operation is timed, so recursion (such
+    as following a redirect) isn't counted twice.
+    
+    """
+    
+    def decorator(method):
+        @wraps(method)
+        def instrumented_method(self, *args, **kwargs):
+            if (self._stats is None and self._hook is None) or operation in self._active_operations:
+                return method(self, *args, **kwargs)
+                
+            self._active_operations.add(operation)
+            start = _clock()
+            try:
+                return method(self, *args, **kwargs)
+            finally:
+                seconds = _clock() - start
+                self._active_operations.discard(operation)
+                if self._stats is not None:
+                    self._stats._record(operation, seconds)
+                if self._hook is not None:
+                    name = args[name_index] if name_index is not None and len(args) > name_index else kwargs.get("name")
+                    self._hook(operation, name, seconds)
+        return instrumented_method
+    return decorator
 
 def _log_warning(msg):
     """Write a message to standard error"""
     sys.stderr.write("DTDataFile: %s\n" % (msg))
     
-def _load_modules():
-    """Creates a cache mapping DataTank type names to datatank_py classes.
+# DataTank type name --> (module name, class name) for the classes in this
+# package that can be read with from_data_file.  Keep this in sync with the
+# dt_type attribute of each class; DataTank and DTSource use different
+# constants, sometimes, so some classes have more than one name.
+_MODULES_BY_TYPE = {
+    "2D Bitmap":("datatank_py.DTBitmap2D", "DTBitmap2D"),
+    "Dictionary":("datatank_py.DTDictionary", "DTDictionary"),
+    "DTDictionary":("datatank_py.DTDictionary", "DTDictionary"),
+    "Mask":("datatank_py.DTMask", "DTMask"),
+    "DTMask":("datatank_py.DTMask", "DTMask"),
+    "2D Mesh":("datatank_py.DTMesh2D", "DTMesh2D"),
+    "Mesh2D":("datatank_py.DTMesh2D", "DTMesh2D"),
+    "2D Mesh Grid":("datatank_py.DTMeshGrid2D", "DTMeshGrid2D"),
+    "Mesh2DGrid":("datatank_py.DTMeshGrid2D", "DTMeshGrid2D"),
+    "2D Path":("datatank_py.DTPath2D", "DTPath2D"),
+    "Path2D":("datatank_py.DTPath2D", "DTPath2D"),
+    "1D Plot":("datatank_py.DTPlot1D", "DTPlot1D"),
+    "2D Point":("datatank_py.DTPoint2D", "DTPoint2D"),
+    "2D Point Collection":("datatank_py.DTPointCollection2D", "DTPointCollection2D"),
+    "2D Point Value":("datatank_py.DTPointValue2D", "DTPointValue2D"),
+    "2D Point Value Collection":("datatank_py.DTPointValueCollection2D", "DTPointValueCollection2D"),
+    "2D Region":("datatank_py.DTRegion2D", "DTRegion2D"),
+    "Region2D":("datatank_py.DTRegion2D", "DTRegion2D"),
+    "2D Structured Grid":("datatank_py.DTStructuredGrid2D", "DTStructuredGrid2D"),
+    "3D Structured Grid":("datatank_py.DTStructuredGrid3D", "DTStructuredGrid3D"),
+    "2D Structured Mesh":("datatank_py.DTStructuredMesh2D", "DTStructuredMesh2D"),
+    "3D Structured Mesh":("datatank_py.DTStructuredMesh3D", "DTStructuredMesh3D"),
+    "2D Structured Vector Field":("datatank_py.DTStructuredVectorField2D", "DTStructuredVectorField2D"),
+    "2D Triangular Grid":("datatank_py.DTTriangularGrid2D", "DTTriangularGrid2D"),
+    "2D Triangular Mesh":("datatank_py.DTTriangularMesh2D", "DTTriangularMesh2D"),
+    "2D Triangular Vector Field":("datatank_py.DTTriangularVectorField2D", "DTTriangularVectorField2D"),
+    "2D Vector":("datatank_py.DTVector2D", "DTVector2D"),
+}
+
+# Other packages can provide classes for DataTank types by declaring
+# entry points in this group, named by the DataTank type:
+#
+#   entry_points = { "datatank_py.types":["2D Foo = foo.DTFoo2D:DTFoo2D"] }
+#
+_ENTRY_POINT_GROUP = "datatank_py.types"
+
+# DataTank type name --> class, filled in as each type is needed
+_CLASSES_BY_TYPE = {}
+
+def register_dt_type(dt_type, cls):
+    """Register a class for reading a DataTank type with :meth:`DTDataFile.dt_object_named`.
     
-    For instance, this will have something like
+    :param dt_type: DataTank type name, as saved in the ``Seq_`` string
+    :param cls: a class with a ``from_data_file`` class method, or a "module:class" string
     
-    "2D Point" = <class 'datatank_py.DTPoint2D.DTPoint2D'>
-    "2D Path"  = <class 'datatank_py.DTPath2D.DTPath2D'>
-    "Path2D"   = <class 'datatank_py.DTPath2D.DTPath2D'>
+    Passing a string defers importing the module until a variable of that
+    type is actually read.  A registered class takes precedence over the
+    classes in datatank_py and any entry points.
     
-    where the class objects will have attribute dt_type (iterable)
-    and class method from_data_file (DTPyWrite).
+    """
+    
+    if _is_string(cls):
+        module_name, class_name = cls.split(":")
+        _MODULES_BY_TYPE[dt_type] = (module_name, class_name)
+        _CLASSES_BY_TYPE.pop(dt_type, None)
+    else:
+        assert hasattr(cls, "from_data_file"), "%s has no from_data_file method" % (cls)
+        _CLASSES_BY_TYPE[dt_type] = cls
+        
+def _entry_point_class(dt_type):
+    """:returns: class loaded from the first entry point named dt_type, or None"""
+    
+    try:
+        from importlib.metadata import entry_points
+    except ImportError:
+        try:
+            from pkg_resources import iter_entry_points
+        except ImportError:
+            return None
+        for entry_point in iter_entry_points(_ENTRY_POINT_GROUP, name=dt_type):
+            return entry_point.load()
+        return None
+    
+    all_entry_points = entry_points()
+    if hasattr(all_entry_points, "select"):
+        group = all_entry_points.select(group=_ENTRY_POINT_GROUP)
+    else:
+        group = all_entry_points.get(_ENTRY_POINT_GROUP, ())
+    for entry_point in group:
+        if entry_point.name == dt_type:
+            return entry_point.load()
+    return None
+
+def _class_for_dt_type(dt_type):
+    """Look up the class that reads a given DataTank type.
+    
+    :param dt_type: DataTank type name, such as "2D Mesh"
+    :returns: a class with a from_data_file class method, or None
+    
+    Only the module for this type is imported, so reading a 2D Mesh doesn't
+    import DTBitmap2D and probe for GDAL and PIL.
     
     """
-    if len(_CLASSES_BY_TYPE) == 0:
-        from glob import glob
-        import datatank_py
-        
-        # try to load all modules in the datatank_py module directory
-        for module_name in glob(os.path.join(os.path.dirname(datatank_py.__file__), "DT*.py")):
-            # e.g. DTPath2D.py
-            module_name = os.path.basename(module_name)
-            if "DTDataFile" in module_name:
-                continue
-            # DTPath2D
-            class_name = os.path.splitext(module_name)[0]
-            # datatank_py.DTPath2D
-            module_name = "datatank_py." + class_name
-            # import datatank_py.DTPath2D
-            module = __import__(module_name, fromlist=[])
-            # ignore modules that don't have a class with the same name
-            if hasattr(module, class_name):
-                mcls = getattr(module, class_name)
-                if hasattr(mcls, class_name):
-                    # finally, an instance of the class itself
-                    mcls = getattr(mcls, class_name)
-                    # check for class attribute of dt_type and class method from_data_file
-                    # *** REMEMBER, THIS IS NOT THE __dt_type__ METHOD! ***
-                    if hasattr(mcls, "dt_type") and hasattr(mcls, "from_data_file"):
-                        # DataTank and DTSource use different constants. Sometimes.
-                        for dt_type in mcls.dt_type:
-                            _CLASSES_BY_TYPE[dt_type] = mcls
+    
+    mcls = _CLASSES_BY_TYPE.get(dt_type)
+    if mcls is not None:
+        return mcls
+        
+    if dt_type in _MODULES_BY_TYPE:
+        module_name, class_name = _MODULES_BY_TYPE[dt_type]
+        module = __import__(module_name, fromlist=[class_name])
+        mcls = getattr(module, class_name)
+    else:
+        mcls = _entry_point_class(dt_type)
+        
+    if mcls is not None:
+        # *** REMEMBER, THIS IS NOT THE __dt_type__ METHOD! ***
+        assert hasattr(mcls, "from_data_file"), "%s has no from_data_file method" % (mcls)
+        _CLASSES_BY_TYPE[dt_type] = mcls
+    return mcls
 
 # from cProfile, these are surprisingly expensive to get
 try:
@@ -121,6 +447,22 @@ def _ensure_array(obj):
     else:
         return np.array(obj, dtype=np.double)
 
+def _content_digest(array):
+    """SHA-1 digest of the values of an array in C order, for dedupe.
+
+    A non-contiguous array is hashed a block of rows at a time, so there's
+    no copy of the whole array.
+
+    """
+    if array.flags.c_contiguous:
+        return hashlib.sha1(array).digest()
+    digest = hashlib.sha1()
+    row_bytes = max(1, array.itemsize * (array.size // max(1, len(array))))
+    rows = max(1, _CONVERSION_CHUNK_BYTES // row_bytes)
+    for start in range(0, len(array), rows):
+        digest.update(np.ascontiguousarray(array[start:start + rows]))
+    return digest.digest()
+
 # the last component is the time index (if present)
 def _basename_of_variable(varname):
     """Get the base name of a variable, without the time index.
@@ -241,6 +583,10 @@ def _dtarray_type_and_size_from_object(obj):
     _log_warning("unable to determine DT type for object %s" % (type(obj)))
     return (None, None)
 
+def _squeezed_shape(shape):
+    """Returns the shape without singleton dimensions."""
+    return tuple([x for x in shape if x != 1])
+
 def _debug_log(msg):
     from syslog import syslog, LOG_ERR, LOG_USER
     syslog(LOG_ERR | LOG_USER, msg)
@@ -254,7 +600,14 @@ class DTDataFile(object):
     define how they're interpreted.
     
     You should not have multiple DTDataFile instances open for the same
-    file on disk, or your file's state will get trashed.
+    file on disk, or your file's state will get trashed.  Passing
+    ``lock=True`` enforces this with fcntl advisory locks: opening a file
+    for writing fails if another DTDataFile (also using lock=True) has it
+    open for writing.  Readers with lock=True can run alongside the writer,
+    and only see variables that the writer has finished writing:
+    
+    >>> writer = DTDataFile("solver.dtbin", truncate=True, lock=True)
+    >>> reader = DTDataFile("solver.dtbin", readonly=True, lock=True)
     
     Reading values is fairly easy, and DTDataFile provides a 
     dictionary-style interface to the variables.  For example,
@@ -292,18 +645,87 @@ class DTDataFile(object):
     >>> with DTDataFile("foo.dtbin", truncate=True) as df:
     ...     df.write_2dmesh_one(mesh, 0, 0, dx, dy, "FooBar")
     
+    Large time series tend to write the same grid, bounding box, and mask
+    arrays at every step.  Passing ``dedupe=True`` makes DTDataFile keep a
+    digest of each large array it writes, and a repeated array is saved as a
+    string naming the first copy, like the redirect used for shared grids.
+    Reading the repeated name returns the original array, so compound
+    objects get the disk savings without a special write method:
+    
+    >>> with DTDataFile("foo.dtbin", truncate=True, dedupe=True) as df:
+    ...     for idx in xrange(100):
+    ...         df.write(DTMesh2D(values[idx], grid=grid, mask=mask), "Mesh_%d" % (idx), time=idx)
+    
+    Compound objects read the same underlying arrays over and over, such as
+    a shared grid in a time series.  Passing a byte budget as ``cache_bytes``
+    keeps recently read values in memory, so the grid is only read once:
+    
+    >>> f = DTDataFile("a.dtbin", readonly=True, cache_bytes=64 * 1024 * 1024)
+    >>> meshes = [DTStructuredMesh2D.from_data_file(f, "Depth_%d" % (idx)) for idx in xrange(1000)]
+    >>> print f.cache_info()["hits"]
+    
+    Arrays returned from the cache are shared, so they are marked read-only.
+    
+    Solver output is usually double precision, but single precision is
+    plenty for viewing most fields in DataTank.  A ``float_policy`` converts
+    double-precision arrays as they're written, either for the whole file or
+    for a single call to :meth:`write`, and can use glob patterns to choose
+    a type per name:
+    
+    >>> with DTDataFile("foo.dtbin", truncate=True, float_policy="float32") as df:
+    ...     df.write(mesh, "Temperature", time=0)
+    ...     df.write(pressure_mesh, "Pressure", time=0, float_policy=None)
+    
+    Time values, grid coordinates, and bounding boxes are always written in
+    double precision, as are arrays with fewer than 64 values, such as
+    scalars and grid origins, where there's nothing to save.
+    
     """
     
-    def __init__(self, file_path, truncate=False, readonly=False):
+    def __init__(self, file_path, truncate=False, readonly=False, dedupe=False, dedupe_min_bytes=1024, cache_bytes=0, float_policy=None, lock=False, stats=False, hook=None):
         """       
         :param file_path: absolute or relative path
         :param truncate: whether to truncate the file if it exists (default is `False`)
         :param readonly: open the file for read-only access (default is `False`)
+        :param dedupe: save repeated arrays as redirects to the first copy (default is `False`)
+        :param dedupe_min_bytes: arrays smaller than this are always written in full
+        :param cache_bytes: memory budget for caching values read from the file (default is 0, no caching)
+        :param float_policy: type for writing double-precision arrays of 64 or more values, or a list of (glob pattern, type) pairs
+        :param lock: use advisory locks to coordinate with other processes (default is `False`)
+        :param stats: collect I/O counters; True or a :class:`DTDataFileStats` to add to (default is `False`)
+        :param hook: function called as hook(operation, name, seconds) after each timed operation
         
         The default mode is to append to a file, creating it if
         it doesn't already exist.  Passing True for truncate will
         entirely clear the file's content.
         
+        Deduplication only considers arrays written by this instance, so
+        appending to an existing file will not redirect to arrays that were
+        already on disk.  Small arrays are not worth it, since a redirect
+        costs two block headers and three copies of a name.  The array named
+        by the object passed to :meth:`write`, such as the connections of a
+        triangular grid, is always written in full, since readers of compound
+        objects use :meth:`resolve_name` on that name.  Components such as a
+        mesh's mask are deduplicated, and :meth:`resolve_name` returns their
+        own name rather than the first copy's.
+        
+        A float policy of ``"float32"`` or ``np.float32`` writes all double
+        arrays in single precision.  A list such as ``[("*_V", np.float32),
+        ("Depth*", None)]`` is checked in order, and the first matching
+        pattern picks the type; None keeps double precision.  Arrays with
+        fewer than 64 values are always written as they are.
+        
+        Locking is only available where fcntl is, and only coordinates with
+        other DTDataFile instances that use it.  With truncate, the file is
+        only truncated after the writer's lock is acquired.  Note that POSIX
+        releases a process's locks on a file when it closes any descriptor for
+        that file, so don't open and close readers of a file in the process
+        that's writing it.
+        
+        Instrumentation is off by default, and costs an attribute check per
+        operation when off.  The hook gets the same operation names as
+        :class:`DTDataFileStats`, and name is None for a scan of the file.
+        
         """
         
         super(DTDataFile, self).__init__()
@@ -313,6 +735,17 @@ class DTDataFile(object):
         # ensure __del__ works in case of failure in __init__        
         self._file = None
         self._readonly = False
+        self._cache = None
+        self._locked_file_id = None
+        self._lock = lock
+        self._write_depth = 0
+        self._stats = (stats if isinstance(stats, DTDataFileStats) else DTDataFileStats()) if stats else None
+        self._hook = hook
+        # operations currently being timed, to skip nested calls
+        self._active_operations = set()
+        
+        # checked before opening anything
+        float_policy = _float_policy_pairs(float_policy)
         
         if readonly:
             assert truncate == False, "truncate and readonly are mutually exclusive"
@@ -320,19 +753,93 @@ class DTDataFile(object):
             self._readonly = True
         elif truncate:
             assert readonly == False, "truncate and readonly are mutually exclusive"
-            filemode = "wb+"
+            # if locking, truncate after we have the lock
+            filemode = "ab+" if lock else "wb+"
         else:
             assert readonly == False, "append and readonly are mutually exclusive"
             filemode = "ab+"
             
+        # closing a descriptor drops all of this process's locks on the file,
+        # so a second writer has to be refused before it opens one
+        if lock and not readonly and os.path.exists(file_path):
+            stat = os.stat(file_path)
+            assert (stat.st_dev, stat.st_ino) not in _FILES_LOCKED_FOR_WRITING, "%s is already open for writing in this process" % (self._file_path)
+            
         self._file = open(file_path, filemode)
+        if lock and not readonly:
+            self._lock_for_writing()
+            if truncate:
+                self._file.truncate(0)
         self._length = os.path.getsize(file_path)
+        if self._stats is not None:
+            self._stats.size_checks += 1
         self._name_offset_map = {}
+        # string variable name --> value (None if too long to keep in memory)
+        self._string_values = {}
+        # name of a redirect written by dedupe --> offset of its marker block
+        self._dedupe_redirects = {}
+        # string variable name --> name at the end of its redirect chain (None if circular);
+        # this is None when it needs to be recomputed after writing a string
+        self._resolved_names = {}
         self._swap = None
         self._little_endian = None
         self._struct = None
+        # offset of the end of the last complete block in the variable map
+        self._indexed_length = 0
+        # offset of the last complete block, or None if there isn't one
+        self._last_block_start = None
         self.DEBUG = False
+        
+        # content digest --> name of the first array written with that content
+        self._dedupe = dedupe
+        self._dedupe_min_bytes = dedupe_min_bytes
+        self._name_by_digest = {}
+        # names of compound objects being written by _dt_write, innermost last
+        self._object_names = []
+        
+        # (name, block offset) --> (value, size in bytes), least recently used first
+        self._cache = OrderedDict() if cache_bytes > 0 else None
+        self._cache_max_bytes = cache_bytes
+        self._cache_bytes = 0
+        self._cache_hits = 0
+        self._cache_misses = 0
+        
+        # staging buffer for reading arrays that are converted to another type
+        self._conversion_buffer = None
+        
+        # precision for writing double arrays; write() may override it for one call
+        self._float_policy = float_policy
+        self._call_float_policy = _FILE_FLOAT_POLICY
     
+    def _lock_for_writing(self):
+        """Take the writer's advisory lock, which is held until the file is closed."""
+        
+        import fcntl
+        stat = os.fstat(self._file.fileno())
+        file_id = (stat.st_dev, stat.st_ino)
+        assert file_id not in _FILES_LOCKED_FOR_WRITING, "%s is already open for writing in this process" % (self._file_path)
+        try:
+            fcntl.lockf(self._file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB, 1, _WRITER_LOCK_OFFSET)
+        except (IOError, OSError):
+            assert False, "%s is open for writing by another process" % (self._file_path)
+        _FILES_LOCKED_FOR_WRITING.add(file_id)
+        self._locked_file_id = file_id
+        
+    def _committed_size(self):
+        """:returns: size of the file, not including any write in progress by a locking writer"""
+        
+        if self._stats is not None:
+            self._stats.size_checks += 1
+        if not self._lock or not self._readonly:
+            return os.path.getsize(self._file_path)
+            
+        import fcntl
+        fcntl.lockf(self._file.fileno(), fcntl.LOCK_SH, 1, _COMMIT_LOCK_OFFSET)
+        try:
+            return os.path.getsize(self._file_path)
+        finally:
+            fcntl.lockf(self._file.fileno(), fcntl.LOCK_UN, 1, _COMMIT_LOCK_OFFSET)
+        
     def _flush(self):
         """Flush and sync to storage"""
         if self._readonly == False:
@@ -350,6 +857,8 @@ class DTDataFile(object):
             #
             self._file.flush()
             os.fsync(self._file.fileno())
+            if self._stats is not None:
+                self._stats.fsyncs += 1
         
     def _read_object_header_at_offset(self, offset):
         """Read DTDataFileStructure at the specified offset in the file.
@@ -370,25 +879,38 @@ class DTDataFile(object):
         assert offset + self._struct.size <= self._length, "offset exceeds file length"
         self._file.seek(offset)
         bytes_read = self._file.read(self._struct.size)
+        if self._stats is not None:
+            self._stats.seeks += 1
+            self._stats.bytes_read += len(bytes_read)
         if len(bytes_read) != self._struct.size:
             return None
         return self._struct.unpack(bytes_read)
     
+    @_instrumented("scan")
     def _read_in_content(self):
         """Read or update the variable list from disk.
         
         Builds a dictionary of variable name --> offset, where offset is suitable for
         passing to _read_object_header_at_offset.  Also records the endianness of the
-        file and determines an appropriate header structure.
+        file and determines an appropriate header structure.  Short string values are
+        kept as well, and redirects are resolved once here instead of in resolve_name.
         
         This method walks the entire file on-disk, so it may be expensive to compute
-        for large files.
+        for large files.  See :meth:`_index_new_blocks` for the actual walk.
         
         """
         
+        if self._stats is not None:
+            self._stats.full_scans += 1
         self._name_offset_map = {}
+        self._string_values = {}
+        self._dedupe_redirects = {}
+        self._indexed_length = 0
+        self._last_block_start = None
+        self._clear_cache()
         # ensure we have a consistent file unless we're read-only
         self._flush()
+        self._length = self._committed_size()
         self._file.seek(0)
         # all headers are the same length
         default_file_header = "DataTank Binary File LE\0"
@@ -397,7 +919,10 @@ class DTDataFile(object):
             assert self._length >= len(default_file_header), "invalid file"
             
             header = self._file.read(len(default_file_header))
-            if header == "DataTank Binary File LE\0":
+            if self._stats is not None:
+                self._stats.seeks += 1
+                self._stats.bytes_read += len(header)
+            if header == b"DataTank Binary File LE\0":
                 self._little_endian = True
                 self._swap = False if sys.byteorder == "little" else True
             else:
@@ -409,24 +934,191 @@ class DTDataFile(object):
             format = "<qiiiii" if self._little_endian else ">qiiiii"
             self._struct = Struct(format)
         
-        # avoid this for empty files
-        while self._length:
+            self._indexed_length = len(default_file_header)
+            self._index_new_blocks()
+        
+        self._resolve_redirects()
+        # a reader may be looking at a file that's still being written
+        if self._readonly == False:
+            assert self._length == os.path.getsize(self._file_path), "file size = %d, length record = %d" % (os.path.getsize(self._file_path), self._length)
+        
+    def _index_new_blocks(self):
+        """Add blocks after the indexed part of the file to the variable list.
+        
+        :returns: list of names added, in file order
+        
+        Walks from the end of the last indexed block up to self._length, which
+        lets a growing file be indexed without reading it all again.  A block
+        that extends past the end of the file is still being written, so it's
+        left for a later call.  The caller is responsible for resolving
+        redirects afterwards.
+        
+        """
+        
+        names = []
+        block_start = self._indexed_length
+        while block_start + self._struct.size <= self._length:
             
-            block_start = self._file.tell()            
             (block_length, var_type, m, n, o, name_length) = self._read_object_header_at_offset(block_start)
+            if block_length < self._struct.size + name_length or block_start + block_length > self._length:
+                break
 
             # remove the trailing \0 so we have a normal Python string
             name = self._file.read(name_length)[:-1]
-            self._name_offset_map[name] = block_start
+            if self._stats is not None:
+                self._stats.bytes_read += name_length
+            if not isinstance(name, str):
+                name = name.decode("utf-8")
+            self._last_block_start = block_start
             
-            # could do a consistency check here to make sure we came out even?
-            next_block = block_start + block_length
-            if next_block >= self._length:
-                break
+            # DTDataFile_String; these are small, and may name another variable
+            value = None
+            if var_type == 20:
+                value_length = block_length - self._struct.size - name_length
+                if value_length <= _MAX_INDEXED_STRING_LENGTH:
+                    value = self._file.read(value_length).strip(b"\0").decode("utf-8")
+                    if self._stats is not None:
+                        self._stats.bytes_read += value_length
+                        
+            redirect_name = name[:-len(_DEDUPE_MARKER_SUFFIX)]
+            if value == "" and name.endswith(_DEDUPE_MARKER_SUFFIX) and self._string_values.get(redirect_name) is not None:
+                self._dedupe_redirects[redirect_name] = block_start
+            else:
+                self._name_offset_map[name] = block_start
+                names.append(name)
+                if var_type == 20:
+                    self._string_values[name] = value
+            
+            block_start += block_length
             
-            self._file.seek(next_block)
+        self._indexed_length = block_start
+        return names
+        
+    def _indexed_blocks_unchanged(self):
+        """:returns: True if the file header and the last indexed block are still as indexed
+        
+        A file rewritten from the start by another program can end up larger
+        than it was, so growth alone doesn't mean the index is still valid.
+        
+        """
+        
+        file_header = b"DataTank Binary File LE\0" if self._little_endian else b"DataTank Binary File BE\0"
+        # seeking to the new end drops read-ahead data from before a rewrite
+        self._file.seek(0, os.SEEK_END)
+        self._file.seek(0)
+        header = self._file.read(len(file_header))
+        if self._stats is not None:
+            self._stats.seeks += 1
+            self._stats.bytes_read += len(header)
+        if header != file_header:
+            return False
+        if self._last_block_start is None:
+            return self._indexed_length == len(file_header)
+            
+        (block_length, var_type, m, n, o, name_length) = self._read_object_header_at_offset(self._last_block_start)
+        if self._last_block_start + block_length != self._indexed_length or name_length < 1:
+            return False
+        name = self._file.read(name_length)[:-1]
+        if self._stats is not None:
+            self._stats.bytes_read += name_length
+        if not isinstance(name, str):
+            try:
+                name = name.decode("utf-8")
+            except UnicodeDecodeError:
+                return False
+        if name.endswith(_DEDUPE_MARKER_SUFFIX) and self._dedupe_redirects.get(name[:-len(_DEDUPE_MARKER_SUFFIX)]) == self._last_block_start:
+            return True
+        return self._name_offset_map.get(name) == self._last_block_start
+        
+    def _extend_content(self):
+        """Index blocks appended to the file since it was last read.
+        
+        Only the new part of the file is read, unless it got shorter or the
+        last indexed block changed, in which case it has been rewritten and
+        is read from the start.
+        
+        """
+        
+        self._flush()
+        current_size = self._committed_size()
+        if self._struct is None or current_size < self._length or not self._indexed_blocks_unchanged():
+            self._read_in_content()
+        elif current_size > self._length:
+            if self._stats is not None:
+                self._stats.incremental_scans += 1
+            self._length = current_size
+            if len(self._index_new_blocks()):
+                # resolve_name will rebuild this as needed
+                self._resolved_names = None
+        
+    def _index_state(self):
+        """Save the variable index, so another instance can skip reading it.
+        
+        :returns: a _DTIndexState to pass to :meth:`_restore_index_state`
+        
+        The name_offset_map field can be used to list the variables without
+        opening the file; the other fields are private to DTDataFile.
+        
+        """
+        
+        self._reload_content_if_needed()
+        return _DTIndexState(self._length, self._indexed_length, self._little_endian, self._swap, self._struct, dict(self._name_offset_map), dict(self._string_values), dict(self._dedupe_redirects), self._last_block_start)
+        
+    def _restore_index_state(self, state):
+        """Use a variable index saved by :meth:`_index_state`.
+        
+        :param state: the saved index
+        
+        This is only valid for a file that hasn't changed since the index was
+        saved, which is up to the caller to check, since DTDataFile only looks
+        at the file size.
+        
+        """
+        
+        (self._length, self._indexed_length) = (state.length, state.indexed_length)
+        (self._little_endian, self._swap, self._struct) = (state.little_endian, state.swap, state.struct)
+        self._name_offset_map = dict(state.name_offset_map)
+        self._string_values = dict(state.string_values)
+        self._dedupe_redirects = dict(state.dedupe_redirects)
+        self._last_block_start = state.last_block_start
+        self._resolved_names = None
+        self._clear_cache()
+        
+    def _resolve_redirects(self):
+        """Follow each string variable's chain of redirects to its end.
+        
+        A string variable's value may be the name of another variable, which
+        may also be a string, and so on.  Since variables are immutable once
+        written, the end of each chain is computed once and stored in a dictionary
+        of name --> underlying name.  Circular references are stored as None.
+        
+        """
         
-        assert self._length == os.path.getsize(self._file_path), "file size = %d, length record = %d" % (os.path.getsize(self._file_path), self._length)
+        self._resolved_names = {}
+        for name in self._string_values:
+            
+            if name in self._resolved_names or self._string_values[name] is None:
+                continue
+                
+            # a repeated array saved by dedupe stands in for its own content
+            if name in self._dedupe_redirects:
+                self._resolved_names[name] = name
+                continue
+                
+            chain = [name]
+            underlying_name = self._string_values[name]
+            while self._string_values.get(underlying_name) is not None and underlying_name not in self._dedupe_redirects:
+                if underlying_name in self._resolved_names:
+                    underlying_name = self._resolved_names[underlying_name]
+                    break
+                if underlying_name in chain:
+                    underlying_name = None
+                    break
+                chain.append(underlying_name)
+                underlying_name = self._string_values[underlying_name]
+                
+            for chain_name in chain:
+                self._resolved_names[chain_name] = underlying_name
     
     def _reload_content_if_needed(self):
         """Ensures the name-offset dictionary is current.
@@ -443,9 +1135,13 @@ class DTDataFile(object):
         """
         
         # !!! may not be current unless we flush first, but if there's a mismatch,
-        # _read_in_content will flush and sync.
+        # _extend_content will flush and sync.
         current_size = os.path.getsize(self._file_path)
+        if self._stats is not None:
+            self._stats.size_checks += 1
         if (len(self._name_offset_map) == 0 and current_size > 0) or self._length != current_size:
+            if self._stats is not None:
+                self._stats.reloads += 1
             
             # This check is here to ensure that the optimization strategy is working properly.
             # If we see lots of spurious reload messages, something is likely haywire.
@@ -456,8 +1152,17 @@ class DTDataFile(object):
                 if self._length != os.path.getsize(self._file_path):
                     reasons.append("length %d != actual size %d" % (self._length, current_size))
                 _log_warning("reloading content:" + " ".join(reasons))
-            self._read_in_content()
+            
+            # a file that grew only needs its new blocks indexed
+            if len(self._name_offset_map) == 0:
+                self._read_in_content()
+            else:
+                self._extend_content()
     
+    def stats(self):
+        """:returns: the :class:`DTDataFileStats` for this file, or None if stats is not enabled"""
+        return self._stats
+        
     def close(self):
         """Close the underlying file object.
         
@@ -467,11 +1172,83 @@ class DTDataFile(object):
         """
         
         if self._file != None:
+            # this also releases any locks
             self._file.close()
             # could use as a sentinel to allow reopening
             self._file = None
+            _FILES_LOCKED_FOR_WRITING.discard(self._locked_file_id)
+            self._locked_file_id = None
             
         self._name_offset_map = {}
+        self._string_values = {}
+        self._dedupe_redirects = {}
+        self._resolved_names = {}
+        self._clear_cache()
+        
+    def _cached_value(self, key):
+        """Look up a value in the read cache.
+        
+        Arguments:
+        key -- tuple of (name, block offset)
+        
+        Returns:
+        The cached value, or None if caching is disabled or the value isn't cached.
+        
+        """
+        
+        if self._cache is None:
+            return None
+        entry = self._cache.pop(key, None)
+        if entry is None:
+            self._cache_misses += 1
+            if self._stats is not None:
+                self._stats.cache_misses += 1
+            return None
+        # reinsert to mark as most recently used
+        self._cache[key] = entry
+        self._cache_hits += 1
+        if self._stats is not None:
+            self._stats.cache_hits += 1
+        return entry[0]
+        
+    def _cache_value(self, key, value, byte_count):
+        """Add a value to the read cache, evicting old values as needed.
+        
+        Arguments:
+        key -- tuple of (name, block offset)
+        value -- a string, scalar, or read-only numpy array
+        byte_count -- approximate memory used by the value
+        
+        Keying by offset means appended content can never replace a cached
+        value, since blocks are not rewritten in place.  Any reload of the
+        file from disk empties the cache.
+        
+        """
+        
+        if self._cache is None or byte_count > self._cache_max_bytes:
+            return
+        self._cache[key] = (value, byte_count)
+        self._cache_bytes += byte_count
+        while self._cache_bytes > self._cache_max_bytes:
+            (ignored, (ignored, evicted_count)) = self._cache.popitem(last=False)
+            self._cache_bytes -= evicted_count
+            
+    def _clear_cache(self):
+        """Remove all values from the read cache."""
+        if self._cache is not None:
+            self._cache.clear()
+            self._cache_bytes = 0
+            
+    def cache_info(self):
+        """:returns: dictionary with read cache statistics
+        
+        The keys are ``hits``, ``misses``, ``count`` (values currently cached),
+        ``bytes`` (memory used by cached values), and ``max_bytes`` (the budget
+        passed as ``cache_bytes``).
+        
+        """
+        
+        return { "hits":self._cache_hits, "misses":self._cache_misses, "count":len(self._cache) if self._cache is not None else 0, "bytes":self._cache_bytes, "max_bytes":self._cache_max_bytes }
         
     def path(self):
         """:returns: the file path"""
@@ -489,9 +1266,8 @@ class DTDataFile(object):
         saves a lot of disk space, but means that you can end up with a string
         instead of the object you're expecting.
         
-        This method is pretty efficient in the common case of no redirect, as
-        it only reads the header.  Other cases are a bit more expensive,
-        but too tricky to be worth rewriting at the moment.
+        Redirects are resolved when the file's content is read in, so this is
+        just a dictionary lookup, and circular references raise an exception.
         
         Example from :class:`datatank_py.DTStructuredGrid2D.DTStructuredGrid2D`::
         
@@ -508,33 +1284,35 @@ class DTDataFile(object):
         
         self._reload_content_if_needed()
 
-        if name not in self._name_offset_map:
-            # exception here would be more pythonic, but this is consistent
+        # if this isn't a string, return the name without munging it;
+        # exception here would be more pythonic, but this is consistent
+        if name not in self._string_values:
             return name
         
-        block_start = self._name_offset_map[name]
-        (block_length, var_type, m, n, o, name_length) = self._read_object_header_at_offset(block_start)
+        # strings too long to be indexed can't be a name, but this is consistent
+        if self._string_values[name] is None:
+            return self.variable_named(name)
         
-        # if this isn't a string, return the name without munging it
-        if var_type != 20:
-            return name
-            
-        underlying_name = self.variable_named(name)
+        if self._resolved_names is None:
+            self._resolve_redirects()
+        underlying_name = self._resolved_names[name]
+        assert underlying_name is not None, "DTDataFile: circular name reference for %s" % (name)
+        return underlying_name
         
-        # shortcut for a one step redirect
-        if _is_string(underlying_name) == False:
-            return underlying_name
+    def _is_array_redirect(self, name, value):
+        """Check if a string variable is a redirect to an array.
         
-        # deeper redirect, so avoid circular references
-        names_seen = set()
-        names_seen.add(underlying_name)
+        Arguments:
+        name -- name of a string variable
+        value -- the string value of that variable
         
-        while _is_string(underlying_name) == False:
-            underlying_name = self.variable_named(underlying_name)
-            assert underlying_name not in names_seen, "DTDataFile: circular name reference for %s" % (name)
-            names_seen.add(underlying_name)
-            
-        return underlying_name
+        Returns:
+        True if the string was written by dedupe, and its value is the name
+        of a non-string variable.
+        
+        """
+        
+        return name in self._dedupe_redirects and value in self._name_offset_map and value not in self._string_values
                 
     def variable_names(self):
         """:returns: unsorted list of variable names"""
@@ -553,11 +1331,119 @@ class DTDataFile(object):
         self._reload_content_if_needed()
         return sorted(self._name_offset_map, key=self._name_offset_map.get)
 
-    def variable_named(self, name, use_modules=False):
+    def _variables_completed_by(self, name):
+        """Find variables that a block completes, for :meth:`watch`.
+        
+        :param name: name of a block in the file
+        :returns: list of variable names visible in DataTank
+        
+        A variable is visible when it has a Seq_ name, and a time series step is
+        visible once its value and time are both written.  These are written in
+        different orders by different methods, so the last block written may be
+        either one.
+        
+        """
+        
+        if name.startswith("Seq_"):
+            candidates = (name[len("Seq_"):],)
+        elif name.endswith("_time"):
+            candidates = (name[:-len("_time")],)
+        else:
+            candidates = (name,)
+        
+        completed = []
+        for candidate in candidates:
+            if candidate not in self._name_offset_map:
+                continue
+            if "Seq_" + candidate in self._name_offset_map:
+                completed.append(candidate)
+            else:
+                base_name = _basename_of_variable(candidate)
+                if base_name != candidate and "Seq_" + base_name in self._name_offset_map and candidate + "_time" in self._name_offset_map:
+                    completed.append(candidate)
+        return completed
+        
+    def watch(self, timeout=None, poll_interval=0.5):
+        """Generator for variables as another program writes them to this file.
+        
+        :param timeout: seconds to wait for a new variable before stopping (default is to wait forever)
+        :param poll_interval: seconds between checks of the file size when inotify is unavailable
+        :returns: generator of variable names
+        
+        Yields the name of each variable that becomes visible in DataTank, in
+        the order written.  Time series steps such as "Depth_12" are included
+        once both the value and its time are on disk.  Variables that were in
+        the file before calling this are not reported.
+        
+        Only blocks appended since the last check are read, and a block that
+        is still being written is ignored until it is complete.  On Linux, this
+        waits for inotify events; elsewhere, it checks the file size every
+        poll_interval seconds.
+        
+        >>> with DTDataFile("Solver.dtbin", readonly=True) as f:
+        ...     for name in f.watch(timeout=60):
+        ...         update_plot(name, f.dt_object_named(name))
+        
+        """
+        
+        # anything written after this call is reported, even before the first iteration
+        self._reload_content_if_needed()
+        return self._watch_generator(self._indexed_length, timeout, poll_interval)
+        
+    def _watch_generator(self, watched_length, timeout, poll_interval):
+        """Generator for :meth:`watch`, reporting variables in blocks after watched_length"""
+        
+        import select
+        
+        reported = set()
+        inotify_fd = _inotify_descriptor(self._file_path)
+        last_change = time.time()
+        
+        try:
+            while True:
+                
+                self._extend_content()
+                
+                # the content may have been indexed elsewhere while we were yielding
+                if self._indexed_length != watched_length:
+                    new_names = [name for name in self._name_offset_map if self._name_offset_map[name] >= watched_length]
+                    new_names.sort(key=self._name_offset_map.get)
+                    watched_length = self._indexed_length
+                    for name in new_names:
+                        for completed in self._variables_completed_by(name):
+                            if completed not in reported:
+                                reported.add(completed)
+                                last_change = time.time()
+                                yield completed
+                
+                wait = None if inotify_fd is not None else poll_interval
+                if timeout is not None:
+                    remaining = timeout - (time.time() - last_change)
+                    if remaining <= 0:
+                        return
+                    wait = remaining if wait is None else min(wait, remaining)
+                    
+                if inotify_fd is None:
+                    time.sleep(wait)
+                elif len(select.select([inotify_fd], [], [], wait)[0]):
+                    # only the file size matters, so just drain the events
+                    try:
+                        while len(os.read(inotify_fd, 4096)):
+                            pass
+                    except OSError:
+                        pass
+        finally:
+            if inotify_fd is not None:
+                os.close(inotify_fd)
+
+    @_instrumented("read", 0)
+    def variable_named(self, name, use_modules=False, out=None, dtype=None):
         """Procedural API for getting a value from disk.
         
         :param name: the variable name as user-visible in the file (without the trailing nul)
-        :param use_modules: try to convert to abstract type by introspection of available modules
+        :param use_modules: try to convert to abstract type using the registered classes
+        :param out: an existing numpy array to read an array variable into (see :meth:`read_into`)
+        :param dtype: numpy type to convert an array variable to as it is read
         
         :returns: a string, scalar, or numpy array
         
@@ -565,6 +1451,15 @@ class DTDataFile(object):
         attempt is made to convert a given array to its abstract type (so you can
         retrieve each plane of a 2D Bitmap object by name, but not as a PIL image).
         
+        Passing a dtype converts the values in small pieces as they're read, so
+        reading a double precision array as ``np.float32`` needs only the memory
+        for the single precision result, unlike calling ``astype`` afterwards.
+        
+        A string written by ``dedupe`` in place of a repeated array is a
+        redirect, and the array it points to is returned instead.  Other
+        strings are returned as-is, even if they name another variable, as
+        for shared grids; use :meth:`resolve_name` to follow those.
+        
         """
         
         self._reload_content_if_needed()
@@ -582,10 +1477,23 @@ class DTDataFile(object):
         
         # DTDataFile_String
         if var_type == 20:
-            self._file.seek(data_start)
-            bytes_read = self._file.read(block_length - self._struct.size - name_length).strip("\0")
-            return unicode(bytes_read, "utf-8")
-        elif name.startswith("Seq_") is False:
+            value = self._string_values.get(name)
+            if value is None:
+                value = self._cached_value((name, block_start))
+            if value is None:
+                self._file.seek(data_start)
+                bytes_read = self._file.read(block_length - self._struct.size - name_length).strip(b"\0")
+                if self._stats is not None:
+                    self._stats.seeks += 1
+                    self._stats.bytes_read += block_length - self._struct.size - name_length
+                value = bytes_read.decode("utf-8")
+                self._cache_value((name, block_start), value, block_length)
+            # !!! reentrancy here
+            if self._is_array_redirect(name, value):
+                return self.variable_named(value, use_modules=use_modules, out=out, dtype=dtype)
+            assert out is None and dtype is None, "cannot read string variable %s as an array" % (name)
+            return value
+        elif name.startswith("Seq_") is False and out is None and dtype is None:
             
             # !!! reentrancy here
             dt_type = self.variable_named("Seq_" + name)
@@ -598,7 +1506,10 @@ class DTDataFile(object):
                 
                 element_count = m * n * o
                 self._file.seek(data_start)
-                values = np.fromfile(self._file, dtype=np.dtype(np.int8), count=element_count)
+                values = self._read_values(np.dtype(np.int8), element_count)
+                if self._stats is not None:
+                    self._stats.seeks += 1
+                    self._stats.bytes_read += values.nbytes
                 
                 # !!! reentrancy here
                 offsets = self.variable_named(name + "_offs")
@@ -606,60 +1517,191 @@ class DTDataFile(object):
                 # singleton dimensions are now saved, but mess things up here
                 offsets = np.squeeze(offsets)
 
-                assert offsets != None, "invalid StringList: no offsets found for %s" % (name)
+                assert offsets is not None, "invalid StringList: no offsets found for %s" % (name)
                 string_list = []
                 
-                for idx in xrange(len(offsets)):
+                for idx in range(len(offsets)):
                     start = offsets[idx]
                     end = offsets[idx + 1] if idx < (len(offsets) - 1) else values.size
                     # get rid of trailing null
                     if end > 0:
                         end -= 1
-                    string = "".join([chr(x) for x in values[start:end]]).decode("utf-8")
+                    string = values[start:end].tobytes().decode("utf-8")
                     string_list.append(string)
                 
                 return string_list
             elif use_modules:
-                _load_modules()
+                dt_cls = _class_for_dt_type(dt_type)
                 # could log and continue, but this is currently only by explicit request
-                assert dt_type in _CLASSES_BY_TYPE, "Class %s is not in %s" % (dt_type, _CLASSES_BY_TYPE)
+                assert dt_cls is not None, "No class is registered for %s" % (dt_type)
                 
-                dt_cls = _CLASSES_BY_TYPE[dt_type]
                 # !!! early return here
                 return dt_cls.from_data_file(self, name)
                             
         # everything else is a DTArray type
-        data_type = _type_string_from_dtarray_type(var_type)
-        assert data_type is not None, "unhandled DTArray type"
-                    
-        # include the byte order when it's not host-ordered and wider than 8 bits
-        if self._swap and data_type.endswith("1") is False:
-            byte_order = "<" if self._little_endian else ">"
-            data_type = byte_order + data_type
+        data_type = self._array_data_type(var_type)
         
         element_count = m * n * o
         
+        if out is not None:
+            return self._read_array_into((name, block_start), data_start, np.dtype(data_type), (o, n, m), out)
+        
+        if dtype is not None and np.dtype(dtype) != np.dtype(data_type).newbyteorder("="):
+            if element_count == 0:
+                return np.array([], dtype=dtype)
+            values = self._read_array_into((name, block_start), data_start, np.dtype(data_type), (o, n, m), np.empty((o, n, m), dtype=dtype))
+            return values[0, 0, 0] if element_count == 1 else values
+        
         # We end up returning an array containing an empty array if element_count
         # is zero, and that's not what I want; an empty vector is more appropriate.
         if element_count == 0:
             return np.array([], dtype=np.dtype(data_type))
             
+        value = self._cached_value((name, block_start))
+        if value is not None:
+            return value
+            
         self._file.seek(data_start)
-        values = np.fromfile(self._file, dtype=np.dtype(data_type), count=element_count)
-        assert values.size == element_count, "unable to read all data"
+        values = self._read_values(np.dtype(data_type), element_count)
+        if self._stats is not None:
+            self._stats.seeks += 1
+            self._stats.bytes_read += values.nbytes
+        
+        # cached arrays are shared with every caller; this has to be set before reshaping
+        if self._cache is not None:
+            values.flags.writeable = False
                 
         # handle scalar values specially
         if m == 1 and n == 1 and o == 1:
-            return values[0]
+            value = values[0]
+        else:
+            # !!! Original code ignored singleton dimensions in determining shape, 
+            # but this caused major problems when reading objects from DataTank
+            # files; not sure if preexisting code accounts for singletons correctly.
+        
+            # see the array writing code for order of these elements
+            shape = (o, n, m)
+            value = values.reshape(shape, order="C")
+            
+        self._cache_value((name, block_start), value, values.nbytes)
+            
+        return value
+        
+    def _array_data_type(self, var_type):
+        """:returns: numpy type string for a DTArray type in this file, including byte order if needed"""
         
-        # !!! Original code ignored singleton dimensions in determining shape, 
-        # but this caused major problems when reading objects from DataTank
-        # files; not sure if preexisting code accounts for singletons correctly.
+        data_type = _type_string_from_dtarray_type(var_type)
+        assert data_type is not None, "unhandled DTArray type"
+                    
+        # include the byte order when it's not host-ordered and wider than 8 bits
+        if self._swap and data_type.endswith("1") is False:
+            byte_order = "<" if self._little_endian else ">"
+            data_type = byte_order + data_type
+        return data_type
+        
+    def _array_location(self, name):
+        """Find where the values of an array variable are stored.
+        
+        :param name: the variable name, which may be a string naming an array
+        :returns: tuple (file offset, numpy.dtype, shape as (o, n, m)), or None if there's no such variable
         
-        # see the array writing code for order of these elements
-        shape = (o, n, m)
+        This is for readers that do their own positioned reads of part of an
+        array, such as :class:`datatank_py.DTAsyncDataFile.DTAsyncDataFile`.
+        
+        """
+        
+        self._reload_content_if_needed()
+        if name not in self._name_offset_map:
+            return None
             
-        return values.reshape(shape, order="C")        
+        block_start = self._name_offset_map[name]
+        (block_length, var_type, m, n, o, name_length) = self._read_object_header_at_offset(block_start)
+        if var_type == 20:
+            value = self._string_values.get(name)
+            assert value is not None and self._is_array_redirect(name, value), "variable %s is not an array" % (name)
+            return self._array_location(value)
+            
+        data_start = block_start + self._struct.size + name_length
+        return (data_start, np.dtype(self._array_data_type(var_type)), (o, n, m))
+        
+    def read_into(self, name, buffer):
+        """Read an array variable into an existing numpy array.
+        
+        :param name: the variable name as user-visible in the file
+        :param buffer: a writeable, C-contiguous numpy array
+        
+        :returns: the buffer that was passed in, or ``None`` if the variable does not exist
+        
+        The buffer must have the same shape as :meth:`variable_named` would return,
+        although singleton dimensions are ignored.  If its type is not the type of
+        the array on disk, values are converted as they're read, as with the
+        dtype parameter of :meth:`variable_named`.  When looping over many time 
+        steps with the same shape, reusing a buffer avoids allocating a new array
+        for each one:
+        
+        >>> values = np.empty(f["Mesh_0"].shape, dtype=np.float64)
+        >>> for idx in xrange(1000):
+        ...     f.read_into("Mesh_%d" % (idx), values)
+        
+        """
+        
+        return self.variable_named(name, out=buffer)
+        
+    def _read_array_into(self, key, data_start, data_type, shape, out):
+        """Read array data from the file into an existing array.
+        
+        Arguments:
+        key -- tuple of (name, block offset) for the read cache
+        data_start -- file offset of the array data
+        data_type -- numpy.dtype of the array data, in file byte order
+        shape -- (o, n, m) shape of the array
+        out -- a writeable, C-contiguous numpy.ndarray of matching shape
+        
+        Returns:
+        The out array, with values in native byte order.
+        
+        If out has a different type than the data, values are read through a
+        staging buffer of _CONVERSION_CHUNK_BYTES and converted a piece at a time.
+        
+        """
+        
+        assert isinstance(out, np.ndarray), "output must be a numpy array"
+        assert out.flags.c_contiguous and out.flags.writeable, "output array must be writeable and C-contiguous"
+        assert _squeezed_shape(out.shape) == _squeezed_shape(shape), "output array shape %s does not match %s for %s" % (out.shape, shape, key[0])
+        
+        if out.size == 0:
+            return out
+        
+        value = self._cached_value(key)
+        if value is not None:
+            np.copyto(out, np.reshape(value, out.shape), casting="unsafe")
+            return out
+        
+        self._file.seek(data_start)
+        if self._stats is not None:
+            self._stats.seeks += 1
+            self._stats.bytes_read += out.size * data_type.itemsize
+        native_type = data_type.newbyteorder("=")
+        if out.dtype == native_type:
+            # readinto avoids a temporary array
+            byte_count = self._file.readinto(out)
+            assert byte_count == out.nbytes, "unable to read all data"
+            if self._swap and out.dtype.itemsize > 1:
+                out.byteswap(True)
+            return out
+        
+        if self._conversion_buffer is None:
+            self._conversion_buffer = np.empty(_CONVERSION_CHUNK_BYTES, dtype=np.uint8)
+        staging = self._conversion_buffer.view(native_type)
+        flat_out = out.reshape(-1)
+        for start in range(0, flat_out.size, staging.size):
+            chunk = staging[:min(staging.size, flat_out.size - start)]
+            byte_count = self._file.readinto(chunk)
+            assert byte_count == chunk.nbytes, "unable to read all data"
+            if self._swap and chunk.dtype.itemsize > 1:
+                chunk.byteswap(True)
+            flat_out[start:start + chunk.size] = chunk
+        return out
     
     def dt_object_named(self, key):
         """:returns: a high-level DT object, if possible, by introspection"""
@@ -723,8 +1765,11 @@ class DTDataFile(object):
             # setting up a new file, so choose native byte order
             assert previous_offset == 0, "file is missing dtbinary header"
             self._file.write(file_header.encode())
+            if self._stats is not None:
+                self._stats.bytes_written += len(file_header)
             self._flush()
             self._length = self._file.tell()
+            self._indexed_length = self._length
             # DTDataFileStructure: long long followed by 5 ints
             # http://docs.python.org/library/struct.html
             if sys.byteorder == "little":
@@ -735,6 +1780,7 @@ class DTDataFile(object):
                 self._little_endian = False
             self._struct = Struct(format)
 
+    @_instrumented("write_string", 1)
     def _write_string(self, string, name):
         """Writes a single string to the output file.
         
@@ -767,8 +1813,72 @@ class DTDataFile(object):
         
         # update file length and variable map manually
         self._length = self._file.tell()
+        if self._stats is not None:
+            self._stats.seeks += 1
+            self._stats.bytes_written += self._length - block_start
+        self._indexed_length = self._length
         self._name_offset_map[name] = block_start
+        self._last_block_start = block_start
+        
+        # a new string may extend existing redirect chains, so resolve them again when needed
+        self._string_values[name] = bytedata.decode("utf-8") if len(bytedata) <= _MAX_INDEXED_STRING_LENGTH else None
+        self._resolved_names = None
 
+    def _read_values(self, data_type, element_count):
+        """Read array values at the current position.
+        
+        :param data_type: numpy.dtype of the values in the file
+        :param element_count: number of values to read
+        :returns: a 1D numpy.ndarray
+        
+        This reads through the file object instead of using np.fromfile, which
+        may duplicate and close the file descriptor; closing any descriptor
+        releases all of this process's fcntl locks on the file.
+        
+        """
+        
+        values = np.empty(element_count, dtype=data_type)
+        byte_count = self._file.readinto(values.view(np.uint8))
+        assert byte_count == values.nbytes, "unable to read all data"
+        return values
+        
+    def _write_values(self, array):
+        """Write array values at the current position, in C order.
+        
+        :param array: a numpy.ndarray
+        
+        This writes through the file object instead of using ndarray.tofile,
+        for the same reason as :meth:`_read_values`.  The file is flushed
+        afterwards, as tofile did, so readers see the whole array.
+        
+        """
+        
+        if array.flags.c_contiguous:
+            self._file.write(array.reshape(-1).view(np.uint8))
+        else:
+            self._write_converted_array(array, array.dtype)
+        self._file.flush()
+        
+    def _write_converted_array(self, array, data_type):
+        """Write array values to the file as another type.
+        
+        :param array: a numpy.ndarray
+        :param data_type: numpy.dtype to write, including byte order
+        
+        The array is converted in pieces of _CONVERSION_CHUNK_BYTES, so a large
+        array doesn't need a full-size converted copy.
+        
+        """
+        
+        # a buffered iterator converts in C order without copying the whole
+        # array first, even if it's not contiguous
+        chunk_size = max(1, _CONVERSION_CHUNK_BYTES // max(array.itemsize, data_type.itemsize))
+        chunks = np.nditer(array, flags=["external_loop", "buffered", "zerosize_ok"], op_dtypes=[data_type], casting="same_kind", buffersize=chunk_size, order="C")
+        for chunk in chunks:
+            # the iterator skips its buffer where it can, which may give a strided view
+            self._file.write(np.ascontiguousarray(chunk).view(np.uint8))
+        
+    @_instrumented("write_array", 1)
     def _write_array(self, array, name):
         """Write an array to the given file object.
         
@@ -822,10 +1932,60 @@ class DTDataFile(object):
             _log_warning("WARNING: 64-bit integers are unsupported by DataTank. Converting %s to 32-bit." % (name))
             array = array.view(np.int32)
 
+        # a float policy may write double arrays with less precision
+        policy = self._float_policy if self._call_float_policy is _FILE_FLOAT_POLICY else self._call_float_policy
+        policy_type = _float_policy_type(policy, name, array)
+        
+        (dt_array_type, element_size, data_type) = self._array_write_type(array.dtype if policy_type is None else policy_type)
+
+        shape = array.shape
+        m = shape[0]
+        n = shape[1] if len(shape) > 1 else 1
+        o = shape[2] if len(shape) > 2 else 1
+        
+        # Identical content is written as a string naming the first copy, but
+        # only if that's actually smaller than the array.
+        digest = None
+        byte_count = m * n * o * element_size
+        if self._dedupe and byte_count >= max(self._dedupe_min_bytes, 1):
+            digest = (dt_array_type, m, n, o, _content_digest(array))
+            original_name = self._name_by_digest.get(digest)
+            if original_name is not None and 2 * len(original_name) < byte_count and name not in self._object_names[:1]:
+                self._write_string(original_name, name)
+                self._write_string("", name + _DEDUPE_MARKER_SUFFIX)
+                # the marker isn't a variable of its own
+                self._dedupe_redirects[name] = self._name_offset_map.pop(name + _DEDUPE_MARKER_SUFFIX)
+                del self._string_values[name + _DEDUPE_MARKER_SUFFIX]
+                return
+        
+        self._write_array_header(name, dt_array_type, (m, n, o), byte_count)
+        # write the variable values as raw binary, converting if needed
+        if array.dtype == data_type:
+            self._write_values(array)
+        else:
+            self._write_converted_array(array, data_type)
+            self._file.flush()
+        
+        self._add_written_block(name, block_start)
+        if digest is not None:
+            self._name_by_digest[digest] = name
+        
+    def _array_write_type(self, dtype):
+        """Find the types for writing values of a numpy type.
+        
+        Arguments:
+        dtype -- numpy type of the values to write
+        
+        Returns:
+        (DTArray type, element size in bytes, numpy.dtype in the file's byte order)
+        
+        """
+        
         # map ndarray type to DTArray type and record element size in bytes
-        (dt_array_type, element_size) = _dtarray_type_and_size_from_object(array)
+        (dt_array_type, element_size) = _dtarray_type_and_size_from_object(np.empty(0, dtype=dtype))
+        assert dt_array_type is not None, "unknown array type: " + str(dtype)
             
-        # look up a type to pass to np.array.tofile(), mainly so we can swap bytes
+        # look up a type to write, mainly so we can swap bytes
         data_type = _type_string_from_dtarray_type(dt_array_type)
         assert data_type is not None, "unhandled DTArray type"
 
@@ -833,29 +1993,89 @@ class DTDataFile(object):
         if self._swap and data_type.endswith("1") is False:
             byte_order = "<" if self._little_endian else ">"
             data_type = byte_order + data_type
-            array = array.astype(np.dtype(data_type))
-            
-        assert dt_array_type is not None, "unknown array type: " + str(array.dtype)
-
-        shape = array.shape
-        m = shape[0]
-        n = shape[1] if len(shape) > 1 else 1
-        o = shape[2] if len(shape) > 2 else 1
+        return (dt_array_type, element_size, np.dtype(data_type))
         
-        block_length = self._struct.size + len(name) + 1 + m * n * o * element_size
-        file_struct = self._struct.pack(block_length, dt_array_type, m, n, o, len(name) + 1)
-
-        # write the header
-        self._file.write(file_struct)
-        # write the variable name
+    def _write_array_header(self, name, dt_array_type, dimensions, byte_count):
+        """Write the block header and name of an array, before its values.
+        
+        Arguments:
+        name -- the user-visible name of the array variable
+        dt_array_type -- DTArray type of the values
+        dimensions -- (m, n, o) in DataTank order
+        byte_count -- size of the values in bytes
+        
+        """
+        
+        (m, n, o) = dimensions
+        block_length = self._struct.size + len(name) + 1 + byte_count
+        self._file.write(self._struct.pack(block_length, dt_array_type, m, n, o, len(name) + 1))
         self._file.write((name + "\0").encode())
-        # write the variable values as raw binary
-        array.tofile(self._file)
         
-        # update file length and variable map manually
+    def _add_written_block(self, name, block_start):
+        """Update the file length and variable map after writing an array block."""
+        
         self._length = self._file.tell()
-        self._name_offset_map[name] = block_start  
+        if self._stats is not None:
+            self._stats.seeks += 1
+            self._stats.bytes_written += self._length - block_start
+        self._indexed_length = self._length
+        self._name_offset_map[name] = block_start
+        self._last_block_start = block_start
     
+    @_instrumented("write_array", 3)
+    def _write_array_rows(self, row_blocks, shape, dtype, name):
+        """Write an array to the file a block of rows at a time.
+        
+        Arguments:
+        row_blocks -- iterable of arrays, each with shape (rows,) + shape[1:]
+        shape -- shape of the whole array, in numpy order
+        dtype -- numpy type of the array
+        name -- the user-visible name of the array variable
+        
+        The header is written first, so the blocks are written straight to
+        the file as they're produced.  The blocks must add up to the whole
+        array; if they don't, or producing them raises an exception, the
+        partial block is truncated, so the file is left as it was.
+        
+        """
+        
+        assert name not in self._name_offset_map, "variable name already exists"
+        assert len(shape) > 0 and len(shape) <= 3, "arrays must have 1 to 3 dimensions"
+        
+        self._file.seek(0, os.SEEK_END)
+        self._check_and_write_header()
+        block_start = self._file.tell()
+        
+        (dt_array_type, element_size, data_type) = self._array_write_type(dtype)
+        
+        # same as the reversed shape in _write_array
+        m = shape[-1]
+        n = shape[-2] if len(shape) > 1 else 1
+        o = shape[-3] if len(shape) > 2 else 1
+        
+        completed = False
+        try:
+            self._write_array_header(name, dt_array_type, (m, n, o), m * n * o * element_size)
+            row_count = 0
+            for block in row_blocks:
+                block = np.asarray(block)
+                assert tuple(block.shape[1:]) == tuple(shape[1:]), "block shape %s does not match array shape %s" % (block.shape, shape)
+                if block.dtype == data_type:
+                    self._write_values(block)
+                else:
+                    self._write_converted_array(block, data_type)
+                row_count += len(block)
+            assert row_count == shape[0], "wrote %d rows of %d for %s" % (row_count, shape[0], name)
+            self._file.flush()
+            completed = True
+        finally:
+            if not completed:
+                self._file.truncate(block_start)
+                self._file.seek(block_start)
+                self._file.flush()
+        
+        self._add_written_block(name, block_start)
+        
     def _dt_write(self, obj, name, time=None, anonymous=False):
         """Wrapper that calls __dt_write__ on a compound object.
         
@@ -912,9 +2132,16 @@ class DTDataFile(object):
         
             self._write_array(np.array((time,), dtype=np.double), name + "_time")
 
-        # caller is responsible for appending _N as needed for time series
-        obj.__dt_write__(self, name)
+        # caller is responsible for appending _N as needed for time series;
+        # the outermost object's own block is never deduplicated, since it's
+        # the name that from_data_file resolves
+        self._object_names.append(name)
+        try:
+            obj.__dt_write__(self, name)
+        finally:
+            self._object_names.pop()
             
+    @_committed_write
     def write_anonymous(self, obj, name):
         """Write an object that will not be visible in DataTank.
             
@@ -949,7 +2176,7 @@ class DTDataFile(object):
             # flat list of character codes, with each string separated by a null
             for string in obj:
                 string = (string + "\0").encode("utf-8")
-                char_list += [ord(x) for x in string]
+                char_list += bytearray(string)
                 offsets.append(current_offset)
                 current_offset += len(string)
             self._write_array(np.array(offsets, dtype=np.int32), name + "_offs")
@@ -959,6 +2186,24 @@ class DTDataFile(object):
         else:
             assert False, "unhandled object type"
             
+    @_committed_write
+    def write_anonymous_rows(self, row_blocks, shape, dtype, name):
+        """Write an array that will not be visible in DataTank, a block of rows at a time.
+        
+        :param row_blocks: iterable of numpy arrays, each with shape ``(rows,) + shape[1:]``
+        :param shape: shape of the whole array, in numpy order
+        :param dtype: numpy type of the array
+        :param name: name of the variable
+        
+        This gives the same file as ``write_anonymous(np.concatenate(list(row_blocks)), name)``,
+        but only one block is in memory at a time, so a generator can read a
+        huge raster strip by strip and write it out as it goes.  The float
+        policy and dedupe options do not apply.
+        
+        """
+        self._write_array_rows(row_blocks, shape, dtype, name)
+        
+    @_committed_write
     def write_array(self, array, name, dt_type=None, time=None):
         """Write an array with optional time dependence.
 
@@ -1009,6 +2254,7 @@ class DTDataFile(object):
             assert name[-1].isdigit(), "time series names must end with a digit"
             self._write_array(np.array((time,), dtype=np.double), name + "_time")
 
+    @_committed_write
     def write_string(self, string, name, time=None):
         """Write a string with time dependence.
         
@@ -1049,13 +2295,15 @@ class DTDataFile(object):
             assert name[-1].isdigit(), "time series names must end with a digit"
             self._write_array(np.array((time,), dtype=np.double), name + "_time")
 
-    def write(self, obj, name, dt_type=None, time=None):
+    @_committed_write
+    def write(self, obj, name, dt_type=None, time=None, float_policy=_FILE_FLOAT_POLICY):
         """Write a single value to a file object by name.
         
         :param obj: string, numpy array, list, tuple, or scalar value
         :param name: user-visible name of the variable
         :param dt_type: string type used by DataTank
         :param time: time value if this variable is time-varying
+        :param float_policy: overrides the file's float policy for this call (None writes full precision)
 
         Handles various object types, and adds appropriate names so they're visible
         in DataTank.  String, scalar, ndarray, tuple, and list objects are supported,
@@ -1087,6 +2335,15 @@ class DTDataFile(object):
 
         """
         
+        if float_policy is not _FILE_FLOAT_POLICY:
+            previous_policy = self._call_float_policy
+            self._call_float_policy = _float_policy_pairs(float_policy)
+            try:
+                self.write(obj, name, dt_type=dt_type, time=time)
+            finally:
+                self._call_float_policy = previous_policy
+            return
+            
         #
         # The Obj-C programmer in me hates using isinstance here, but I'm not sure
         # what else to do, short of adding a separate write method for each data
@@ -1116,7 +2373,7 @@ class DTDataFile(object):
             # flat list of character codes, with each string separated by a null
             for string in obj:
                 string = (string + "\0").encode("utf-8")
-                char_list += [ord(x) for x in string]
+                char_list += bytearray(string)
                 offsets.append(current_offset)
                 current_offset += len(string)
             self._write_array(np.array(offsets, dtype=np.int32), name + "_offs")
@@ -5,6 +5,144 @@
 
 import numpy as np
 
+# number of cells handled at a time when finding intervals, which bounds
+# the temporary memory needed for a large mask
+_CHUNK_CELLS = 1 << 22
+
+# average interval length below which reductions gather the masked values
+# instead of reducing over each interval in place
+_MIN_REDUCE_LENGTH = 16
+
+def _intervals_from_rows(flat_mask, m, condition=None):
+    """Find the runs of masked cells in each row of a flat mask.
+    
+    :param flat_mask: 1D array of mask values, in DataTank order
+    :param m: row length
+    :param condition: function of a 2D chunk of rows, returning a boolean array of masked cells (default is nonzero)
+    :returns: N x 2 int32 array of (start, end) flat indexes, inclusive, in order
+    
+    Runs never continue from one row to the next, as in DTSource.  Rows
+    are padded with a zero at each end, so the value changes an even number
+    of times in each row, alternating between the start of a run and just
+    after its end.
+    
+    """
+    
+    if m == 0 or flat_mask.size == 0:
+        return np.zeros((0, 2), dtype=np.int32)
+        
+    rows = flat_mask.reshape((-1, m))
+    chunk_rows = max(1, _CHUNK_CELLS // (m + 2))
+    padded = np.zeros((min(chunk_rows, len(rows)), m + 2), dtype=bool)
+    starts = []
+    ends = []
+    for first_row in range(0, len(rows), chunk_rows):
+        chunk = rows[first_row:first_row + chunk_rows]
+        chunk_padded = padded[:len(chunk)]
+        if condition is None:
+            np.not_equal(chunk, 0, out=chunk_padded[:, 1:-1])
+        else:
+            chunk_padded[:, 1:-1] = condition(chunk)
+        changes = np.flatnonzero(chunk_padded[:, 1:] != chunk_padded[:, :-1])
+        
+        # positions in changes are row * (m + 1) + column, but we need row * m + column,
+        # which is the position minus the row
+        changes -= changes // (m + 1) - first_row * m
+        starts.append(changes[0::2])
+        ends.append(changes[1::2] - 1)
+            
+    # same layout as the original DTMask, which is (2, N) swapped to (N, 2)
+    intervals = np.zeros((2, sum([len(x) for x in starts])), dtype=np.int32)
+    intervals[0,:] = np.concatenate(starts)
+    intervals[1,:] = np.concatenate(ends)
+    return intervals.swapaxes(0, 1)
+
+def _expand_intervals(intervals, size):
+    """Expand an interval table to a flat boolean mask.
+    
+    :param intervals: N x 2 array of (start, end) flat indexes, inclusive
+    :param size: number of cells in the mask
+    :returns: 1D boolean array
+    
+    Each interval adds +1 at its start and -1 just past its end, so the
+    cumulative sum is 1 inside intervals and 0 elsewhere.  Intervals must
+    not overlap, but one may end just before the next starts.
+    
+    """
+    
+    markers = np.zeros(size + 1, dtype=np.int8)
+    if len(intervals):
+        markers[intervals[:, 0]] = 1
+        markers[intervals[:, 1] + 1] -= 1
+    np.cumsum(markers, out=markers)
+    return markers[:size].view(bool)
+
+def _split_rows(starts, ends, m):
+    """Split intervals that continue past the end of a row.
+    
+    :param starts: array of interval starts
+    :param ends: array of interval ends, inclusive
+    :param m: row length
+    :returns: N x 2 int32 array of intervals, none of which cross a row
+    
+    """
+    
+    first_row = starts // m
+    pieces = ends // m - first_row + 1
+    if len(pieces) and pieces.max() > 1:
+        index = np.repeat(np.arange(len(starts)), pieces)
+        # row of each piece, counting from the first row of its interval
+        row = first_row[index] + np.arange(len(index)) - np.repeat(np.cumsum(pieces) - pieces, pieces)
+        starts = np.maximum(starts[index], row * m)
+        ends = np.minimum(ends[index], row * m + m - 1)
+    
+    intervals = np.zeros((len(starts), 2), dtype=np.int32)
+    intervals[:, 0] = starts
+    intervals[:, 1] = ends
+    return intervals
+
+def _combine_intervals(interval_tables, inside, size, m):
+    """Combine interval tables with a sweep over their starts and ends.
+    
+    :param interval_tables: list of N x 2 interval arrays
+    :param inside: function of an array of coverage values, returning True where the result is masked
+    :param size: number of cells in the mask
+    :param m: row length
+    :returns: N x 2 int32 array of intervals
+    
+    Table k adds 2**k to the coverage at each start, and subtracts it
+    just past each end, so the coverage of a cell has bit k set if table
+    k masks it, as long as the intervals of a table don't overlap.  The
+    cost depends on the number of intervals, not the number of cells.
+    
+    """
+    
+    # the ends of the domain are included, so complement works
+    positions = [np.array([0, size], dtype=np.int64)]
+    deltas = [np.zeros(2, dtype=np.int64)]
+    for bit, intervals in enumerate(interval_tables):
+        intervals = np.asarray(intervals, dtype=np.int64).reshape((-1, 2))
+        positions += [intervals[:, 0], intervals[:, 1] + 1]
+        deltas += [np.repeat(1 << bit, len(intervals)), np.repeat(-(1 << bit), len(intervals))]
+    positions = np.concatenate(positions)
+    deltas = np.concatenate(deltas)
+    
+    order = np.argsort(positions, kind="mergesort")
+    positions = positions[order]
+    coverage = np.cumsum(deltas[order])
+    # the coverage after the last change at each position applies until the next position
+    last = np.append(positions[1:] != positions[:-1], True)
+    positions = positions[last]
+    masked = inside(coverage[last])
+    masked[-1] = False
+    
+    changes = np.flatnonzero(masked[1:] != masked[:-1]) + 1
+    if masked[0]:
+        changes = np.append(0, changes)
+    starts = positions[changes[0::2]]
+    ends = positions[changes[1::2]] - 1
+    return _split_rows(starts, ends, m)
+
 class DTMask(object):
     """Mask object corresponding to DataTank's DTMask.
     
@@ -18,6 +156,20 @@ class DTMask(object):
     to just use :meth:`datatank_py.DTMask.DTMask.mask_array` to
     get an array matching the logical shape of your masked object.
     
+    Masks of the same shape can be combined without expanding them, since
+    the set operations work on the intervals directly:
+    
+    >>> wet_land = land_mask & wet_mask
+    >>> region = (roi_mask - land_mask).dilate()
+    >>> print region.count()
+    
+    Statistics over the masked cells of a values array in (o, n, m)
+    order also use the intervals, so they don't need a dense mask or a
+    boolean-indexed copy of the values:
+    
+    >>> print wet_mask.mean(depth), wet_mask.max(depth)
+    >>> wet_depths = wet_mask.gather(depth)
+    
     """
     
     dt_type = ("Mask", "DTMask")
@@ -34,56 +186,27 @@ class DTMask(object):
         super(DTMask, self).__init__()
 
         # in Python order (zyx), same as a mesh values array
-        mask_values = np.array(mask_values, dtype=np.bool)
-        mask_shape = list(mask_values.shape)
+        mask_values = np.asarray(mask_values)
+        self._set_shape(mask_values.shape)
+        self._intervals = _intervals_from_rows(mask_values.reshape(-1), self._m)
+        
+        # expanded views of the intervals, created when needed
+        self._dense = None
+        self._bitset = None
+        self._flat_index = None
+        
+    def _set_shape(self, shape):
+        """Set the dimensions from the shape of an array in Python order"""
         
         # switch to DataTank order for indexing compatibility
+        mask_shape = list(shape)
         mask_shape.reverse()
-        mask_values = mask_values.reshape(mask_shape)
         
         # set nonexistent dims to unity for compatibility with DataTank
-        self._m = mask_shape[0]
+        self._m = mask_shape[0] if len(mask_shape) > 0 else 1
         self._n = mask_shape[1] if len(mask_shape) > 1 else 1
         self._o = mask_shape[2] if len(mask_shape) > 2 else 1
         
-        m = self._m
-        n = self._n
-        o = self._o
-        
-        # This costs us some memory, but it's a big gain for large masks
-        # since the iteration/comparison of numpy arrays is really slow,
-        # and it seems to spend a lot of time in PyObject_HashNotImplemented.
-        flat_mask = mask_values.flatten().tolist()
-        iv0 = []
-        iv1 = []
-        location = 0
-        for k in xrange(o):
-            for j in xrange(n):
-                ijk = j * m + k * n * m
-                until = ijk + m
-                while ijk < until:
-                    # find the first entry that contains a zero
-                    while ijk < until and flat_mask[ijk] == 0:
-                        ijk += 1
-                    start = ijk
-                    if ijk < until:
-                        # look for the end
-                        while ijk < until and flat_mask[ijk] != 0:
-                            ijk += 1
-                        
-                        iv0.append(start)
-                        iv1.append(ijk - 1)
-                        location += 1       
-        
-        if len(iv0):
-            self._intervals = np.zeros((2, len(iv0)), dtype=np.int32)
-            self._intervals[0,:] = iv0
-            self._intervals[1,:] = iv1
-        else:
-            self._intervals = np.zeros((2, 0), dtype=np.int32)
-        # row/column mismatch (remember that intervals is always 2 x N)
-        self._intervals = self._intervals.swapaxes(0, 1)
-        
     def __dt_type__(self):
         # ??? not sure if this is correct
         return "Mask"
@@ -111,20 +234,248 @@ class DTMask(object):
         datafile.write_anonymous(np.array(dims, dtype=np.int32), name + "_dim")
         datafile.write_anonymous(self._intervals, name)
         
-    def mask_array(self):
-        """Returns a full uint8 mask array in the original mask shape"""
+    def _shape(self):
+        """:returns: shape of the mask in Python order, as passed to __init__"""
         dims = [self._m, self._n]
         if self._o > 1:
             dims.append(self._o)
-        mask_array = np.zeros(dims, dtype=np.uint8).flatten()
-        if len(mask_array) == 0:
-            return mask_array.reshape(dims)
-        for start, end in zip(self._intervals[:,0], self._intervals[:,1]):
-            for j in xrange(start,end + 1):
-                mask_array[j] = True
-
         dims.reverse()
-        return mask_array.reshape(dims)
+        return tuple(dims)
+        
+    def dense(self):
+        """:returns: read-only boolean array in the original mask shape
+        
+        This is computed once and kept, so it's cheap to call repeatedly.
+        Call :meth:`invalidate` if you change the intervals directly.
+        
+        """
+        
+        if self._dense is None:
+            dense = _expand_intervals(self._intervals, self._m * self._n * self._o).reshape(self._shape())
+            dense.flags.writeable = False
+            self._dense = dense
+        return self._dense
+        
+    def dense_rows(self, start, stop):
+        """:returns: boolean array of rows start to stop of a 2D mask, the same as ``dense()[start:stop]``
+        
+        Only the intervals in those rows are expanded, so this is a way to
+        go through a large mask a block of rows at a time.
+        
+        """
+        
+        assert self._o == 1, "rows are only defined for a 2D mask"
+        (start, stop) = (max(0, min(start, self._n)), max(0, min(stop, self._n)))
+        stop = max(start, stop)
+        (first, last) = (start * self._m, stop * self._m)
+        # intervals don't cross rows, so these are the ones that start in the rows
+        intervals = np.asarray(self._intervals).reshape((-1, 2))
+        (begin, end) = np.searchsorted(intervals[:, 0], (first, last))
+        return _expand_intervals(intervals[begin:end] - first, last - first).reshape((stop - start, self._m))
+        
+    def bitset(self):
+        """:returns: read-only ``np.packbits`` of the flattened :meth:`dense` array
+        
+        This uses one bit per cell, which is handy for keeping many masks
+        around.  Use ``np.unpackbits(bitset)[:size]`` to get the cells back.
+        
+        """
+        
+        if self._bitset is None:
+            bitset = np.packbits(self.dense().reshape(-1))
+            bitset.flags.writeable = False
+            self._bitset = bitset
+        return self._bitset
+        
+    def invalidate(self):
+        """Discard the cached :meth:`dense` and :meth:`bitset` arrays, and the index used by :meth:`gather`."""
+        self._dense = None
+        self._bitset = None
+        self._flat_index = None
+        
+    def mask_array(self):
+        """Returns a full uint8 mask array in the original mask shape"""
+        return self.dense().astype(np.uint8)
+        
+    def count(self):
+        """:returns: number of masked cells"""
+        intervals = np.asarray(self._intervals, dtype=np.int64)
+        return int(np.sum(intervals[:, 1] - intervals[:, 0] + 1))
+        
+    def _flat_values(self, values):
+        """:returns: values as a 1D array, which must have the shape of the mask in Python order"""
+        values = np.asarray(values)
+        assert values.size == self._m * self._n * self._o, "values must have the same number of elements as the mask"
+        return values.reshape(-1)
+        
+    def flat_index(self):
+        """:returns: read-only array of the flat index of each masked cell, in order
+        
+        This is computed once and kept, like :meth:`dense`.
+        
+        """
+        
+        if self._flat_index is None:
+            intervals = np.asarray(self._intervals, dtype=np.int64).reshape((-1, 2))
+            lengths = intervals[:, 1] - intervals[:, 0] + 1
+            # each cell is its position among the masked cells, plus the cells skipped before its interval
+            skipped = intervals[:, 0] - (np.cumsum(lengths) - lengths)
+            index_type = np.int32 if self._m * self._n * self._o < 2 ** 31 else np.int64
+            flat_index = (np.repeat(skipped, lengths) + np.arange(np.sum(lengths))).astype(index_type)
+            flat_index.flags.writeable = False
+            self._flat_index = flat_index
+        return self._flat_index
+        
+    def gather(self, values):
+        """Get the values of the masked cells.
+        
+        :param values: array with the shape of the mask, such as (n, m) or (o, n, m)
+        :returns: 1D array of the masked values, in the order of the cells
+        
+        This is the same as ``values[mask.dense()]``, without the dense mask.
+        
+        """
+        return self._flat_values(values)[self.flat_index()]
+        
+    def scatter(self, values, fill=0):
+        """Put values into the masked cells of a new array.
+        
+        :param values: 1D array with a value for each masked cell, as from :meth:`gather`
+        :param fill: value of the cells that are not masked
+        :returns: array with the shape of the mask, and the type of values
+        
+        """
+        
+        values = np.asarray(values)
+        assert values.size == self.count(), "values must have one element per masked cell"
+        result = np.empty(self._m * self._n * self._o, dtype=values.dtype)
+        result.fill(fill)
+        result[self.flat_index()] = values.reshape(-1)
+        return result.reshape(self._shape())
+        
+    def _reduce(self, ufunc, values, dtype=None):
+        """:returns: ufunc.reduceat over each interval, giving one value per interval"""
+        
+        flat_values = self._flat_values(values)
+        intervals = np.asarray(self._intervals, dtype=np.int64).reshape((-1, 2))
+        # reduceat has some overhead per interval, so gathering is faster for short ones
+        if self.count() < _MIN_REDUCE_LENGTH * len(intervals):
+            return np.atleast_1d(ufunc.reduce(flat_values[self.flat_index()], dtype=dtype))
+        # reduceat over [start, end + 1, next start, ...] alternates between intervals and
+        # the gaps between them; the last interval runs to the end if there's no gap after it
+        boundaries = np.column_stack((intervals[:, 0], intervals[:, 1] + 1)).reshape(-1)
+        if boundaries[-1] == flat_values.size:
+            boundaries = boundaries[:-1]
+        return ufunc.reduceat(flat_values, boundaries, dtype=dtype)[0::2]
+        
+    def sum(self, values, dtype=None):
+        """:returns: sum of the masked values, with values as for :meth:`gather`"""
+        if len(self._intervals) == 0:
+            return np.zeros(1, dtype=np.asarray(values).dtype if dtype is None else dtype)[0]
+        return np.sum(self._reduce(np.add, values, dtype), dtype=dtype)
+        
+    def mean(self, values):
+        """:returns: mean of the masked values, with values as for :meth:`gather`"""
+        assert len(self._intervals), "mean of an empty mask"
+        return self.sum(values, dtype=np.double) / self.count()
+        
+    def min(self, values):
+        """:returns: minimum of the masked values, with values as for :meth:`gather`"""
+        assert len(self._intervals), "minimum of an empty mask"
+        return np.min(self._reduce(np.minimum, values))
+        
+    def max(self, values):
+        """:returns: maximum of the masked values, with values as for :meth:`gather`"""
+        assert len(self._intervals), "maximum of an empty mask"
+        return np.max(self._reduce(np.maximum, values))
+        
+    def _with_intervals(self, intervals):
+        """:returns: a new DTMask with the same shape and the given intervals"""
+        mask = DTMask(np.array([]))
+        mask._intervals = intervals
+        mask._m = self._m
+        mask._n = self._n
+        mask._o = self._o
+        return mask
+        
+    def _combine(self, other, inside):
+        assert (self._m, self._n, self._o) == (other._m, other._n, other._o), "masks must have the same shape"
+        return self._with_intervals(_combine_intervals((self._intervals, other._intervals), inside, self._m * self._n * self._o, self._m))
+        
+    def union(self, other):
+        """:returns: a DTMask of cells in either mask, which must have the same shape"""
+        return self._combine(other, lambda coverage: coverage != 0)
+        
+    def intersection(self, other):
+        """:returns: a DTMask of cells in both masks, which must have the same shape"""
+        return self._combine(other, lambda coverage: coverage == 3)
+        
+    def difference(self, other):
+        """:returns: a DTMask of cells in this mask but not in other, which must have the same shape"""
+        return self._combine(other, lambda coverage: coverage == 1)
+        
+    def complement(self):
+        """:returns: a DTMask of cells that are not in this mask"""
+        return self._with_intervals(_combine_intervals((self._intervals,), lambda coverage: coverage == 0, self._m * self._n * self._o, self._m))
+        
+    def dilate(self):
+        """:returns: a DTMask with each interval grown by one cell at each end, within its row"""
+        
+        intervals = np.asarray(self._intervals, dtype=np.int64).reshape((-1, 2))
+        row_starts = intervals[:, 0] - intervals[:, 0] % self._m
+        dilated = np.column_stack((np.maximum(intervals[:, 0] - 1, row_starts), np.minimum(intervals[:, 1] + 1, row_starts + self._m - 1)))
+        # dilated intervals in a row may now overlap, so merge them
+        return self._with_intervals(_combine_intervals((dilated,), lambda coverage: coverage != 0, self._m * self._n * self._o, self._m))
+        
+    def __or__(self, other):
+        return self.union(other)
+        
+    def __and__(self, other):
+        return self.intersection(other)
+        
+    def __sub__(self, other):
+        return self.difference(other)
+        
+    def __invert__(self):
+        return self.complement()
+        
+    @classmethod
+    def from_condition(self, values, nodata=None, nan=True, predicate=None):
+        """Create a mask of the valid cells of a values array.
+        
+        :param values: array of values, such as mesh values or a raster band
+        :param nodata: cells with this value are not masked
+        :param nan: NaN cells are not masked (default is `True`)
+        :param predicate: function of an array of values, returning True for cells that may be masked
+        :returns: a :class:`datatank_py.DTMask.DTMask` with the shape of values
+        
+        A cell is masked if it passes all of the tests.  This is the same as
+        creating a DTMask from a boolean array such as ``values != nodata``,
+        but the tests are done on a few rows at a time, so no full-size
+        temporary arrays are needed.  A NaN nodata value masks out NaN cells.
+        
+        >>> mask = DTMask.from_condition(elevation, nodata=-9999, predicate=lambda x: x > 0)
+        
+        """
+        
+        values = np.asarray(values)
+        if nodata is not None and nodata != nodata:
+            (nodata, nan) = (None, True)
+        # NaN only exists in floating point arrays
+        nan = nan and values.dtype.kind in "fc"
+            
+        def condition(chunk):
+            valid = np.ones(chunk.shape, dtype=bool) if predicate is None else np.asarray(predicate(chunk), dtype=bool)
+            if nodata is not None:
+                valid &= chunk != nodata
+            if nan:
+                valid &= ~np.isnan(chunk)
+            return valid
+        
+        mask = DTMask(np.array([]))
+        mask._set_shape(values.shape)
+        mask._intervals = _intervals_from_rows(values.reshape(-1), mask._m, condition)
+        return mask
         
     @classmethod
     def from_data_file(self, datafile, name):
@@ -133,7 +484,7 @@ class DTMask(object):
         intervals = datafile[name]
                 
         # return None if there is no mask
-        if intervals == None or len(intervals) == 0:
+        if intervals is None or len(intervals) == 0:
             return None
         
         intervals = np.squeeze(intervals)    
@@ -142,9 +493,10 @@ class DTMask(object):
         dims = np.squeeze(dims)
             
         # ensure that the list has at least 3 elements (we access only 0,1,2)
-        dims = dims.tolist() + [0, 0, 0]
+        dims = dims.tolist() + [1, 1, 1]
         mask = DTMask(np.array([]))
-        mask._intervals = intervals
+        # a single interval is squeezed to a 1D array
+        mask._intervals = intervals.reshape((-1, 2))
         mask._m = dims[0]
         mask._n = dims[1]
         mask._o = dims[2]
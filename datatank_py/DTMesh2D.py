@@ -5,6 +5,7 @@
 
 import numpy as np
 from datatank_py.DTMask import DTMask
+from datatank_py.DTRaster import _DTPyramidLevels, _decimated_grid, _pyramid_level_count, _row_blocks, _write_geotiff
 
 class DTMesh2D(object):
     """2D Mesh object.
@@ -33,7 +34,7 @@ class DTMesh2D(object):
             values = values.astype(np.float32)
             
         self._values = values
-        self._grid = grid if grid != None else (0, 0, 1, 1)
+        self._grid = grid if grid is not None else (0, 0, 1, 1)
         self._mask = mask
         
         # N dimension: spatial X
@@ -81,6 +82,13 @@ class DTMesh2D(object):
         """:returns: a :class:`datatank_py.DTMask.DTMask` instance or None"""
         return self._mask
     
+    def _mask_rows(self, start, stop):
+        """:returns: boolean array of rows start to stop of the mask, which is a DTMask or an array of ones and zeroes"""
+        if isinstance(self._mask, DTMask):
+            # only the intervals in these rows are expanded
+            return self._mask.dense_rows(start, stop)
+        return np.asarray(self._mask[start:stop]) != 0
+    
     def __dt_type__(self):
         return "2D Mesh"
         
@@ -105,19 +113,97 @@ class DTMesh2D(object):
 
         datafile.write_anonymous(bbox, name + "_bbox2D")
         datafile.write_anonymous(self._grid, name + "_loc")
-        if self._mask != None:
-            datafile.write_anonymous(self._mask, name + "_dom")
+        if self._mask is not None:
+            mask = self._mask if isinstance(self._mask, DTMask) else DTMask(np.asarray(self._mask) != 0)
+            datafile.write_anonymous(mask, name + "_dom")
         datafile.write_anonymous(self._values, name)
+        
+    def write_pyramid(self, datafile, name, levels=None):
+        """Write the mesh at full and reduced resolutions.
+        
+        :param datafile: an open DTDataFile instance
+        :param name: base name of the levels
+        :param levels: number of levels, including full resolution (default is to stop at 256 values across)
+        :returns: list of the names written
+        
+        Each level is written as a separate 2D Mesh named "name_L0",
+        "name_L1", and so on, where level 0 is this mesh and each level after
+        it is the mean of 2x2 blocks of the level before.  Each node of a
+        reduced level is at the center of the nodes it replaces, and an odd
+        last row or column is dropped.  If the mesh has a mask, each level
+        is the mean of the masked values only, and is masked to the blocks
+        that have any.  There can't be more levels than it takes to get
+        down to a single row or column.
+        
+        >>> mesh.write_pyramid(datafile, "Depth")
+        ['Depth_L0', 'Depth_L1', 'Depth_L2']
+        
+        """
+        
+        levels = _pyramid_level_count(self._values.shape) if levels is None else levels
+        assert levels >= 1 and levels <= _pyramid_level_count(self._values.shape, min_size=1), "%d levels requested for a %d x %d mesh" % ((levels,) + self._values.shape)
+        names = [name + "_L0"]
+        datafile.write(self, names[0])
+        if levels < 2:
+            return names
+            
+        pyramid = _DTPyramidLevels(self._values.shape, self._values.dtype, masked=self._mask is not None)
+        start = 0
+        for rows in _row_blocks(self._values):
+            pyramid.add_rows(rows, None if self._mask is None else self._mask_rows(start, start + len(rows)))
+            start += len(rows)
+            
+        grid = self._grid
+        for index, (values, valid) in enumerate(pyramid.levels(levels - 1)):
+            grid = _decimated_grid(grid)
+            names.append("%s_L%d" % (name, index + 1))
+            datafile.write(DTMesh2D(values, grid=grid, mask=None if valid is None else DTMask(valid)), names[-1])
+        return names
+
+    def write_geotiff(self, output_path, projection_name=None, creation_options=None, nodata=None):
+        """Save the mesh as a single-band floating point GeoTIFF file.
+        
+        :param output_path: a file path; all parent directories must exist
+        :param projection_name: the spatial reference system to associate with the mesh, such as `EPSG:4326`
+        :param creation_options: dictionary of GTiff creation options
+        :param nodata: value written outside the mask, and marked as NODATA
+        
+        **Requires GDAL**
+        
+        The file is written a strip at a time without copying the mesh, so
+        large meshes can be saved with creation options such as:
+        
+        >>> mesh.write_geotiff("Depth.tiff", "EPSG:32615", {"TILED":"YES", "COMPRESS":"DEFLATE", "PREDICTOR":3, "NUM_THREADS":"ALL_CPUS"})
+        
+        The band is Float32 or Float64 to match the values.  A mesh with a
+        mask requires a nodata value.
+        
+        """
+        
+        from osgeo.gdalconst import GDT_Float32, GDT_Float64
+        
+        etype = GDT_Float32 if self._values.dtype == np.float32 else GDT_Float64
+        values = self._values if self._values.dtype in (np.float32, np.float64) else self._values.astype(np.float64)
+        
+        if self._mask is not None:
+            assert nodata is not None, "a nodata value is required to save a mesh with a mask"
+            rows = lambda y0, height: np.where(self._mask_rows(y0, y0 + height), values[y0:y0 + height], nodata).astype(values.dtype)
+        else:
+            rows = lambda y0, height: values[y0:y0 + height]
+            
+        raster_size = (values.shape[1], values.shape[0])
+        _write_geotiff(output_path, raster_size, self._grid, projection_name, etype, [rows], creation_options, nodata)
 
     @classmethod
     def from_data_file(self, datafile, name):
         
-        values = np.squeeze(datafile[name])
+        values = datafile[name]
+        assert values is not None, "Mesh %s not found in data file" % (name)
+        values = np.squeeze(values)
         grid = np.squeeze(datafile[name + "_loc"])
         # TODO: make sure this is correct; should be writing a packed array instead in __dt_write__?
         mask = DTMask.from_data_file(datafile, name + "_dom")
-        if mask != None:
+        if mask is not None:
             mask = mask.mask_array()
-        assert values != None, "Mesh %s not found in data file" % (name)
         return DTMesh2D(values, grid=grid, mask=mask)
 
@@ -0,0 +1,187 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# This software is under a BSD license.  See LICENSE.txt for details.
+
+"""Time series that continue across several .dtbin files.
+
+Long runs are often saved as a file per day or per batch, each with its
+own numbered steps.  DTMultiFileSeries reads them as one series, opening
+one file at a time.
+
+"""
+
+__all__ = ["DTMultiFileSeries"]
+
+import re
+import numpy as np
+from datatank_py.DTDataFile import DTDataFile
+
+class DTMultiFileSeries(object):
+    """A time series that continues across several .dtbin files.
+
+    Operational runs often write a file per day, each containing "Depth_0"
+    through "Depth_N" for that day.  This presents the steps of all files as
+    one series with a global index, without copying them into one big file:
+
+    >>> series = DTMultiFileSeries(["day1.dtbin", "day2.dtbin", "day3.dtbin"], "Depth")
+    >>> print len(series), series.times()[-1]
+    >>> print series.location(30)
+    ('/data/day2.dtbin', 'Depth_6')
+    >>> for time, depth in series:
+    ...     print time, depth.max()
+
+    Only one file is open at a time, so iterating streams through the files
+    in order.  Reading a range of steps into a single array is done with
+    :meth:`read_stacked`.
+
+    """
+
+    def __init__(self, file_paths, name):
+        """
+        :param file_paths: ordered list of .dtbin file paths
+        :param name: base name of the series, such as "Depth" for "Depth_0", "Depth_1", …
+
+        Each file is opened to find the steps of the series and read their
+        time values, which must be strictly increasing across all of the
+        files.
+
+        """
+
+        super(DTMultiFileSeries, self).__init__()
+
+        self._name = name
+        # global index --> (file path, local name)
+        self._locations = []
+        self._times = []
+        # Seq_ type of the series, from the first file with any steps
+        self._dt_type = None
+
+        step_pattern = re.compile("^%s_([0-9]+)$" % (re.escape(name)))
+        for file_path in file_paths:
+            with DTDataFile(file_path, readonly=True) as datafile:
+                steps = []
+                for variable_name in datafile.variable_names():
+                    match = step_pattern.match(variable_name)
+                    if match is not None and variable_name + "_time" in datafile:
+                        steps.append((int(match.group(1)), variable_name))
+                steps.sort()
+
+                if len(steps) and self._dt_type is None:
+                    self._dt_type = datafile["Seq_" + name]
+
+                for time_index, local_name in steps:
+                    time = datafile[local_name + "_time"]
+                    if len(self._times):
+                        assert time > self._times[-1], "time must be strictly increasing (%s in %s follows %s in %s)" % (local_name, file_path, self._locations[-1][1], self._locations[-1][0])
+                    self._locations.append((datafile.path(), local_name))
+                    self._times.append(time)
+
+        # the file currently open for reading
+        self._datafile = None
+
+    def name(self):
+        """:returns: base name of the series"""
+        return self._name
+
+    def dt_type(self):
+        """:returns: DataTank type of the series, such as "2D Mesh", or None if it has no steps"""
+        return self._dt_type
+
+    def times(self):
+        """:returns: array of time values for all steps"""
+        return np.array(self._times, dtype=np.double)
+
+    def location(self, index):
+        """Find where a step is stored.
+
+        :param index: global index of the step
+        :returns: tuple (absolute file path, local variable name)
+
+        """
+        return self._locations[index]
+
+    def _open(self, file_path):
+        """:returns: a DTDataFile for file_path, closing the previous one"""
+
+        if self._datafile is None or self._datafile.path() != file_path:
+            self.close()
+            self._datafile = DTDataFile(file_path, readonly=True)
+        return self._datafile
+
+    def read(self, index, dtype=None, out=None, dt_object=False):
+        """Read one step of the series.
+
+        :param index: global index of the step
+        :param dtype: numpy type to convert an array to as it is read
+        :param out: existing array to read an array into (see :meth:`datatank_py.DTDataFile.DTDataFile.read_into`)
+        :param dt_object: return a compound object such as DTMesh2D, using the type of the series
+        :returns: the value of the step
+
+        """
+
+        (file_path, local_name) = self._locations[index]
+        datafile = self._open(file_path)
+        if dt_object:
+            from datatank_py.DTDataFile import _class_for_dt_type
+            dt_cls = _class_for_dt_type(self._dt_type)
+            assert dt_cls is not None, "No class is registered for %s" % (self._dt_type)
+            return dt_cls.from_data_file(datafile, local_name)
+        return datafile.variable_named(local_name, out=out, dtype=dtype)
+
+    def read_stacked(self, start=0, stop=None, dtype=None):
+        """Read a range of array steps into a single array.
+
+        :param start: global index of the first step
+        :param stop: global index after the last step (default is the end of the series)
+        :param dtype: numpy type of the result (default is the type of the first step)
+        :returns: array with shape (steps,) + the squeezed shape of each step
+
+        Every step in the range must be an array with the same shape, and a
+        series of numbers gives an array with shape (steps,).  The shape and
+        type of the result come from the file index, and each step is read
+        directly into its slot in the result, without a temporary copy.
+
+        """
+
+        indexes = range(*slice(start, stop).indices(len(self)))
+        assert len(indexes), "no steps in range"
+
+        (file_path, local_name) = self._locations[indexes[0]]
+        location = self._open(file_path)._array_location(local_name)
+        assert location is not None, "%s is missing from %s" % (local_name, file_path)
+        (data_start, data_type, shape) = location
+        stacked = np.empty((len(indexes),) + tuple([size for size in shape if size != 1]), dtype=dtype if dtype is not None else data_type.newbyteorder("="))
+        for position, index in enumerate(indexes):
+            # a 0-d view for a number, which indexing alone would copy to a scalar
+            self.read(index, out=stacked[position, ...])
+        return stacked
+
+    def close(self):
+        """Close the file currently open for reading."""
+        if self._datafile is not None:
+            self._datafile.close()
+            self._datafile = None
+
+    def __len__(self):
+        return len(self._locations)
+
+    def __getitem__(self, index):
+        return self.read(index)
+
+    def __iter__(self):
+        # (time, value) for each step, reading files in order
+        for index in range(len(self)):
+            yield (self._times[index], self.read(index))
+
+    def __enter__(self):
+        # support for with statement
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        # support for with statement
+        self.close()
+        return False
+
+    def __str__(self):
+        return "DTMultiFileSeries(%s): %d steps in %d files" % (self._name, len(self), len(set([location[0] for location in self._locations])))
@@ -22,7 +22,7 @@ class DTProgress(object):
         super(DTProgress, self).__init__()
         self._current_length = 0
         # save this in case a client changes CWD
-        self._path = os.path.join(os.getcwdu(), "DTProgress")
+        self._path = os.path.join(getattr(os, "getcwdu", os.getcwd)(), "DTProgress")
         
     def update_percentage(self, percent):
         """Updates the progress indicator if needed.
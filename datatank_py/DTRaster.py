@@ -0,0 +1,217 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# This software is under a BSD license.  See LICENSE.txt for details.
+
+# Helpers shared by DTMesh2D and DTBitmap2D for writing large rasters a
+# block of rows at a time: pyramid levels and strip-wise GeoTIFF output.
+# Rows are counted from the bottom, as in DataTank.
+
+import sys
+import numpy as np
+
+# approximate number of values decimated at a time when writing a pyramid
+_PYRAMID_BLOCK_CELLS = 1 << 22
+
+# default pyramids stop at the first level with both dimensions this small
+_PYRAMID_MIN_SIZE = 256
+
+def _pyramid_level_count(shape, min_size=_PYRAMID_MIN_SIZE):
+    """:returns: number of pyramid levels for a 2D shape, including full resolution, or the most possible with min_size=1"""
+    (rows, columns) = shape
+    count = 1
+    while max(rows, columns) > min_size and min(rows, columns) >= 2:
+        (rows, columns) = (rows // 2, columns // 2)
+        count += 1
+    return count
+
+def _decimated_grid(grid, centered=True):
+    """:returns: grid of a 2x decimated level, with each node at the center of the four it replaces, or at the same corner if not centered"""
+    (xmin, ymin, dx, dy) = [float(x) for x in grid]
+    if not centered:
+        return (xmin, ymin, 2 * dx, 2 * dy)
+    return (xmin + 0.5 * dx, ymin + 0.5 * dy, 2 * dx, 2 * dy)
+
+def _row_blocks(values):
+    """:returns: generator of blocks of an even number of rows of a 2D array"""
+    rows = max(2, _PYRAMID_BLOCK_CELLS // max(1, values.shape[1]) // 2 * 2)
+    for start in range(0, values.shape[0], rows):
+        yield values[start:start + rows]
+
+def _decimate(values, method):
+    """Reduce each 2x2 block of a 2D array to one value, dropping an odd last row or column.
+    
+    :param values: 2D array
+    :param method: "mean", or "mode" for the most common value of each block
+    :returns: array with half the rows and columns, and the same type
+    
+    The mean is rounded for integer arrays.  Ties in the mode go to the
+    first value of the block.
+    
+    """
+    
+    (rows, columns) = (values.shape[0] // 2 * 2, values.shape[1] // 2 * 2)
+    a = values[0:rows:2, 0:columns:2]
+    b = values[0:rows:2, 1:columns:2]
+    c = values[1:rows:2, 0:columns:2]
+    d = values[1:rows:2, 1:columns:2]
+    if method == "mode":
+        return np.where((a == b) | (a == c) | (a == d), a, np.where((b == c) | (b == d), b, np.where(c == d, c, a)))
+    assert method == "mean", "unknown decimation method %s" % (method)
+    if values.dtype.kind == "f":
+        return (a + b + c + d) * values.dtype.type(0.25)
+    total = a.astype(np.int64) + b + c + d
+    total += 2
+    total //= 4
+    return total.astype(values.dtype)
+
+def _decimate_masked(values, valid):
+    """Average the valid values of each 2x2 block of a 2D array, as for :func:`_decimate`.
+    
+    :param values: 2D array
+    :param valid: boolean array with the shape of values
+    :returns: (decimated values, boolean array of the blocks with any valid value)
+    
+    Blocks with no valid values are zero.
+    
+    """
+    
+    (rows, columns) = (values.shape[0] // 2 * 2, values.shape[1] // 2 * 2)
+    total = np.zeros((rows // 2, columns // 2), dtype=np.float64)
+    count = np.zeros(total.shape, dtype=np.int8)
+    for (row, column) in ((0, 0), (0, 1), (1, 0), (1, 1)):
+        block_valid = valid[row:rows:2, column:columns:2]
+        total += np.where(block_valid, values[row:rows:2, column:columns:2], 0)
+        count += block_valid
+    total /= np.maximum(count, 1)
+    if values.dtype.kind != "f":
+        total = np.floor(total + 0.5)
+    return (total.astype(values.dtype), count > 0)
+
+class _DTPyramidLevels(object):
+    """Builds the 2x decimated levels of a 2D array from its rows, in one pass.
+    
+    Level 1 is kept in memory as rows are added, and each level after that
+    is decimated from the one before it.  With masked=True, each block of
+    rows comes with a boolean array of its valid cells, and the levels are
+    the mean of the valid values, as for :func:`_decimate_masked`.
+    
+    """
+    
+    def __init__(self, shape, dtype, method="mean", masked=False):
+        super(_DTPyramidLevels, self).__init__()
+        assert method == "mean" or not masked, "masked pyramids only support the mean"
+        self._method = method
+        self._level = np.empty((shape[0] // 2, shape[1] // 2), dtype=dtype)
+        self._valid = np.empty(self._level.shape, dtype=bool) if masked else None
+        self._row = 0
+        # an odd row left over from the previous block, and its valid cells
+        self._carry = None
+        self._valid_carry = None
+        
+    def add_rows(self, rows, valid=None):
+        """Add the next block of rows of the full resolution array, and its valid cells if masked."""
+        assert (valid is None) == (self._valid is None), "valid cells must be given for a masked pyramid, and only then"
+        if self._carry is not None:
+            rows = np.concatenate((self._carry, rows))
+            valid = None if valid is None else np.concatenate((self._valid_carry, valid))
+            self._carry = None
+        count = min(rows.shape[0] // 2, self._level.shape[0] - self._row)
+        if rows.shape[0] > 2 * count:
+            self._carry = np.array(rows[2 * count:])
+            self._valid_carry = None if valid is None else np.array(valid[2 * count:])
+        if count > 0:
+            if valid is None:
+                self._level[self._row:self._row + count] = _decimate(rows[:2 * count], self._method)
+            else:
+                (self._level[self._row:self._row + count], self._valid[self._row:self._row + count]) = _decimate_masked(rows[:2 * count], valid[:2 * count])
+            self._row += count
+            
+    def passing(self, row_blocks):
+        """:returns: generator that adds each block of row_blocks and yields it unchanged"""
+        for rows in row_blocks:
+            self.add_rows(rows)
+            yield rows
+            
+    def levels(self, count):
+        """:returns: generator of (level array, valid cells or None) tuples, starting with level 1, for count levels"""
+        assert self._row == self._level.shape[0], "only %d of %d rows were added" % (2 * self._row, 2 * self._level.shape[0])
+        (level, valid) = (self._level, self._valid)
+        for index in range(count):
+            if index > 0 and valid is None:
+                level = _decimate(level, self._method)
+            elif index > 0:
+                (level, valid) = _decimate_masked(level, valid)
+            yield (level, valid)
+
+# approximate number of pixels written at a time to a GeoTIFF
+_GEOTIFF_STRIP_PIXELS = 1 << 22
+
+def _write_geotiff(output_path, raster_size, grid, projection_name, etype, bands, creation_options=None, nodata=None):
+    """Create a GeoTIFF file and write its bands a strip at a time.
+    
+    :param output_path: a file path; all parent directories must exist
+    :param raster_size: size in pixels, as `(horizontal, vertical)`
+    :param grid: (xmin, ymin, dx, dy), for rows ordered from the bottom up as in DataTank
+    :param projection_name: spatial reference recognized by GDAL, or None
+    :param etype: GDAL data type of the bands
+    :param bands: list of functions that return rows y0 to y0 + height of a band, given (y0, height)
+    :param creation_options: dictionary of GTiff creation options
+    :param nodata: NODATA value of each band, or None
+    
+    Each strip is a whole number of blocks of the file, so tiled and
+    compressed files are written a block at a time.  BIGTIFF is IF_SAFER
+    unless creation_options says otherwise.
+    
+    """
+    
+    from osgeo import gdal, osr
+    
+    # throw instead of printing to stderr
+    gdal.UseExceptions()
+    osr.UseExceptions()
+    
+    # gdal doesn't like unicode objects with Python 2
+    if not isinstance(output_path, str):
+        output_path = output_path.encode(sys.getfilesystemencoding())
+        
+    options = {"BIGTIFF":"IF_SAFER"}
+    if creation_options is not None:
+        options.update(creation_options)
+    options = ["%s=%s" % (key, value) for key, value in sorted(options.items())]
+        
+    (raster_x, raster_y) = raster_size
+    (xmin, ymin, dx, dy) = grid
+    ymax = ymin + abs(dy) * raster_y
+    
+    dst = gdal.GetDriverByName("GTiff").Create(output_path, raster_x, raster_y, len(bands), etype, options)
+    assert dst, "Unable to create destination dataset at %s" % (output_path)
+    
+    # Recall that dx and dy are signed, with positive upwards;
+    # this is bizarre, but http://www.gdal.org/gdal_tutorial.html
+    # shows it also.
+    dst.SetGeoTransform((xmin, dx, 0, ymax, 0, -abs(dy)))
+    if projection_name is not None:
+        if not isinstance(projection_name, str):
+            projection_name = projection_name.encode("utf-8")
+        # This accepts a variety of inputs, notably EPSG and PROJ.4,
+        # as well as NAD27, NAD83, WGS84, WGS72.
+        dst_srs = osr.SpatialReference()
+        dst_srs.SetFromUserInput(projection_name)
+        dst.SetProjection(dst_srs.ExportToWkt())
+        
+    for band_index, rows in enumerate(bands):
+        band = dst.GetRasterBand(band_index + 1)
+        if nodata is not None:
+            band.SetNoDataValue(nodata)
+        (block_x, block_y) = band.GetBlockSize()
+        strip_height = block_y * max(1, _GEOTIFF_STRIP_PIXELS // (raster_x * block_y))
+        for gdal_y in range(0, raster_y, strip_height):
+            height = min(strip_height, raster_y - gdal_y)
+            # GDAL rows start at the top, so flip a view of the matching rows;
+            # only this strip is copied, in case the bindings need positive strides
+            strip = rows(raster_y - gdal_y - height, height)[::-1]
+            band.WriteArray(np.ascontiguousarray(strip), 0, gdal_y)
+            
+    # closing the dataset flushes it to disk
+    dst = None
@@ -73,7 +73,7 @@ class DTSeries(object):
         if len(self.time_values()):
             assert time > self.last_time(), "time must be strictly increasing"
         
-        if self.last_time() >= 0:
+        if self.last_time() is not None:
              assert _times_considered_same(time, self.last_time()) == False, "time values too close together"
              
         self._time_values.append(time)
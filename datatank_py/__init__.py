@@ -4,4 +4,21 @@
 # from glob import glob
 # [x.strip(".py") for x in glob("*.py")]
 
-__all__ = ['DTBitmap2D', 'DTDataFile', 'DTError', 'DTMask', 'DTMesh2D', 'DTPath2D', 'DTPathValues2D', 'DTPlot1D', 'DTPoint2D', 'DTPointCollection2D', 'DTPointValue2D', 'DTPointValueCollection2D', 'DTProgress', 'DTPyCoreImage', 'DTPyWrite', 'DTRegion2D', 'DTRegion3D', 'DTSeries', 'DTStructuredGrid2D', 'DTStructuredGrid3D', 'DTStructuredMesh2D', 'DTStructuredMesh3D', 'DTStructuredVectorField2D', 'DTStructuredVectorField3D', 'DTTriangularGrid2D', 'DTTriangularMesh2D', 'DTTriangularVectorField2D', 'DTVector2D']
+__all__ = ['DTAsyncDataFile', 'DTBitmap2D', 'DTCatalog', 'DTDataFile', 'DTError', 'DTMask', 'DTMesh2D', 'DTMultiFileSeries', 'DTPath2D', 'DTPathValues2D', 'DTPlot1D', 'DTPoint2D', 'DTPointCollection2D', 'DTPointValue2D', 'DTPointValueCollection2D', 'DTProgress', 'DTPyCoreImage', 'DTPyWrite', 'DTRaster', 'DTRegion2D', 'DTRegion3D', 'DTSeries', 'DTStructuredGrid2D', 'DTStructuredGrid3D', 'DTStructuredMesh2D', 'DTStructuredMesh3D', 'DTStructuredVectorField2D', 'DTStructuredVectorField3D', 'DTTriangularGrid2D', 'DTTriangularMesh2D', 'DTTriangularVectorField2D', 'DTVector2D']
+
+# Nothing is imported here, since DataTank launches external programs for
+# every evaluation and most of them only need DTDataFile.  With Python 3.7
+# and later (PEP 562), the modules in __all__ are imported on first access,
+# so "datatank_py.DTMesh2D.DTMesh2D" works after a bare "import datatank_py".
+# Optional dependencies (GDAL, PIL, scikit-image, PyObjC) are only imported
+# inside the functions that use them; keep it that way.
+
+def __getattr__(name):
+    if name in __all__:
+        from importlib import import_module
+        # importing a submodule also sets it as an attribute of this package
+        return import_module(__name__ + "." + name)
+    raise AttributeError("module %r has no attribute %r" % (__name__, name))
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
@@ -6,11 +6,6 @@
 import os, sys
 from datatank_py.DTDataFile import DTDataFile
 from datatank_py.DTMesh2D import DTMesh2D
-from time import time
-
-from osgeo import gdal
-from osgeo import osr
-from osgeo.gdalconst import GDT_Float32
 import numpy as np
                      
 if __name__ == '__main__':
@@ -26,52 +21,10 @@ if __name__ == '__main__':
         sys.stderr.write("failed to read variables")
         exit(1)
         
-    values = mesh.values().astype(np.float32)
-
-    if mesh.mask() != None:
-        if mask_value == None:
-            sys.stderr.write("mesh has a mask")
-            exit(1)
-        values = np.where(mesh.mask() != 0, values, mask_value)
-            
-    # transform in DTBitmap2D
-    values = np.flipud(values)
-
-    # transform in DTDataFile
-    shape = list(values.shape)
-    shape.reverse()
-    values = values.reshape(shape, order="C")
-    
-    (raster_x, raster_y) = values.shape
-    
-    # base transform
-    grid = mesh.grid()
-    (xmin, dx, rot1, ymax, rot2, dy) = (0, 0, 0, 0, 0, 0)
-    xmin = grid[0]
-    dx = grid[2]
-    dy = grid[3]
-    ymax = grid[1] + abs(dy) * raster_y
-
-    # 2D mesh only has a single output band
-    band_count = 1
-    geotiff = gdal.GetDriverByName("GTiff")
-
-    dst = geotiff.Create("Output.tiff", raster_x, raster_y, bands=band_count, eType=GDT_Float32)
-    
-    # Recall that dx and dy are signed, with positive upwards;
-    # this is bizarre, but http://www.gdal.org/gdal_tutorial.html
-    # shows it also.
-    dst.SetGeoTransform((xmin, dx, rot1, ymax, rot2, -abs(dy)))
-    dst_srs = osr.SpatialReference()
-    dst_srs.SetFromUserInput(projection_name)
-    dst.SetProjection(dst_srs.ExportToWkt())
-    
-    band = dst.GetRasterBand(1)
-    
-    # make sure I didn't screw this up somewhere...
-    assert values.dtype == np.float32
-    data = values.tostring()
-    band.WriteRaster(0, 0, dst.RasterXSize, dst.RasterYSize, data, buf_xsize=dst.RasterXSize, buf_ysize=dst.RasterYSize, buf_type=band.DataType)
+    if mesh.mask() != None and mask_value == None:
+        sys.stderr.write("mesh has a mask")
+        exit(1)
         
-    dst = None
-
+    # single precision output, written a strip at a time
+    mesh = DTMesh2D(mesh.values().astype(np.float32), grid=mesh.grid(), mask=mesh.mask())
+    mesh.write_geotiff("Output.tiff", projection_name, nodata=mask_value)
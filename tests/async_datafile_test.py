@@ -0,0 +1,55 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# This software is under a BSD license.  See LICENSE.txt for details.
+
+# Requires Python 3.7 or later.
+
+import sys
+import asyncio
+import numpy as np
+from datatank_py.DTDataFile import DTDataFile
+from datatank_py.DTAsyncDataFile import DTAsyncDataFile, set_max_open_files
+
+async def async_read_test(file_paths):
+    
+    f = DTAsyncDataFile(file_paths[0])
+    assert [name async for name in f] == ["Seq_Values", "Values", "Seq_Label", "Label", "Redirect"], "failed async iteration test"
+    assert (await f.read("Label")) == "async test", "failed async string test"
+    
+    values = np.squeeze(await f.read("Values"))
+    assert np.all((await f.read_slice("Values", 3, 7)) == values[3:7]), "failed async slice test"
+    assert np.all((await f.read_slice("Redirect", -2, None)) == values[-2:]), "failed async redirect slice test"
+    
+    # slices of a file in the other byte order are converted to native order
+    swapped = DTAsyncDataFile(file_paths[-1])
+    values = np.squeeze(await swapped.read("Values"))
+    assert np.all(values == np.arange(200).reshape((20, 10)) + len(file_paths) - 1), "failed async swapped read test"
+    values_slice = await swapped.read_slice("Values", 3, 7)
+    assert values_slice.dtype.isnative and np.all(values_slice == values[3:7]), "failed async swapped slice test"
+    
+    # more files than the pool keeps open, all at once
+    set_max_open_files(2)
+    slices = await asyncio.gather(*[DTAsyncDataFile(file_paths[idx % len(file_paths)]).read_slice("Values", idx % 20, idx % 20 + 1) for idx in range(500)])
+    for idx, values in enumerate(slices):
+        assert values[0, 0] == (idx % 20) * 10 + idx % len(file_paths), "failed concurrent slice test"
+        
+if __name__ == '__main__':
+    
+    file_paths = []
+    for idx in range(4):
+        file_path = "async_%d.dtbin" % (idx)
+        with DTDataFile(file_path, truncate=True, dedupe=True) as output_file:
+            output_file.write(np.arange(200, dtype=np.double).reshape((20, 10)) + idx, "Values")
+            output_file.write("async test", "Label")
+            output_file.write_anonymous(np.arange(200, dtype=np.double).reshape((20, 10)) + idx, "Redirect")
+        file_paths.append(file_path)
+        
+    # a file in the other byte order, which DTDataFile appends to in that order
+    with open("async_swapped.dtbin", "wb") as output_file:
+        output_file.write(b"DataTank Binary File BE\0" if sys.byteorder == "little" else b"DataTank Binary File LE\0")
+    with DTDataFile("async_swapped.dtbin") as output_file:
+        output_file.write(np.arange(200, dtype=np.double).reshape((20, 10)) + len(file_paths), "Values")
+    file_paths.append("async_swapped.dtbin")
+        
+    asyncio.get_event_loop().run_until_complete(async_read_test(file_paths))
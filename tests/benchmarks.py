@@ -0,0 +1,306 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# This software is under a BSD license.  See LICENSE.txt for details.
+
+# Benchmarks for the DTDataFile read and write paths, and for the objects
+# that do a lot of work on the way to a file (DTMask, DTBitmap2D).  The
+# data are synthetic and seeded, so results are comparable between runs:
+#
+#   python benchmarks.py --output baseline.json
+#   ...change something...
+#   python benchmarks.py --compare baseline.json
+#
+# Results are written as JSON.  Keys ending in _seconds and peak_bytes are
+# better when lower, and keys ending in _per_s are better when higher;
+# --compare exits with status 1 if any of them is worse than the baseline
+# by more than the tolerance.  Peak memory uses tracemalloc, so it's only
+# measured with Python 3, and in a separate pass that isn't timed, since
+# tracing slows down allocation.  Pass --quick for a smoke test with small
+# sizes.
+
+from __future__ import print_function
+import os, sys
+import json
+import time
+import shutil
+import platform
+import tempfile
+import argparse
+import numpy as np
+from datatank_py.DTDataFile import DTDataFile
+
+_clock = getattr(time, "perf_counter", time.time)
+
+MEGABYTE = 1024.0 * 1024.0
+
+def _best_time(function, repeat):
+    """:returns: (shortest time in seconds of repeat calls, result of the last call)"""
+
+    best = None
+    for idx in range(repeat):
+        start = _clock()
+        result = function()
+        elapsed = _clock() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return (best, result)
+
+def _open_index(file_path):
+    """Open a file and read its variable index, which is the cost of opening it"""
+    with DTDataFile(file_path, readonly=True) as datafile:
+        return len(datafile.variable_names())
+
+def _write_swapped_header(file_path):
+    """Start a file in the non-native byte order; DTDataFile appends in the file's order"""
+    header = "DataTank Binary File BE\0" if sys.byteorder == "little" else "DataTank Binary File LE\0"
+    with open(file_path, "wb") as output_file:
+        output_file.write(header.encode())
+
+def tiny_variables(work_dir, scale, repeat):
+    """Many small arrays and scalars, as written by solvers that log every step"""
+
+    count = max(100, int(20000 * scale))
+    file_path = os.path.join(work_dir, "tiny.dtbin")
+    values = np.arange(4, dtype=np.double)
+
+    def write():
+        with DTDataFile(file_path, truncate=True) as datafile:
+            for idx in range(count):
+                datafile.write_anonymous(values, "Array_%d" % (idx))
+                datafile.write_anonymous(float(idx), "Scalar_%d" % (idx))
+
+    def read():
+        with DTDataFile(file_path, readonly=True) as datafile:
+            for idx in range(count):
+                datafile["Array_%d" % (idx)]
+
+    write_seconds = _best_time(write, repeat)[0]
+    open_seconds = _best_time(lambda: _open_index(file_path), repeat)[0]
+    read_seconds = _best_time(read, repeat)[0]
+    return { "variables":2 * count, "file_bytes":os.path.getsize(file_path), "write_seconds":write_seconds, "write_variables_per_s":2 * count / write_seconds, "open_seconds":open_seconds, "read_seconds":read_seconds }
+
+def _huge_arrays(work_dir, scale, repeat, swapped):
+
+    count = 4
+    rows = max(64, int(2048 * scale))
+    file_path = os.path.join(work_dir, "swapped.dtbin" if swapped else "huge.dtbin")
+    array = np.random.RandomState(0).random_sample((rows, 4096))
+    total_bytes = count * array.nbytes
+
+    def write():
+        if swapped:
+            _write_swapped_header(file_path)
+            datafile = DTDataFile(file_path)
+        else:
+            datafile = DTDataFile(file_path, truncate=True)
+        with datafile:
+            for idx in range(count):
+                datafile.write_anonymous(array, "Huge_%d" % (idx))
+
+    def read():
+        with DTDataFile(file_path, readonly=True) as datafile:
+            for idx in range(count):
+                datafile["Huge_%d" % (idx)]
+
+    out = np.empty_like(array)
+    def read_into():
+        with DTDataFile(file_path, readonly=True) as datafile:
+            for idx in range(count):
+                datafile.read_into("Huge_%d" % (idx), out)
+
+    write_seconds = _best_time(write, repeat)[0]
+    open_seconds = _best_time(lambda: _open_index(file_path), repeat)[0]
+    read_seconds = _best_time(read, repeat)[0]
+    read_into_seconds = _best_time(read_into, repeat)[0]
+    return { "array_bytes":total_bytes, "write_seconds":write_seconds, "write_mb_per_s":total_bytes / MEGABYTE / write_seconds, "open_seconds":open_seconds, "read_seconds":read_seconds, "read_mb_per_s":total_bytes / MEGABYTE / read_seconds, "read_into_mb_per_s":total_bytes / MEGABYTE / read_into_seconds }
+
+def huge_arrays(work_dir, scale, repeat):
+    """A few large double arrays in native byte order"""
+    return _huge_arrays(work_dir, scale, repeat, swapped=False)
+
+def byte_swapped(work_dir, scale, repeat):
+    """The same arrays as huge_arrays, in a file with the other byte order"""
+    return _huge_arrays(work_dir, scale, repeat, swapped=True)
+
+def series_group(work_dir, scale, repeat):
+    """A long DTSeriesGroup time series with a mesh-sized array and a scalar per step"""
+
+    from datatank_py.DTSeries import DTSeriesGroup
+
+    steps = max(20, int(2000 * scale))
+    file_path = os.path.join(work_dir, "series.dtbin")
+    values = np.random.RandomState(0).random_sample((100, 100))
+
+    def write():
+        with DTDataFile(file_path, truncate=True) as datafile:
+            group = DTSeriesGroup(datafile, "Var", { "Values":"Array", "Index":"Real Number" })
+            for idx in range(steps):
+                group.add(idx / 10.0, { "Values":values, "Index":idx })
+
+    def read():
+        with DTDataFile(file_path, readonly=True) as datafile:
+            for idx in range(steps):
+                datafile["Var_%d_Values" % (idx)]
+
+    write_seconds = _best_time(write, repeat)[0]
+    open_seconds = _best_time(lambda: _open_index(file_path), repeat)[0]
+    read_seconds = _best_time(read, repeat)[0]
+    return { "steps":steps, "file_bytes":os.path.getsize(file_path), "write_seconds":write_seconds, "write_steps_per_s":steps / write_seconds, "open_seconds":open_seconds, "read_seconds":read_seconds }
+
+def string_lists(work_dir, scale, repeat):
+    """StringList variables, which are split into strings as they're read"""
+
+    count = max(10, int(200 * scale))
+    file_path = os.path.join(work_dir, "strings.dtbin")
+    strings = ["Station %d" % (idx) for idx in range(1000)]
+
+    def write():
+        with DTDataFile(file_path, truncate=True) as datafile:
+            for idx in range(count):
+                datafile.write(strings, "Names %d" % (idx))
+
+    def read():
+        with DTDataFile(file_path, readonly=True) as datafile:
+            for idx in range(count):
+                datafile["Names %d" % (idx)]
+
+    write_seconds = _best_time(write, repeat)[0]
+    read_seconds = _best_time(read, repeat)[0]
+    return { "strings":count * len(strings), "write_seconds":write_seconds, "read_seconds":read_seconds, "read_strings_per_s":count * len(strings) / read_seconds }
+
+def _blob_mask(shape, seed=0):
+    """Irregular wet/dry style mask, with runs of various lengths in each row"""
+
+    state = np.random.RandomState(seed)
+    coarse = state.random_sample((shape[0] // 16 + 1, shape[1] // 16 + 1))
+    # nearest-neighbor upsampling plus noise gives blobs with ragged edges
+    field = np.repeat(np.repeat(coarse, 16, axis=0), 16, axis=1)[:shape[0], :shape[1]]
+    field += 0.2 * state.random_sample(shape)
+    return field > 0.6
+
+def mask_construction(work_dir, scale, repeat):
+    """DTMask from a dense array and back, as done for every masked mesh"""
+
+    from datatank_py.DTMask import DTMask
+
+    size = max(100, int(2000 * scale))
+    mask_values = _blob_mask((size, size))
+
+    (construct_seconds, mask) = _best_time(lambda: DTMask(mask_values), repeat)
+    expand_seconds = _best_time(mask.mask_array, repeat)[0]
+    return { "cells":mask_values.size, "intervals":len(mask._intervals), "construct_seconds":construct_seconds, "construct_cells_per_s":mask_values.size / construct_seconds, "mask_array_seconds":expand_seconds }
+
+def bitmap_indexed_color(work_dir, scale, repeat):
+    """Loading an indexed-color GeoTIFF with DTBitmap2D, which expands the palette"""
+
+    from osgeo import gdal
+    from datatank_py.DTBitmap2D import DTBitmap2D
+
+    size = max(64, int(2000 * scale))
+    file_path = os.path.join(work_dir, "indexed.tif")
+    dataset = gdal.GetDriverByName("GTiff").Create(file_path, size, size, 1, gdal.GDT_Byte)
+    band = dataset.GetRasterBand(1)
+    color_table = gdal.ColorTable()
+    for color_index in range(256):
+        color_table.SetColorEntry(color_index, (color_index, 255 - color_index, (7 * color_index) % 256, 255))
+    band.SetRasterColorTable(color_table)
+    band.WriteArray(np.random.RandomState(0).randint(0, 256, (size, size)).astype(np.uint8))
+    band = None
+    dataset = None
+
+    load_seconds = _best_time(lambda: DTBitmap2D(file_path), repeat)[0]
+    return { "pixels":size * size, "load_seconds":load_seconds, "load_pixels_per_s":size * size / load_seconds }
+
+BENCHMARKS = (tiny_variables, huge_arrays, byte_swapped, series_group, string_lists, mask_construction, bitmap_indexed_color)
+
+def _run_in_scratch_directory(benchmark, scale, repeat):
+    """:returns: results of a benchmark, run in a new scratch directory"""
+
+    work_dir = tempfile.mkdtemp(prefix="dtbench")
+    try:
+        return benchmark(work_dir, scale, repeat)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+def _peak_bytes(benchmark, scale):
+    """:returns: peak memory traced during a single untimed run, or None without tracemalloc"""
+
+    try:
+        import tracemalloc
+    except ImportError:
+        return None
+
+    tracemalloc.start()
+    try:
+        _run_in_scratch_directory(benchmark, scale, 1)
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+def run_benchmark(benchmark, scale, repeat):
+    """Run a benchmark, then run it again to measure memory.
+
+    :returns: dictionary of results, including peak_bytes if measured, or
+      a "skipped" reason if an optional dependency is missing, or an "error"
+
+    """
+
+    try:
+        results = _run_in_scratch_directory(benchmark, scale, repeat)
+        peak_bytes = _peak_bytes(benchmark, scale)
+    except (ImportError, SyntaxError) as e:
+        return { "skipped":str(e) }
+    except Exception as e:
+        return { "error":"%s: %s" % (e.__class__.__name__, e) }
+    if peak_bytes is not None:
+        results["peak_bytes"] = peak_bytes
+    return results
+
+def regressions(results, baseline, tolerance):
+    """:returns: list of messages for results worse than baseline by more than tolerance (a fraction)"""
+
+    messages = []
+    for name, values in sorted(results["benchmarks"].items()):
+        old_values = baseline["benchmarks"].get(name, {})
+        for key, value in sorted(values.items()):
+            old_value = old_values.get(key)
+            if not isinstance(value, (int, float)) or not isinstance(old_value, (int, float)) or old_value <= 0:
+                continue
+            if (key.endswith("_seconds") or key == "peak_bytes") and value > old_value * (1 + tolerance):
+                messages.append("%s %s: %g > %g" % (name, key, value, old_value))
+            elif key.endswith("_per_s") and value < old_value / (1 + tolerance):
+                messages.append("%s %s: %g < %g" % (name, key, value, old_value))
+    return messages
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description="Benchmark datatank_py file I/O")
+    parser.add_argument("names", nargs="*", help="benchmarks to run (default is all of them)")
+    parser.add_argument("--output", help="write JSON results to this file instead of standard output")
+    parser.add_argument("--compare", help="JSON results of an earlier run to check for regressions")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed fraction of slowdown for --compare")
+    parser.add_argument("--repeat", type=int, default=3, help="time each operation this many times, and keep the best")
+    parser.add_argument("--quick", action="store_true", help="use small sizes, for a smoke test")
+    args = parser.parse_args()
+
+    benchmarks = [benchmark for benchmark in BENCHMARKS if len(args.names) == 0 or benchmark.__name__ in args.names]
+    assert len(benchmarks), "no benchmarks named %s" % (", ".join(args.names))
+
+    results = { "python":platform.python_version(), "numpy":np.__version__, "platform":platform.platform(), "quick":args.quick, "repeat":args.repeat, "time":time.strftime("%Y-%m-%dT%H:%M:%S"), "benchmarks":{} }
+    for benchmark in benchmarks:
+        sys.stderr.write("%s\n" % (benchmark.__name__))
+        results["benchmarks"][benchmark.__name__] = run_benchmark(benchmark, 0.05 if args.quick else 1.0, args.repeat)
+
+    if args.output:
+        with open(args.output, "w") as output_file:
+            json.dump(results, output_file, indent=2, sort_keys=True)
+    else:
+        print(json.dumps(results, indent=2, sort_keys=True))
+
+    messages = ["%s failed: %s" % (name, values["error"]) for name, values in sorted(results["benchmarks"].items()) if "error" in values]
+    if args.compare:
+        with open(args.compare) as baseline_file:
+            messages += ["regression: " + message for message in regressions(results, json.load(baseline_file), args.tolerance)]
+    for message in messages:
+        sys.stderr.write("%s\n" % (message))
+    sys.exit(1 if len(messages) else 0)
@@ -3,12 +3,18 @@
 
 # This software is under a BSD license.  See LICENSE.txt for details.
 
-from __future__ import with_statement
-import os
+from __future__ import with_statement, print_function
+import os, sys
+import subprocess
 import numpy as np
-from datatank_py.DTDataFile import DTDataFile
+import datatank_py
+from datatank_py.DTDataFile import DTDataFile, register_dt_type
 from datatank_py.DTMesh2D import DTMesh2D
+from datatank_py.DTMask import DTMask
+from datatank_py.DTCatalog import DTCatalog
+from datatank_py.DTMultiFileSeries import DTMultiFileSeries
 from datatank_py.DTBitmap2D import DTBitmap2D
+from datatank_py.DTTriangularGrid2D import DTTriangularGrid2D
 
 def write_2dmeshes(file_path):
     
@@ -41,8 +47,8 @@ def write_2dmeshes(file_path):
     with DTDataFile("mesh.dtbin") as mesh_file:
         try:
             mesh_file["Image from GDAL"] = DTBitmap2D("../examples/int16.tiff").mesh_from_channel()
-        except Exception, e:
-            print "failed to load or write image as mesh:", e    
+        except Exception as e:
+            print("failed to load or write image as mesh:", e)
 
 def write_images(file_path):
             
@@ -64,8 +70,8 @@ def write_images(file_path):
         image.putalpha(200)
         output_file["ImageAlpha"] = DTBitmap2D(image)
         
-    except Exception, e:
-        print "failed to load or write image:", e
+    except Exception as e:
+        print("failed to load or write image:", e)
 
     output_file.close()
     
@@ -144,7 +150,7 @@ def write_test(file_path):
     output_file.DEBUG = True
     
     # write a time-varying 1D array (list of numbers)
-    for idx in xrange(10):
+    for idx in range(10):
         time_test = np.array(range(idx, idx + 10), np.double)
         output_file.write(time_test, "TimeTest_%d" % (idx), time=idx * 2.)
     
@@ -154,7 +160,7 @@ def write_test(file_path):
     assert string == output_file["TestSingleString"], "failed string test"
 
     # write a time-varying string with Unicode characters
-    for idx in xrange(10):
+    for idx in range(10):
         output_file.write_string(u"Χριστός : time index %d" % (idx), "StringTest_%d" % (idx), time=idx * 2.)
         
     string_list = ["First String", "Second String", "Third String"]
@@ -162,24 +168,362 @@ def write_test(file_path):
     assert string_list == output_file["TestStringList"], "failed string list test"
         
     # write a time-varying 2D point collection
-    for idx in xrange(10):
+    for idx in range(10):
         point_test = np.array(range(idx, idx + 10), np.double)
-        point_test = point_test.reshape((point_test.size / 2, 2))
+        point_test = point_test.reshape((point_test.size // 2, 2))
         output_file.write_array(point_test, "PointTest_%d" % (idx), dt_type="2D Point Collection", time=idx * 2.)
             
     output_file.close()   
 
+def dedupe_test(file_path):
+    
+    (x, dx) = np.linspace(-10, 10, 50, retstep=True)
+    (y, dy) = np.linspace(-10, 10, 100, retstep=True)
+    xx, yy = np.meshgrid(x, y)
+    grid = (np.min(x), np.min(y), dx, dy)
+    mask = DTMask(xx * xx + yy * yy < 50)
+    
+    # compound objects are read by resolving their own name, so that block is never a redirect
+    connections = np.arange(300, dtype=np.int32).reshape((100, 3))
+    with DTDataFile(file_path, truncate=True, dedupe=True, dedupe_min_bytes=64) as output_file:
+        for grid_name in ("First grid", "Second grid"):
+            points = np.arange(600, dtype=np.double).reshape((300, 2)) + len(grid_name)
+            output_file.write(DTTriangularGrid2D(connections, points), grid_name)
+        output_file.write(DTMesh2D(np.ones((10, 10)), grid=(0, 0, 1, 1)), "First")
+        output_file.write(DTMesh2D(np.ones((10, 10)), grid=(0, 0, 2, 2)), "Second")
+            
+    with DTDataFile(file_path, readonly=True) as input_file:
+        assert input_file.resolve_name("Second grid") == "Second grid", "failed compound object dedupe test"
+        assert np.all(input_file[input_file.resolve_name("Second grid") + "_pts"] == points), "failed compound object points test"
+        mesh = input_file.dt_object_named("Second")
+        assert isinstance(mesh, DTMesh2D) and np.all(np.squeeze(mesh.grid()) == (0, 0, 2, 2)), "failed dedupe object test"
+            
+    # every step has the same grid and mask, so only the first should be saved in full
+    with DTDataFile(file_path, truncate=True, dedupe=True, dedupe_min_bytes=64) as output_file:
+        for idx in range(10):
+            mesh = np.cos(xx + idx) + np.cos(yy)
+            output_file.write(DTMesh2D(mesh, grid=grid, mask=mask), "Mesh_%d" % (idx), time=idx * 2.)
+            
+    with DTDataFile(file_path, readonly=True) as input_file:
+        # the marker of a dedupe redirect isn't a variable
+        assert not [name for name in input_file.variable_names() if name.endswith("_dedupe")], "failed dedupe marker test"
+        assert input_file._is_array_redirect("Mesh_9_dom", input_file._string_values.get("Mesh_9_dom")), "mask was not deduplicated"
+        assert input_file.resolve_name("Mesh_9_dom") == "Mesh_9_dom", "failed dedupe resolve_name test"
+        for idx in range(10):
+            mesh = DTMesh2D.from_data_file(input_file, "Mesh_%d" % (idx))
+            assert np.all(mesh.values() == np.cos(xx + idx) + np.cos(yy)), "failed dedupe values test"
+            assert np.all(mesh.mask() == mask.mask_array()), "failed dedupe mask test"
+            
+    # views that aren't contiguous are hashed without a copy, and match contiguous arrays
+    values = np.arange(4000, dtype=np.double)
+    # cache_test uses the file from above, so this goes in another one
+    strided_path = "strided_" + file_path
+    with DTDataFile(strided_path, truncate=True, dedupe=True, dedupe_min_bytes=64) as output_file:
+        output_file.write_anonymous(np.ascontiguousarray(values[::2]), "Contiguous")
+        output_file.write_anonymous(values[::2], "Strided")
+        output_file.write_anonymous(values[1::2], "Other")
+    with DTDataFile(strided_path, readonly=True) as input_file:
+        assert input_file.resolve_name("Strided") == "Strided" and input_file["Strided"] is not None, "failed strided dedupe test"
+        assert input_file._string_values.get("Strided") == "Contiguous" and "Other" not in input_file._string_values, "failed strided dedupe test"
+        assert np.all(input_file["Strided"] == values[::2]) and np.all(input_file["Other"] == values[1::2]), "failed strided dedupe values test"
+    os.remove(strided_path)
+
+def cache_test(file_path):
+    
+    # uses the file from dedupe_test, which has a single grid and mask for all steps
+    with DTDataFile(file_path, readonly=True, cache_bytes=1024 * 1024) as input_file:
+        for idx in range(10):
+            mesh = DTMesh2D.from_data_file(input_file, "Mesh_%d" % (idx))
+        info = input_file.cache_info()
+        assert info["hits"] >= 9, "grid and mask should be read once: %s" % (info)
+        assert info["bytes"] <= info["max_bytes"], "cache exceeded its budget: %s" % (info)
+        assert input_file["Mesh_0"].flags.writeable == False, "cached arrays must be read-only"
+
+def redirect_test(file_path):
+    
+    with DTDataFile(file_path, truncate=True) as output_file:
+        output_file.write_anonymous(np.arange(5, dtype=np.double), "Array")
+        output_file.write_anonymous("Array", "First redirect")
+        output_file.write_anonymous("First redirect", "Second redirect")
+        output_file.write_anonymous("Circular B", "Circular A")
+        output_file.write_anonymous("Circular A", "Circular B")
+        output_file.write("Array", "Label")
+        
+    with DTDataFile(file_path, readonly=True) as input_file:
+        # only redirects written by dedupe are followed when reading
+        assert input_file["Label"] == "Array", "failed string naming an array test"
+        assert input_file["First redirect"] == "Array", "failed shared name test"
+        assert input_file.resolve_name("Second redirect") == "Array", "failed multiple redirect test"
+        assert input_file.resolve_name("Array") == "Array", "failed non-redirect test"
+        try:
+            input_file.resolve_name("Circular A")
+            assert False, "failed circular redirect test"
+        except AssertionError as e:
+            assert "circular" in str(e), "failed circular redirect test"
+
+def read_into_test(file_path):
+    
+    # uses the time-varying list from write_test
+    with DTDataFile(file_path, readonly=True) as input_file:
+        values = np.empty(10, dtype=np.double)
+        for idx in range(10):
+            assert input_file.read_into("TimeTest_%d" % (idx), values) is values, "read_into must return the buffer"
+            assert np.all(values == np.array(range(idx, idx + 10), np.double)), "failed read_into test"
+            
+        # conversion while reading
+        values = input_file.variable_named("TimeTest_9", dtype=np.float32)
+        assert values.dtype == np.float32, "failed dtype conversion test"
+        assert np.all(values == np.array(range(9, 19), np.float32)), "failed dtype conversion test"
+
+def float_policy_test(file_path):
+    
+    values = np.linspace(0, 1, 100 * 200).reshape((100, 200))
+    grid = (0, 0, 1, 1)
+    with DTDataFile(file_path, truncate=True, float_policy="float32") as output_file:
+        output_file.write(DTMesh2D(values, grid=grid), "Single_0", time=0.1)
+        output_file.write(DTMesh2D(values, grid=grid), "Double_0", time=0.1, float_policy=[("Double*", None)])
+        output_file.write(DTMesh2D(values, grid=grid), "Full_0", time=0.1, float_policy=None)
+        # non-contiguous arrays are converted in C order
+        output_file.write(values.T[::2], "Transposed", float_policy=np.float32)
+        
+    with DTDataFile(file_path, readonly=True) as input_file:
+        assert input_file["Single_0"].dtype == np.float32, "failed float policy test"
+        assert np.allclose(input_file["Single_0"], values), "failed float policy test"
+        assert input_file["Double_0"].dtype == np.float64, "failed per-call float policy test"
+        assert input_file["Full_0"].dtype == np.float64, "failed float_policy=None test"
+        assert np.all(input_file["Transposed"] == values.T[::2].astype(np.float32)), "failed non-contiguous float policy test"
+        assert input_file["Single_0_time"] == 0.1, "failed float policy time test"
+        
+    # a single (pattern, type) pair is the same as a list of one; small arrays are never converted
+    with DTDataFile(file_path, truncate=True, float_policy=("Single*", np.float32)) as output_file:
+        output_file.write(values, "Single")
+        output_file.write(values, "Double")
+        output_file.write(values[0, :63], "Single small")
+    with DTDataFile(file_path, readonly=True) as input_file:
+        assert input_file["Single"].dtype == np.float32 and input_file["Double"].dtype == np.float64, "failed single pair float policy test"
+        assert input_file["Single small"].dtype == np.float64, "failed small array float policy test"
+        
+    for policy in ([("Single*", np.float32), "float32"], [("Single*", np.int32)]):
+        try:
+            DTDataFile(file_path, float_policy=policy)
+            assert False, "failed invalid float policy test"
+        except AssertionError as e:
+            assert "float policy" in str(e) and "failed" not in str(e), "failed invalid float policy test: %s" % (e)
+
+def registry_test(file_path):
+    
+    values = np.arange(20 * 30, dtype=np.float32).reshape((20, 30))
+    with DTDataFile(file_path, truncate=True) as output_file:
+        output_file.write(DTMesh2D(values, grid=(0, 0, 1, 1)), "Mesh")
+        output_file.write_anonymous(DTMesh2D(values, grid=(0, 0, 1, 1)), "Custom")
+        output_file.write_anonymous("Custom Mesh", "Seq_Custom")
+        
+    register_dt_type("Custom Mesh", "datatank_py.DTMesh2D:DTMesh2D")
+    with DTDataFile(file_path, readonly=True) as input_file:
+        for name in ("Mesh", "Custom"):
+            mesh = input_file.dt_object_named(name)
+            assert isinstance(mesh, DTMesh2D), "failed registry test"
+            assert np.all(mesh.values() == values), "failed registry test"
+
+def watch_test(file_path):
+    
+    # a block cut off halfway, as if the writer is still working on it
+    with DTDataFile("partial_" + file_path, truncate=True) as partial_file:
+        partial_file.write(np.arange(10, dtype=np.int32), "Late")
+    with open("partial_" + file_path, "rb") as partial_file:
+        partial = partial_file.read()[24:]
+    os.remove("partial_" + file_path)
+    
+    with DTDataFile(file_path, truncate=True) as output_file:
+        output_file.write(np.arange(10, dtype=np.int32), "Before")
+        
+    input_file = DTDataFile(file_path, readonly=True)
+    watcher = input_file.watch(timeout=0.5, poll_interval=0.1)
+    with DTDataFile(file_path) as output_file:
+        output_file.write(np.arange(10, dtype=np.int32), "After")
+        output_file.write(DTMesh2D(np.zeros((10, 10)), grid=(0, 0, 1, 1)), "Mesh_0", time=0.5)
+    with open(file_path, "ab") as output_file:
+        output_file.write(partial[:len(partial) // 2])
+    assert list(watcher) == ["After", "Mesh_0"], "failed watch test"
+    
+    watcher = input_file.watch(timeout=0.5, poll_interval=0.1)
+    with open(file_path, "ab") as output_file:
+        output_file.write(partial[len(partial) // 2:])
+    assert list(watcher) == ["Late"], "failed partial block watch test"
+    input_file.close()
+
+def catalog_test(directory):
+    
+    if not os.path.isdir(directory):
+        os.mkdir(directory)
+    for idx in range(5):
+        with DTDataFile(os.path.join(directory, "run%d.dtbin" % (idx)), truncate=True) as output_file:
+            output_file.write(np.arange(10, dtype=np.double) + idx, "Depth_%d" % (idx), time=idx)
+            
+    with DTCatalog(directory, max_open_files=2) as catalog:
+        assert catalog.file_names() == ["run%d.dtbin" % (idx) for idx in range(5)], "failed catalog file name test"
+        assert catalog["run3.dtbin"]["Depth_3"][0, 0, 0] == 3, "failed catalog lookup test"
+        assert catalog.find("Depth_?") == [("run%d.dtbin" % (idx), "Depth_%d" % (idx)) for idx in range(5)], "failed catalog find test"
+        
+        # evicted files reuse their index unless they change
+        catalog["run0.dtbin"]
+        assert len(catalog._open_files) == 2 and "run1.dtbin" in catalog._indexes, "failed catalog eviction test"
+        with DTDataFile(os.path.join(directory, "run1.dtbin")) as output_file:
+            output_file.write(np.arange(3, dtype=np.double), "Added")
+        assert catalog["run1.dtbin"]["Added"][0, 0, 1] == 1, "failed changed file test"
+
+def multifile_series_test(file_paths):
+    
+    for file_idx, file_path in enumerate(file_paths):
+        with DTDataFile(file_path, truncate=True) as output_file:
+            for idx in range(4):
+                output_file.write(DTMesh2D(np.ones((3, 5)) * (file_idx * 4 + idx), grid=(0, 0, 1, 1)), "Depth_%d" % (idx), time=file_idx + idx / 4.)
+                output_file.write(float(file_idx * 4 + idx), "Level_%d" % (idx), time=file_idx + idx / 4.)
+                
+    with DTMultiFileSeries(file_paths, "Depth") as series:
+        assert len(series) == 4 * len(file_paths), "failed multifile series length test"
+        assert series.location(5) == (os.path.abspath(file_paths[1]), "Depth_1"), "failed multifile series location test"
+        assert np.all(series.read(6, dt_object=True).values() == 6), "failed multifile series object test"
+        stacked = series.read_stacked(2, 7, dtype=np.float32)
+        assert stacked.shape == (5, 3, 5) and np.all(stacked[:, 0, 0] == np.arange(2, 7)), "failed multifile series stacked test"
+        assert series.read_stacked(2, 7).dtype == np.float64, "failed multifile series stacked type test"
+        
+    # each step of a series of numbers is a single value
+    with DTMultiFileSeries(file_paths, "Level") as series:
+        stacked = series.read_stacked()
+        assert stacked.shape == (4 * len(file_paths),) and np.all(stacked == np.arange(4 * len(file_paths))), "failed multifile series stacked number test"
+        assert [time for time, values in series] == list(series.times()), "failed multifile series iteration test"
+        
+    try:
+        DTMultiFileSeries(list(reversed(file_paths)), "Depth")
+        assert False, "failed multifile series time order test"
+    except AssertionError as e:
+        assert "increasing" in str(e), "failed multifile series time order test"
+
+def lock_test(file_path):
+    
+    with DTDataFile(file_path, truncate=True, lock=True) as writer:
+        writer.write(np.arange(10, dtype=np.int32), "Locked")
+        try:
+            DTDataFile(file_path, truncate=True, lock=True)
+            assert False, "failed writer lock test"
+        except AssertionError as e:
+            assert "already open for writing" in str(e), "failed writer lock test"
+        reader = DTDataFile(file_path, readonly=True, lock=True)
+        assert np.all(reader["Locked"] == np.arange(10)), "failed locked reader test"
+        writer.write(np.arange(5, dtype=np.int32), "Later")
+        assert np.all(reader["Later"] == np.arange(5)), "failed locked reader update test"
+        
+        # the lock has to survive the writes and reads above, and the refused writer
+        script = "import sys; from datatank_py.DTDataFile import DTDataFile; DTDataFile(sys.argv[1], lock=True)"
+        env = dict(os.environ, PYTHONPATH=os.path.dirname(os.path.dirname(os.path.abspath(datatank_py.__file__))))
+        process = subprocess.Popen([sys.executable, "-c", script, file_path], env=env, stderr=subprocess.PIPE)
+        error = process.communicate()[1].decode("utf-8", "replace")
+        assert process.returncode != 0 and "open for writing by another process" in error, "failed writer lock test in another process: %s" % (error)
+    reader.close()
+
+def stats_test(file_path):
+    
+    calls = []
+    def hook(operation, name, seconds):
+        calls.append((operation, name))
+        
+    with DTDataFile(file_path, truncate=True, dedupe=True, dedupe_min_bytes=64, stats=True, hook=hook) as output_file:
+        output_file.write_anonymous(np.arange(100, dtype=np.double), "Array")
+        output_file.write_anonymous(np.arange(100, dtype=np.double), "Redirect")
+        stats = output_file.stats()
+    assert stats.bytes_written == os.path.getsize(file_path), "failed bytes written test: %s" % (stats)
+    assert ("write_array", "Array") in calls and ("write_string", "Redirect") in calls, "failed write hook test"
+        
+    with DTDataFile(file_path, readonly=True, stats=True, hook=hook) as input_file:
+        assert np.all(input_file["Redirect"] == np.arange(100)), "failed stats read test"
+        stats = input_file.stats()
+        assert stats.full_scans == 1 and stats.fsyncs == 0, "failed read stats test: %s" % (stats)
+        assert stats.bytes_read >= 800, "failed bytes read test: %s" % (stats)
+        # the redirected read is part of the read of "Redirect"
+        assert stats.operations["read"][0] == 1, "failed nested operation test: %s" % (stats)
+        assert calls[-1][0:2] == ("read", "Redirect"), "failed read hook test"
+        
+        # a reader only indexes the blocks appended since it last looked
+        with DTDataFile(file_path) as output_file:
+            output_file.write_anonymous(np.arange(10, dtype=np.double), "Appended")
+        assert np.all(input_file["Appended"] == np.arange(10)), "failed appended read test"
+        assert stats.full_scans == 1 and stats.incremental_scans == 1, "failed incremental reload test: %s" % (stats)
+
+        # a file rewritten from the start is read again, even if it got larger
+        with DTDataFile(file_path, truncate=True) as output_file:
+            output_file.write_anonymous(np.arange(500, dtype=np.double), "Rewritten")
+            output_file.write_anonymous(np.arange(5, dtype=np.double), "Second")
+        assert sorted(input_file.variable_names()) == ["Rewritten", "Second"], "failed rewritten file names test"
+        assert np.all(input_file["Second"] == np.arange(5)), "failed rewritten file read test"
+        assert stats.full_scans == 2, "failed rewritten file reload test: %s" % (stats)
+        
+    assert DTDataFile(file_path, readonly=True).stats() is None, "stats should be off by default"
+
+def row_writer_test(file_path):
+    
+    values = np.arange(4 * 5 * 6, dtype=np.double).reshape((4, 5, 6))
+    def row_blocks(count=len(values)):
+        for row in range(0, count, 3):
+            yield values[row:min(row + 3, count)]
+            
+    # the file should be the same as writing the whole array, including conversion
+    with DTDataFile(file_path, truncate=True) as output_file:
+        output_file.write_anonymous(values, "Whole")
+        output_file.write_anonymous(values.astype(np.float32), "Single")
+    whole_bytes = open(file_path, "rb").read()
+    with DTDataFile(file_path, truncate=True) as output_file:
+        output_file.write_anonymous_rows(row_blocks(), values.shape, values.dtype, "Whole")
+        output_file.write_anonymous_rows(row_blocks(), values.shape, np.float32, "Single")
+    assert open(file_path, "rb").read() == whole_bytes, "failed row writer test"
+    
+    def failing_blocks():
+        yield values[0:1]
+        raise ValueError("no more rows")
+            
+    # a short or failed array is removed, so the file is still readable
+    with DTDataFile(file_path, truncate=True) as output_file:
+        output_file.write_anonymous(values, "Whole")
+        try:
+            output_file.write_anonymous_rows(row_blocks(2), values.shape, values.dtype, "Short")
+            assert False, "failed short row writer test"
+        except AssertionError as e:
+            assert "wrote 2 rows of 4" in str(e), "failed short row writer test"
+        try:
+            output_file.write_anonymous_rows(failing_blocks(), values.shape, values.dtype, "Failed")
+            assert False, "failed row writer exception test"
+        except ValueError:
+            pass
+        output_file.write_anonymous(values.astype(np.float32), "Single")
+    assert open(file_path, "rb").read() == whole_bytes, "failed row writer truncation test"
+    with DTDataFile(file_path, readonly=True) as input_file:
+        assert sorted(input_file.variable_names()) == ["Single", "Whole"], "failed row writer truncation test"
+
+def pyramid_test(file_path):
+    
+    values = np.arange(35 * 22, dtype=np.float32).reshape((35, 22))
+    with DTDataFile(file_path, truncate=True) as output_file:
+        names = DTMesh2D(values, grid=(0, 0, 1, 1)).write_pyramid(output_file, "Pyramid", levels=3)
+    assert names == ["Pyramid_L0", "Pyramid_L1", "Pyramid_L2"], "failed pyramid names test"
+    
+    with DTDataFile(file_path, readonly=True) as input_file:
+        assert np.all(np.squeeze(input_file["Pyramid_L0"]) == values), "failed pyramid level 0 test"
+        level = np.squeeze(input_file["Pyramid_L1"])
+        assert np.all(level == values[:34].reshape((17, 2, 11, 2)).mean(axis=3).mean(axis=1)), "failed pyramid level 1 test"
+        assert np.squeeze(input_file["Pyramid_L2"]).shape == (8, 5), "failed pyramid level 2 test"
+        assert np.all(np.squeeze(input_file["Pyramid_L2_loc"]) == (1.5, 1.5, 4, 4)), "failed pyramid grid test"
+
 def read_test(file_path, print_values=False):
     
     f = DTDataFile(file_path)
     f.DEBUG = True
-    print f
+    print(f)
     for name in f:
         # Call this to make sure the variables are actually read, since that will
         # potentially have numerous side effects.  Printing this is overwhelming.
         value = f[name]
         if print_values:
-            print "%s = %s" % (name, value)
+            print("%s = %s" % (name, value))
         
     f.close()
         
@@ -190,4 +534,17 @@ if __name__ == '__main__':
     write_test("test.dtbin")
     read_test("test.dtbin")
     read_test("mesh.dtbin")
+    read_into_test("test.dtbin")
+    dedupe_test("dedupe.dtbin")
+    cache_test("dedupe.dtbin")
+    redirect_test("redirect.dtbin")
+    float_policy_test("float_policy.dtbin")
+    registry_test("registry.dtbin")
+    watch_test("watch.dtbin")
+    catalog_test("catalog")
+    multifile_series_test(["day%d.dtbin" % (idx) for idx in range(3)])
+    lock_test("lock.dtbin")
+    stats_test("stats.dtbin")
+    row_writer_test("rows.dtbin")
+    pyramid_test("pyramid.dtbin")
     
\ No newline at end of file
@@ -0,0 +1,181 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# This software is under a BSD license.  See LICENSE.txt for details.
+
+# Checks DTMask against brute-force loops over the cells of dense arrays.
+
+from __future__ import with_statement
+import os
+import numpy as np
+import datatank_py.DTMask
+from datatank_py.DTMask import DTMask
+from datatank_py.DTDataFile import DTDataFile
+
+# Python order, as passed to DTMask; includes empty, 1D, and 3D masks
+SHAPES = ((0,), (1,), (50,), (0, 5), (40, 30), (1, 17), (5, 6, 7), (3, 1, 9))
+
+def _random_masks(state, shape):
+    """:returns: list of boolean arrays with the given shape, including all and none"""
+    return [np.zeros(shape, dtype=bool), np.ones(shape, dtype=bool), state.random_sample(shape) > 0.5, state.random_sample(shape) > 0.9]
+
+def _row_length(shape):
+    return shape[-1] if len(shape) else 1
+
+def _datatank_shape(shape):
+    """:returns: shape of DTMask.dense() for a mask created with an array of this shape"""
+    return (1, shape[0]) if len(shape) == 1 else tuple(shape)
+
+def _brute_force_intervals(mask_values):
+    """:returns: N x 2 array of the (start, end) of each run of masked cells in each row, found one cell at a time"""
+
+    flat = np.asarray(mask_values).reshape(-1)
+    m = _row_length(np.shape(mask_values))
+    intervals = []
+    for row_start in range(0, flat.size, max(m, 1)):
+        start = None
+        for idx in range(row_start, row_start + m):
+            if flat[idx] and start is None:
+                start = idx
+            elif not flat[idx] and start is not None:
+                intervals.append((start, idx - 1))
+                start = None
+        if start is not None:
+            intervals.append((start, row_start + m - 1))
+    return np.array(intervals, dtype=np.int32).reshape((-1, 2))
+
+def _brute_force_dilate(mask_values):
+    """:returns: mask_values with each masked cell spread to its neighbors in the same row"""
+
+    flat = np.asarray(mask_values).reshape(-1)
+    m = _row_length(np.shape(mask_values))
+    dilated = flat.copy()
+    for idx in range(flat.size):
+        if flat[idx]:
+            if idx % m > 0:
+                dilated[idx - 1] = True
+            if idx % m < m - 1:
+                dilated[idx + 1] = True
+    return dilated.reshape(np.shape(mask_values))
+
+def intervals_test():
+
+    state = np.random.RandomState(0)
+    for shape in SHAPES:
+        for mask_values in _random_masks(state, shape):
+            mask = DTMask(mask_values)
+            assert np.all(mask._intervals == _brute_force_intervals(mask_values)), "failed intervals test for %s" % (shape,)
+            assert mask._intervals.dtype == np.int32, "intervals must be int32"
+            # a 1D mask has a single row, as in DataTank
+            assert mask.dense().shape == _datatank_shape(shape) and np.all(mask.dense().reshape(shape) == mask_values), "failed dense test for %s" % (shape,)
+            assert np.all(mask.mask_array().reshape(shape) == mask_values.astype(np.uint8)), "failed mask_array test for %s" % (shape,)
+            assert mask.count() == np.sum(mask_values), "failed count test for %s" % (shape,)
+            assert np.all(np.unpackbits(mask.bitset())[:mask_values.size] == mask_values.reshape(-1)), "failed bitset test for %s" % (shape,)
+            assert np.all(mask.flat_index() == np.flatnonzero(mask_values)), "failed flat_index test for %s" % (shape,)
+            if len(shape) == 2:
+                for (start, stop) in ((0, shape[0]), (1, 3), (shape[0] - 1, shape[0] + 5), (3, 2)):
+                    assert np.all(mask.dense_rows(start, stop) == mask_values[start:stop]), "failed dense_rows test for %s" % (shape,)
+
+    # masks larger than a chunk are found a few rows at a time
+    chunk_cells = datatank_py.DTMask._CHUNK_CELLS
+    datatank_py.DTMask._CHUNK_CELLS = 64
+    try:
+        for shape in ((40, 30), (5, 6, 7), (200,)):
+            mask_values = state.random_sample(shape) > 0.5
+            assert np.all(DTMask(mask_values)._intervals == _brute_force_intervals(mask_values)), "failed chunked intervals test for %s" % (shape,)
+    finally:
+        datatank_py.DTMask._CHUNK_CELLS = chunk_cells
+
+def set_operations_test():
+
+    state = np.random.RandomState(1)
+    for shape in SHAPES:
+        masks = _random_masks(state, shape)
+        for a in masks:
+            mask_a = DTMask(a)
+            for result, expected in ((~mask_a, ~a), (mask_a.complement(), ~a), (mask_a.dilate(), _brute_force_dilate(a))):
+                assert np.all(result.dense().reshape(shape) == expected), "failed unary set operation test for %s" % (shape,)
+                assert np.all(result._intervals == _brute_force_intervals(expected)), "failed unary set operation intervals test for %s" % (shape,)
+            for b in masks:
+                mask_b = DTMask(b)
+                for result, expected in ((mask_a | mask_b, a | b), (mask_a & mask_b, a & b), (mask_a - mask_b, a & ~b)):
+                    assert np.all(result.dense().reshape(shape) == expected), "failed set operation test for %s" % (shape,)
+                    assert np.all(result._intervals == _brute_force_intervals(expected)), "failed set operation intervals test for %s" % (shape,)
+
+    try:
+        DTMask(np.ones((4, 5))) | DTMask(np.ones((5, 4)))
+        assert False, "masks of different shapes must not be combined"
+    except AssertionError as e:
+        assert "same shape" in str(e), "failed shape mismatch test"
+
+def reduction_test():
+
+    state = np.random.RandomState(2)
+    for shape in SHAPES:
+        values = state.random_sample(shape)
+        for mask_values in _random_masks(state, shape):
+            mask = DTMask(mask_values)
+            expected = [values.reshape(-1)[idx] for idx in range(values.size) if mask_values.reshape(-1)[idx]]
+            assert np.all(mask.gather(values) == expected), "failed gather test for %s" % (shape,)
+            assert np.allclose(mask.sum(values), sum(expected)), "failed sum test for %s" % (shape,)
+            scattered = mask.scatter(mask.gather(values), fill=-1)
+            assert scattered.shape == _datatank_shape(shape) and np.all(scattered.reshape(shape) == np.where(mask_values, values, -1)), "failed scatter test for %s" % (shape,)
+            if len(expected):
+                assert np.allclose(mask.mean(values), sum(expected) / len(expected)), "failed mean test for %s" % (shape,)
+                assert mask.min(values) == min(expected) and mask.max(values) == max(expected), "failed min or max test for %s" % (shape,)
+            else:
+                assert mask.sum(values) == 0, "failed empty sum test for %s" % (shape,)
+
+    # long intervals are reduced in place instead of gathered
+    mask_values = np.zeros((20, 100), dtype=bool)
+    mask_values[2:15, 10:90] = True
+    mask_values[7, 95:] = True
+    values = state.random_sample(mask_values.shape)
+    mask = DTMask(mask_values)
+    assert np.allclose(mask.sum(values), np.sum(values[mask_values])), "failed interval sum test"
+    assert mask.min(values) == np.min(values[mask_values]) and mask.max(values) == np.max(values[mask_values]), "failed interval min or max test"
+
+def from_condition_test():
+
+    state = np.random.RandomState(3)
+    for shape in SHAPES:
+        values = state.random_sample(shape)
+        flat = values.reshape(-1)
+        flat[state.random_sample(flat.size) > 0.8] = np.nan
+        flat[state.random_sample(flat.size) > 0.8] = -9999
+
+        expected = np.array([not np.isnan(x) and x != -9999 and x > 0.5 for x in flat], dtype=bool).reshape(shape)
+        with np.errstate(invalid="ignore"):
+            mask = DTMask.from_condition(values, nodata=-9999, predicate=lambda x: x > 0.5)
+        assert mask.dense().shape == _datatank_shape(shape) and np.all(mask._intervals == _brute_force_intervals(expected)), "failed from_condition test for %s" % (shape,)
+
+        expected = np.array([not np.isnan(x) for x in flat], dtype=bool).reshape(shape)
+        mask = DTMask.from_condition(values, nodata=np.nan)
+        assert np.all(mask._intervals == _brute_force_intervals(expected)), "failed NaN nodata test for %s" % (shape,)
+
+        integers = (values * 10).astype(np.int32)
+        expected = integers != 3
+        assert np.all(DTMask.from_condition(integers, nodata=3)._intervals == _brute_force_intervals(expected)), "failed integer from_condition test for %s" % (shape,)
+
+def file_test(file_path):
+
+    state = np.random.RandomState(4)
+    masks = [state.random_sample(shape) > 0.5 for shape in ((40, 30), (5, 6, 7), (50,))]
+    with DTDataFile(file_path, truncate=True) as output_file:
+        for idx, mask_values in enumerate(masks):
+            output_file.write_anonymous(DTMask(mask_values), "Mask %d" % (idx))
+
+    with DTDataFile(file_path, readonly=True) as input_file:
+        for idx, mask_values in enumerate(masks):
+            mask = DTMask.from_data_file(input_file, "Mask %d" % (idx))
+            assert np.all(mask._intervals == _brute_force_intervals(mask_values)), "failed mask file test"
+            assert mask.count() == np.sum(mask_values), "failed mask file count test"
+    os.remove(file_path)
+
+if __name__ == '__main__':
+
+    intervals_test()
+    set_operations_test()
+    reduction_test()
+    from_condition_test()
+    file_test("dtmask_test.dtbin")
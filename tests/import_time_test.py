@@ -0,0 +1,66 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# This software is under a BSD license.  See LICENSE.txt for details.
+
+# DataTank launches external programs for every evaluation, so importing
+# datatank_py has to stay cheap.  This needs Python 3.7 or later for
+# -X importtime.
+
+import os, sys
+import subprocess
+
+# microseconds allowed for importing datatank_py modules, after numpy
+IMPORT_BUDGET_US = 50000
+
+# optional dependencies that must only be imported when actually used
+DEFERRED_MODULES = ("osgeo", "PIL", "skimage", "objc", "Foundation", "AppKit", "Quartz")
+
+def import_time_us(module_names):
+    """Cumulative import time of the given modules, with numpy already imported"""
+
+    code = "import numpy\n" + "\n".join(["import " + name for name in module_names])
+    # run it once to compile, since that's not what we're measuring
+    env = dict(os.environ)
+    env.pop("PYTHONDONTWRITEBYTECODE", None)
+    subprocess.check_call([sys.executable, "-c", code], env=env)
+    output = subprocess.check_output([sys.executable, "-X", "importtime", "-c", code], stderr=subprocess.STDOUT, env=env)
+
+    total = 0
+    for line in output.decode("utf-8").splitlines():
+        if not line.startswith("import time:"):
+            continue
+        fields = line.split("|")
+        # top-level modules imported by the code are not indented
+        if fields[2].startswith(" datatank_py"):
+            total += int(fields[1])
+    return total
+
+def deferred_modules_imported(module_names):
+    """Optional dependencies that get imported along with the given modules"""
+
+    code = "import sys\n" + "\n".join(["import " + name for name in module_names])
+    code += "\nprint(' '.join([name for name in %r if name in sys.modules]))" % (DEFERRED_MODULES,)
+    output = subprocess.check_output([sys.executable, "-c", code])
+    return output.decode("utf-8").split()
+
+def import_time_test():
+
+    for module_names in (("datatank_py",), ("datatank_py.DTDataFile",), ("datatank_py.DTDataFile", "datatank_py.DTMesh2D", "datatank_py.DTMask")):
+        elapsed = import_time_us(module_names)
+        print("%s: %d us" % (", ".join(module_names), elapsed))
+        assert elapsed < IMPORT_BUDGET_US, "importing %s took %d us, budget is %d us" % (module_names, elapsed, IMPORT_BUDGET_US)
+
+def deferred_import_test():
+
+    for module_names in (("datatank_py",), ("datatank_py.DTDataFile",), ("datatank_py.DTBitmap2D",), ("datatank_py.DTPyCoreImage",)):
+        imported = deferred_modules_imported(module_names)
+        assert len(imported) == 0, "importing %s also imported %s" % (module_names, imported)
+
+if __name__ == '__main__':
+
+    if sys.version_info < (3, 7):
+        sys.stderr.write("import time test requires Python 3.7 or later\n")
+    else:
+        import_time_test()
+        deferred_import_test()
@@ -0,0 +1,192 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# This software is under a BSD license.  See LICENSE.txt for details.
+
+# Checks pyramids and palettes of meshes and bitmaps against brute-force
+# loops over each 2x2 block or pixel.  None of these need GDAL.
+
+from __future__ import with_statement
+import os
+import numpy as np
+from datatank_py.DTDataFile import DTDataFile
+import datatank_py.DTBitmap2D
+from datatank_py.DTMesh2D import DTMesh2D
+from datatank_py.DTMask import DTMask
+from datatank_py.DTBitmap2D import DTBitmap2D, _expand_palette
+from datatank_py.DTRaster import _DTPyramidLevels, _decimate, _decimate_masked
+
+def _brute_force_decimate(values, method, valid=None):
+    """:returns: decimated values and valid blocks, computed a block at a time"""
+
+    (rows, columns) = (values.shape[0] // 2, values.shape[1] // 2)
+    result = np.zeros((rows, columns), dtype=values.dtype)
+    result_valid = np.zeros((rows, columns), dtype=bool)
+    for row in range(rows):
+        for column in range(columns):
+            block = [values[2 * row + i, 2 * column + j] for (i, j) in ((0, 0), (0, 1), (1, 0), (1, 1))]
+            if valid is not None:
+                block = [x for (x, (i, j)) in zip(block, ((0, 0), (0, 1), (1, 0), (1, 1))) if valid[2 * row + i, 2 * column + j]]
+            if len(block) == 0:
+                continue
+            result_valid[row, column] = True
+            if method == "mode":
+                # most common, with ties going to the first value of the block
+                counts = [block.count(x) for x in block]
+                result[row, column] = block[counts.index(max(counts))]
+            elif values.dtype.kind == "f":
+                result[row, column] = sum([float(x) for x in block]) / len(block)
+            else:
+                result[row, column] = np.floor(sum([int(x) for x in block]) / float(len(block)) + 0.5)
+    return (result, result_valid)
+
+def pyramid_levels_test():
+
+    state = np.random.RandomState(0)
+    values = state.randint(0, 4, (37, 22)).astype(np.uint8)
+    for method in ("mean", "mode"):
+        # blocks with odd numbers of rows leave a row to carry to the next block
+        pyramid = _DTPyramidLevels(values.shape, values.dtype, method)
+        start = 0
+        for height in (3, 1, 5, 2, 7, 4, 15):
+            pyramid.add_rows(values[start:start + height])
+            start += height
+        assert start == len(values), "test blocks must cover the array"
+        (level, valid) = next(pyramid.levels(1))
+        assert valid is None and np.all(level == _brute_force_decimate(values, method)[0]), "failed %s pyramid level test" % (method)
+
+def decimate_test():
+
+    state = np.random.RandomState(3)
+    # odd rows and columns are dropped
+    for shape in ((2, 2), (7, 9), (12, 5), (1, 6)):
+        for values in (state.randint(0, 3, shape).astype(np.uint8), state.randint(-500, 500, shape).astype(np.int16), state.random_sample(shape).astype(np.float32)):
+            for method in ("mean", "mode"):
+                result = _decimate(values, method)
+                assert result.dtype == values.dtype, "failed %s decimate type test" % (method)
+                assert np.allclose(result, _brute_force_decimate(values, method)[0]), "failed %s decimate test for %s %s" % (method, values.dtype, shape)
+            valid = state.random_sample(shape) > 0.5
+            (result, result_valid) = _decimate_masked(values, valid)
+            (expected, expected_valid) = _brute_force_decimate(values, "mean", valid)
+            assert result.dtype == values.dtype and np.all(result_valid == expected_valid), "failed masked decimate test for %s %s" % (values.dtype, shape)
+            assert np.allclose(result[expected_valid], expected[expected_valid]), "failed masked decimate values test for %s %s" % (values.dtype, shape)
+
+    # the mean is rounded for integer values, with halves going up
+    assert np.all(_decimate(np.array([[1, 2], [2, 2]], dtype=np.int16), "mean") == 2), "failed rounded mean test"
+    assert np.all(_decimate(np.array([[-1, -2], [-2, -1]], dtype=np.int16), "mean") == -1), "failed rounded negative mean test"
+    # ties in the mode go to the first value of the block
+    assert np.all(_decimate(np.array([[3, 1], [1, 3]], dtype=np.uint8), "mode") == 3), "failed mode tie test"
+    assert np.all(_decimate(np.array([[3, 1], [2, 4]], dtype=np.uint8), "mode") == 3), "failed mode tie test"
+    try:
+        _decimate(np.zeros((2, 2)), "median")
+        assert False, "failed unknown method test"
+    except AssertionError as e:
+        assert "unknown decimation method" in str(e), "failed unknown method test"
+
+def expand_palette_test():
+
+    state = np.random.RandomState(4)
+    opaque = [tuple(state.randint(0, 256, 3)) + (255,) for idx in range(20)]
+    translucent = opaque[:-1] + [(10, 20, 30, 128)]
+
+    # a few rows at a time, so the last block is short
+    block_pixels = datatank_py.DTBitmap2D._PALETTE_BLOCK_PIXELS
+    datatank_py.DTBitmap2D._PALETTE_BLOCK_PIXELS = 50
+    try:
+        # GDAL returns uint8 indexes for most paletted images, but wider types
+        # can have indexes outside the color table, which are black
+        for indexes in (state.randint(0, 256, (23, 11)).astype(np.uint8), state.randint(-5, 30, (23, 11)).astype(np.int16)):
+            for color_entries in (opaque, translucent):
+                channels = _expand_palette(indexes, color_entries)
+                expected_names = ["red", "green", "blue"] if color_entries is opaque else ["red", "green", "blue", "alpha"]
+                assert sorted(channels.keys()) == sorted(expected_names), "failed palette channel names test"
+                for channel_index, name in enumerate(expected_names):
+                    expected = [color_entries[x][channel_index] if 0 <= x < len(color_entries) else 0 for x in indexes.reshape(-1)]
+                    assert channels[name].dtype == np.uint8, "failed palette type test"
+                    assert np.all(channels[name].reshape(-1) == expected), "failed palette %s test for %s indexes" % (name, indexes.dtype)
+                # a subset of the channels is the same as expanding all of them
+                subset = _expand_palette(indexes, color_entries, names=["blue", "alpha"])
+                assert sorted(subset.keys()) == sorted([x for x in ("blue", "alpha") if x in expected_names]), "failed palette subset names test"
+                for name in subset:
+                    assert np.all(subset[name] == channels[name]), "failed palette subset test for %s" % (name)
+    finally:
+        datatank_py.DTBitmap2D._PALETTE_BLOCK_PIXELS = block_pixels
+
+def masked_mesh_pyramid_test(file_path):
+
+    state = np.random.RandomState(1)
+    values = state.random_sample((45, 34))
+    valid = state.random_sample(values.shape) > 0.4
+    # a block with nothing valid
+    valid[0:2, 0:2] = False
+    with DTDataFile(file_path, truncate=True) as output_file:
+        names = DTMesh2D(values, grid=(0, 0, 1, 1), mask=DTMask(valid)).write_pyramid(output_file, "Masked", levels=3)
+
+    (level_values, level_valid) = (values, valid)
+    with DTDataFile(file_path, readonly=True) as input_file:
+        for name in names[1:]:
+            (level_values, level_valid) = _brute_force_decimate(level_values, "mean", level_valid)
+            mask = DTMask.from_data_file(input_file, name + "_dom")
+            assert np.all(mask.dense() == level_valid), "failed masked pyramid mask test for %s" % (name)
+            assert np.allclose(np.squeeze(input_file[name])[level_valid], level_values[level_valid]), "failed masked pyramid values test for %s" % (name)
+        assert not DTMask.from_data_file(input_file, "Masked_L1_dom").dense()[0, 0], "failed empty block test"
+
+    # a mesh read from a file has its mask as an array of ones and zeroes
+    with DTDataFile(file_path, truncate=True) as output_file:
+        output_file.write(DTMesh2D(values, grid=(0, 0, 1, 1), mask=DTMask(valid)), "Masked")
+    with DTDataFile(file_path) as data_file:
+        mesh = DTMesh2D.from_data_file(data_file, "Masked")
+        assert not isinstance(mesh.mask(), DTMask) and np.all((mesh.mask() != 0) == valid), "failed mesh file mask test"
+        names = mesh.write_pyramid(data_file, "Copy", levels=3)
+    (level_values, level_valid) = (values, valid)
+    with DTDataFile(file_path, readonly=True) as input_file:
+        for name in names:
+            if name != names[0]:
+                (level_values, level_valid) = _brute_force_decimate(level_values, "mean", level_valid)
+            mask = DTMask.from_data_file(input_file, name + "_dom")
+            assert np.all(mask.dense() == level_valid), "failed mesh file pyramid mask test for %s" % (name)
+            assert np.allclose(np.squeeze(input_file[name])[level_valid], level_values[level_valid]), "failed mesh file pyramid values test for %s" % (name)
+
+    # a mesh can only be decimated until it's a single row or column
+    with DTDataFile(file_path, truncate=True) as output_file:
+        try:
+            DTMesh2D(values[:5], grid=(0, 0, 1, 1)).write_pyramid(output_file, "Short", levels=4)
+            assert False, "failed pyramid level count test"
+        except AssertionError as e:
+            assert "4 levels requested" in str(e), "failed pyramid level count test"
+        assert DTMesh2D(values[:5], grid=(0, 0, 1, 1)).write_pyramid(output_file, "Short", levels=3)[-1] == "Short_L2", "failed pyramid level count test"
+    os.remove(file_path)
+
+def bitmap_pyramid_test(file_path):
+
+    state = np.random.RandomState(2)
+    bitmap = DTBitmap2D()
+    bitmap.grid = (10, 20, 2, 3)
+    bitmap.red = state.randint(0, 256, (37, 22)).astype(np.uint8)
+    bitmap.green = state.randint(0, 4, bitmap.red.shape).astype(np.uint8)
+
+    for method in ("mean", "mode"):
+        with DTDataFile(file_path, truncate=True) as output_file:
+            names = bitmap.write_pyramid(output_file, "Image", levels=3, method=method)
+        assert names == ["Image_L0", "Image_L1", "Image_L2"], "failed bitmap pyramid names test"
+
+        with DTDataFile(file_path, readonly=True) as input_file:
+            for channel_name in ("red", "green"):
+                values = getattr(bitmap, channel_name)
+                for index, name in enumerate(names):
+                    if index > 0:
+                        values = _brute_force_decimate(values, method)[0]
+                    # DataTank images are signed, so these are written as int8
+                    level = np.squeeze(input_file["%s_%s" % (name, channel_name.capitalize())]).view(np.uint8)
+                    assert np.all(level == values), "failed %s bitmap pyramid test for %s %s" % (method, name, channel_name)
+            # bitmap grids start at the corner of the image, which stays put
+            assert np.all(np.squeeze(input_file["Image_L2"]) == (10, 20, 8, 12)), "failed bitmap pyramid grid test"
+    os.remove(file_path)
+
+if __name__ == '__main__':
+
+    pyramid_levels_test()
+    decimate_test()
+    expand_palette_test()
+    masked_mesh_pyramid_test("raster_pyramid.dtbin")
+    bitmap_pyramid_test("raster_bitmap.dtbin")